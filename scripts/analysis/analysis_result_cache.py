@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+骆言项目分析结果缓存
+以 (分析器, 调用方传入的文件路径) 为键，把逐文件分析结果连同文件内容哈希和分析器版本保存在
+_analysis_cache/ 下的 SQLite 数据库中。内容哈希和版本都一致时直接返回保存的结果，
+只有内容变化的文件（或分析器升级后）才重新计算；不依赖 mtime，CI 全新检出时同样命中。
+"""
+
+import os
+import sys
+import atexit
+import pickle
+import sqlite3
+import hashlib
+import functools
+from typing import Any, Callable, Dict, Optional
+
+from ocaml_source_index import DEFAULT_CACHE_DIR, cache_dir_for, read_source
+
+RESULT_CACHE_FILE = "analysis_results.sqlite3"
+
+# 结果库格式版本（键的含义变化时递增，旧库中的结果整体丢弃）
+RESULT_CACHE_SCHEMA = 2
+
+# 每累计多少次写入提交一次事务
+COMMIT_INTERVAL = 200
+
+_MISSING = object()
+
+
+class AnalysisResultCache:
+    """SQLite 结果库"""
+
+    def __init__(self, cache_dir: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_file = os.path.join(cache_dir, RESULT_CACHE_FILE)
+        self.connection = sqlite3.connect(self.db_file)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != RESULT_CACHE_SCHEMA:
+            self.connection.execute("DROP TABLE IF EXISTS results")
+            self.connection.execute(f"PRAGMA user_version={RESULT_CACHE_SCHEMA}")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " analyzer TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " result BLOB NOT NULL,"
+            " PRIMARY KEY (analyzer, path))"
+        )
+        self.pending = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, analyzer: str, version: int, path: str, content_hash: str) -> Any:
+        """命中时返回保存的结果，否则返回 _MISSING"""
+        row = self.connection.execute(
+            "SELECT version, content_hash, result FROM results WHERE analyzer = ? AND path = ?",
+            (analyzer, path)
+        ).fetchone()
+        if row is None or row[0] != version or row[1] != content_hash:
+            self.misses += 1
+            return _MISSING
+        self.hits += 1
+        return pickle.loads(row[2])
+
+    def put(self, analyzer: str, version: int, path: str, content_hash: str, result: Any) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results (analyzer, path, version, content_hash, result)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (analyzer, path, version, content_hash,
+             pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        )
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self) -> None:
+        if self.pending:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self) -> None:
+        try:
+            self.commit()
+            self.connection.close()
+        except sqlite3.Error as e:
+            print(f"无法写入分析结果缓存 {self.db_file}: {e}")
+
+
+_caches: Dict[str, AnalysisResultCache] = {}
+
+
+def open_result_cache(cache_dir: str) -> Optional[AnalysisResultCache]:
+    """获取（并在本进程内复用）缓存目录对应的结果库，无法打开时返回 None"""
+    cache = _caches.get(cache_dir, _MISSING)
+    if cache is _MISSING:
+        try:
+            cache = AnalysisResultCache(cache_dir)
+            atexit.register(cache.close)
+        except (OSError, sqlite3.Error) as e:
+            print(f"无法打开分析结果缓存 {cache_dir}: {e}")
+            cache = None
+        _caches[cache_dir] = cache
+    return cache
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def cached_analysis(analyzer: str, version: int) -> Callable:
+    """装饰器：缓存形如 func(file_path) 的逐文件分析函数的结果
+
+    分析逻辑变化时递增 version 即可使旧结果失效。
+    被装饰函数的原始版本保存在 uncached 属性中。
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(file_path: str):
+            try:
+                source = read_source(file_path)
+            except Exception:
+                return func(file_path)  # 由分析函数自行报告读取错误
+            cache = open_result_cache(cache_dir_for(file_path))
+            if cache is None:
+                return func(file_path)
+
+            # 分析结果中含有调用方传入的路径字符串，因此按原样的路径字符串区分缓存项
+            path = str(file_path)
+            digest = content_hash(source.text)
+            result = cache.get(analyzer, version, path, digest)
+            if result is _MISSING:
+                result = func(file_path)
+                cache.put(analyzer, version, path, digest, result)
+            return result
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def main():
+    cache_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CACHE_DIR
+    cache = AnalysisResultCache(cache_dir)
+    print(f"结果缓存: {cache.db_file}")
+    for analyzer, version, count in cache.connection.execute(
+            "SELECT analyzer, version, COUNT(*) FROM results GROUP BY analyzer, version ORDER BY analyzer"):
+        print(f"- {analyzer} (版本 {version}): {count} 个文件")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
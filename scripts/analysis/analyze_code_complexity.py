@@ -5,9 +5,11 @@
 
 import os
 import re
-import glob
 from typing import List, Dict, Tuple
 
+from ocaml_source_index import load_source_index, read_source
+from analysis_result_cache import cached_analysis
+
 def is_data_definition(lines: List[str]) -> bool:
     """判断是否为纯数据定义"""
     content = ''.join(lines)
@@ -118,100 +120,107 @@ def analyze_function_complexity(func_lines: List[str]) -> Dict:
     
     return complexity
 
-def find_complex_functions(src_dir: str) -> List[Dict]:
-    """查找复杂函数（排除数据定义）"""
+@cached_analysis('complex_functions', version=1)
+def find_complex_functions_in_file(file_path: str) -> List[Dict]:
+    """查找单个文件中的复杂函数（排除数据定义）"""
     complex_functions = []
     
-    ml_files = glob.glob(os.path.join(src_dir, "**/*.ml"), recursive=True)
+    try:
+        lines = read_source(file_path).raw_lines
+    except:
+        return complex_functions
     
-    for file_path in ml_files:
-        if '/test/' in file_path or 'test_' in os.path.basename(file_path):
-            continue
-            
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-        except:
-            continue
+    current_function = None
+    
+    for line_num, line in enumerate(lines, 1):
+        stripped = line.strip()
         
-        current_function = None
+        # 检测函数定义
+        let_match = re.match(r'^let\s+(rec\s+)?([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
+        and_match = re.match(r'^and\s+([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
         
-        for line_num, line in enumerate(lines, 1):
-            stripped = line.strip()
-            
-            # 检测函数定义
-            let_match = re.match(r'^let\s+(rec\s+)?([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
-            and_match = re.match(r'^and\s+([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
+        if let_match or and_match:
+            # 保存前一个函数
+            if current_function and len(current_function['lines']) > 50:  # 降低行数阈值
+                complexity = analyze_function_complexity(current_function['lines'])
+                
+                if not complexity['is_data_definition']:
+                    current_function['complexity'] = complexity
+                    current_function['line_count'] = len(current_function['lines'])
+                    
+                    # 基于复杂度判断是否需要重构
+                    if (current_function['line_count'] > 100 or 
+                        complexity['cyclomatic_complexity'] > 10 or
+                        complexity['max_nesting'] > 5):
+                        complex_functions.append(current_function)
             
-            if let_match or and_match:
-                # 保存前一个函数
-                if current_function and len(current_function['lines']) > 50:  # 降低行数阈值
+            # 开始新函数
+            func_name = let_match.group(2) if let_match else and_match.group(1)
+            current_function = {
+                'name': func_name,
+                'start_line': line_num,
+                'lines': [line],
+                'file': file_path
+            }
+        elif current_function:
+            if (stripped.startswith('let ') or stripped.startswith('and ') or 
+                stripped.startswith('type ') or stripped.startswith('module ') or 
+                stripped.startswith('exception ')):
+                # 函数结束
+                if len(current_function['lines']) > 50:
                     complexity = analyze_function_complexity(current_function['lines'])
                     
                     if not complexity['is_data_definition']:
                         current_function['complexity'] = complexity
                         current_function['line_count'] = len(current_function['lines'])
                         
-                        # 基于复杂度判断是否需要重构
                         if (current_function['line_count'] > 100 or 
                             complexity['cyclomatic_complexity'] > 10 or
                             complexity['max_nesting'] > 5):
                             complex_functions.append(current_function)
                 
-                # 开始新函数
-                func_name = let_match.group(2) if let_match else and_match.group(1)
-                current_function = {
-                    'name': func_name,
-                    'start_line': line_num,
-                    'lines': [line],
-                    'file': file_path
-                }
-            elif current_function:
-                if (stripped.startswith('let ') or stripped.startswith('and ') or 
-                    stripped.startswith('type ') or stripped.startswith('module ') or 
-                    stripped.startswith('exception ')):
-                    # 函数结束
-                    if len(current_function['lines']) > 50:
-                        complexity = analyze_function_complexity(current_function['lines'])
-                        
-                        if not complexity['is_data_definition']:
-                            current_function['complexity'] = complexity
-                            current_function['line_count'] = len(current_function['lines'])
-                            
-                            if (current_function['line_count'] > 100 or 
-                                complexity['cyclomatic_complexity'] > 10 or
-                                complexity['max_nesting'] > 5):
-                                complex_functions.append(current_function)
-                    
-                    # 检查新的函数定义
-                    let_match = re.match(r'^let\s+(rec\s+)?([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
-                    and_match = re.match(r'^and\s+([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
-                    
-                    if let_match or and_match:
-                        func_name = let_match.group(2) if let_match else and_match.group(1)
-                        current_function = {
-                            'name': func_name,
-                            'start_line': line_num,
-                            'lines': [line],
-                            'file': file_path
-                        }
-                    else:
-                        current_function = None
+                # 检查新的函数定义
+                let_match = re.match(r'^let\s+(rec\s+)?([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
+                and_match = re.match(r'^and\s+([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
+                
+                if let_match or and_match:
+                    func_name = let_match.group(2) if let_match else and_match.group(1)
+                    current_function = {
+                        'name': func_name,
+                        'start_line': line_num,
+                        'lines': [line],
+                        'file': file_path
+                    }
                 else:
-                    current_function['lines'].append(line)
+                    current_function = None
+            else:
+                current_function['lines'].append(line)
+    
+    # 处理文件末尾的函数
+    if current_function and len(current_function['lines']) > 50:
+        complexity = analyze_function_complexity(current_function['lines'])
         
-        # 处理文件末尾的函数
-        if current_function and len(current_function['lines']) > 50:
-            complexity = analyze_function_complexity(current_function['lines'])
+        if not complexity['is_data_definition']:
+            current_function['complexity'] = complexity
+            current_function['line_count'] = len(current_function['lines'])
             
-            if not complexity['is_data_definition']:
-                current_function['complexity'] = complexity
-                current_function['line_count'] = len(current_function['lines'])
-                
-                if (current_function['line_count'] > 100 or 
-                    complexity['cyclomatic_complexity'] > 10 or
-                    complexity['max_nesting'] > 5):
-                    complex_functions.append(current_function)
+            if (current_function['line_count'] > 100 or 
+                complexity['cyclomatic_complexity'] > 10 or
+                complexity['max_nesting'] > 5):
+                complex_functions.append(current_function)
+
+    return complex_functions
+
+def find_complex_functions(src_dir: str) -> List[Dict]:
+    """查找复杂函数（排除数据定义）"""
+    complex_functions = []
+    
+    ml_files = load_source_index(src_dir).paths()
+    
+    for file_path in ml_files:
+        if '/test/' in file_path or 'test_' in os.path.basename(file_path):
+            continue
+        complex_functions.extend(find_complex_functions_in_file(file_path))
     
     return sorted(complex_functions, key=lambda x: x['complexity']['cyclomatic_complexity'], reverse=True)
 
@@ -6,22 +6,243 @@
 
 import os
 import re
+import bisect
+import pickle
+import subprocess
 import hashlib
+import argparse
+import multiprocessing
+from array import array
 from collections import defaultdict, Counter
 from dataclasses import dataclass
-from typing import List, Dict, Set, Tuple
+from typing import List, Dict, Set, Tuple, Optional
+import sys
 import json
+import zlib
 import difflib
 
+from ocaml_source_index import (
+    DEFAULT_CACHE_DIR, SourceFile, load_source_index, read_source, scan_source
+)
+from jsonl_report_writer import JsonlReportWriter, jsonl_path
+
+IDENTIFIER_PATTERN = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')
+STRING_PATTERN = re.compile(r'"[^"]*"')
+NUMBER_PATTERN = re.compile(r'\b\d+\b')
+
+# Rabin–Karp 滚动哈希参数（模数为梅森素数 2^61-1）
+ROLLING_HASH_BASE = 1000003
+ROLLING_HASH_MOD = (1 << 61) - 1
+
+# 参与相似度分析的窗口标准化内容的最短长度
+MIN_SIMILAR_CONTENT = 50
+
+# 相似候选验证时每个进程池任务包含的查询块数
+SIMILARITY_CHUNK_SIZE = 1024
+
+# 基线快照格式版本，标准化或指纹规则变化时递增
+BASELINE_VERSION = 1
+
+HUNK_PATTERN = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+
+def normalize_line(line: str) -> str:
+    """标准化单行代码（调用方负责去除注释和首尾空白）"""
+    line = IDENTIFIER_PATTERN.sub('VAR', line)
+    line = STRING_PATTERN.sub('STRING', line)
+    return NUMBER_PATTERN.sub('NUM', line)
+
+
+@dataclass
+class NormalizedFile:
+    """按行标准化后的文件：只保留非空行及其原始行号，每行只标准化一次"""
+    file_path: str
+    total_lines: int
+    line_numbers: List[int]
+    lines: List[str]
+    line_hashes: List[int]
+
+    def window(self, start_line: int, end_line: int) -> str:
+        """还原原始行区间 [start_line, end_line] 的标准化内容"""
+        lo = bisect.bisect_left(self.line_numbers, start_line)
+        hi = bisect.bisect_right(self.line_numbers, end_line)
+        return '\n'.join(self.lines[lo:hi])
+
+
+_normalized_files: Dict[str, NormalizedFile] = {}
+
+
+def get_normalized_file(file_path: str) -> NormalizedFile:
+    """获取（并缓存）文件的逐行标准化结果"""
+    normalized_file = _normalized_files.get(file_path)
+    if normalized_file is None:
+        normalized_file = normalize_source(file_path, read_source(file_path))
+        _normalized_files[file_path] = normalized_file
+    return normalized_file
+
+
+def normalize_source(file_path: str, source: SourceFile) -> NormalizedFile:
+    """对一份已扫描的源码做逐行标准化（不写入缓存）"""
+    total_lines = len(source.lines) - (1 if source.lines[-1] == '' else 0)
+    line_cache: Dict[str, Tuple[str, int]] = {}
+    line_numbers, lines, line_hashes = [], [], []
+
+    # code_lines 中注释和字符串内容已被空白替换，跨行注释同样被正确去除
+    for number, code_line in enumerate(source.code_lines[:total_lines], 1):
+        stripped = code_line.strip()
+        if not stripped:
+            continue
+        cached = line_cache.get(stripped)
+        if cached is None:
+            normalized = normalize_line(stripped)
+            cached = (normalized, zlib.crc32(normalized.encode()) + 1)
+            line_cache[stripped] = cached
+        line_numbers.append(number)
+        lines.append(cached[0])
+        line_hashes.append(cached[1])
+
+    return NormalizedFile(file_path, total_lines, line_numbers, lines, line_hashes)
+
+
+def rolling_window_hashes(normalized_file: NormalizedFile, size: int) -> Tuple[array, array]:
+    """用滚动哈希计算文件中所有非空窗口的指纹
+
+    窗口在原始行上滑动，窗口哈希是窗口内非空行哈希的 Rabin–Karp 多项式，
+    窗口移动时只需移出首行、移入尾行。返回紧凑的 (起始行数组, 哈希数组)。
+    """
+    numbers = normalized_file.line_numbers
+    hashes = normalized_file.line_hashes
+    powers = [1]
+    for _ in range(size):
+        powers.append(powers[-1] * ROLLING_HASH_BASE % ROLLING_HASH_MOD)
+
+    start_lines = array('I')
+    window_hashes = array('Q')
+    window_hash = 0
+    head = tail = 0
+    for start_line in range(1, normalized_file.total_lines - size + 2):
+        end_line = start_line + size - 1
+        while tail < len(numbers) and numbers[tail] <= end_line:
+            window_hash = (window_hash * ROLLING_HASH_BASE + hashes[tail]) % ROLLING_HASH_MOD
+            tail += 1
+        while head < tail and numbers[head] < start_line:
+            window_hash = (window_hash - hashes[head] * powers[tail - head - 1]) % ROLLING_HASH_MOD
+            head += 1
+
+        if head < tail:  # 只考虑非空代码块
+            start_lines.append(start_line)
+            window_hashes.append(window_hash)
+
+    return start_lines, window_hashes
+
+
+def run_git(cwd: str, *args: str) -> str:
+    """在指定目录执行git命令并返回标准输出"""
+    return subprocess.run(['git', *args], cwd=cwd, capture_output=True,
+                          text=True, check=True).stdout
+
+
+def read_revision_files(root: str, commit: str, suffix: str = '.ml') -> Dict[str, str]:
+    """用一次 git cat-file --batch 读取某个提交中 root 下所有源文件的内容
+
+    返回的路径与 load_source_index(root).paths() 的形式一致。
+    """
+    names = [name for name in run_git(root, 'ls-tree', '-r', '--name-only', commit, '--').splitlines()
+             if name.endswith(suffix)]
+    requests = ''.join(f"{commit}:./{name}\n" for name in names).encode()
+    output = subprocess.run(['git', 'cat-file', '--batch'], cwd=root, input=requests,
+                            capture_output=True, check=True).stdout
+
+    contents = {}
+    pos = 0
+    for name in names:
+        header_end = output.index(b'\n', pos)
+        size = int(output[pos:header_end].split()[2])
+        body_start = header_end + 1
+        contents[os.path.join(root, name)] = output[body_start:body_start + size].decode('utf-8', errors='replace')
+        pos = body_start + size + 1
+    return contents
+
+
+def changed_line_ranges(root: str, commit: str, suffix: str = '.ml') -> Dict[str, List[Tuple[int, int]]]:
+    """对比基线提交与工作区，返回每个变更文件中新增/修改的行区间（闭区间）
+
+    未跟踪的新文件整体视为变更；纯删除的位置标记其后一行，以便捕获删除后拼接出的重复。
+    """
+    diff = run_git(root, 'diff', '--relative', '--no-renames', '--no-color', '--no-ext-diff',
+                   '-U0', commit, '--', '.')
+    ranges: Dict[str, List[Tuple[int, int]]] = {}
+    current = None
+    for line in diff.splitlines():
+        if line.startswith('+++ '):
+            name = line[4:]
+            current = None
+            if name != '/dev/null' and name.endswith(suffix):
+                current = os.path.join(root, name[2:])
+                ranges[current] = []
+        elif current is not None and line.startswith('@@'):
+            match = HUNK_PATTERN.match(line)
+            if not match:
+                continue
+            start = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            if count == 0:
+                ranges[current].append((max(start, 1), start + 1))
+            else:
+                ranges[current].append((start, start + count - 1))
+
+    for name in run_git(root, 'ls-files', '--others', '--exclude-standard', '--', '.').splitlines():
+        if name.endswith(suffix):
+            ranges[os.path.join(root, name)] = [(1, sys.maxsize)]
+    return ranges
+
+
+def touches_ranges(block: 'CodeBlock', ranges: List[Tuple[int, int]]) -> bool:
+    """代码块是否与任一变更行区间相交"""
+    return any(start <= block.end_line and block.start_line <= end for start, end in ranges)
+
+
+@dataclass
+class DuplicationBaseline:
+    """基线提交的指纹快照
+
+    保存每个文件的窗口哈希和全部候选块的winnowing指纹索引，
+    增量检查时只需对变更文件重新计算指纹。
+    """
+    commit: str
+    block_size: int
+    files: List[str]
+    windows: List[Tuple[array, array]]
+    index: 'FingerprintIndex'
+    indexed_files: array  # 指纹索引编号 -> 文件序号
+    indexed_lines: array  # 指纹索引编号 -> 起始行
+
+
 @dataclass
 class CodeBlock:
-    """代码块信息"""
+    """代码块信息
+
+    滚动哈希模式下只保存文件、位置和哈希，content/normalized_content 在需要时才还原。
+    """
     file_path: str
     start_line: int
     end_line: int
-    content: str
     hash_value: str
-    normalized_content: str
+    text: Optional[str] = None
+    normalized: Optional[str] = None
+
+    @property
+    def content(self) -> str:
+        if self.text is None:
+            lines = read_source(self.file_path).lines[self.start_line - 1:self.end_line]
+            return '\n'.join(lines) + '\n'
+        return self.text
+
+    @property
+    def normalized_content(self) -> str:
+        if self.normalized is None:
+            return get_normalized_file(self.file_path).window(self.start_line, self.end_line)
+        return self.normalized
 
 @dataclass
 class DuplicationResult:
@@ -31,16 +252,213 @@ class DuplicationResult:
     pattern_type: str
     refactor_suggestion: str
 
+class FingerprintIndex:
+    """基于k-gram winnowing的指纹倒排索引
+
+    每个代码块的标准化内容被切分为记号，对连续k个记号求哈希，
+    再在大小为w的窗口中取最小哈希作为指纹。共享指纹的代码块才会成为候选对，
+    从而避免对所有代码块两两比较。
+    """
+
+    TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+    def __init__(self, kgram_size: int = 5, window_size: int = 4,
+                 max_posting_size: int = 200):
+        self.kgram_size = kgram_size
+        self.window_size = window_size
+        self.max_posting_size = max_posting_size  # 过于常见的指纹不参与候选生成
+        self.postings: Dict[int, List[int]] = defaultdict(list)
+        self.fingerprints: List[Set[int]] = []
+        self._cache: Dict[str, Set[int]] = {}
+
+    def fingerprint(self, normalized: str) -> Set[int]:
+        """计算标准化内容的winnowing指纹集合"""
+        cached = self._cache.get(normalized)
+        if cached is not None:
+            return cached
+
+        tokens = self.TOKEN_PATTERN.findall(normalized)
+        k = self.kgram_size
+        if len(tokens) <= k:
+            hashes = [zlib.crc32(' '.join(tokens).encode())] if tokens else []
+        else:
+            hashes = [zlib.crc32(' '.join(tokens[i:i + k]).encode())
+                      for i in range(len(tokens) - k + 1)]
+
+        w = self.window_size
+        if len(hashes) <= w:
+            selected = {min(hashes)} if hashes else set()
+        else:
+            selected = set()
+            for i in range(len(hashes) - w + 1):
+                window = hashes[i:i + w]
+                selected.add(min(window))
+
+        self._cache[normalized] = selected
+        return selected
+
+    def add(self, normalized: str) -> int:
+        """加入一个代码块，返回其编号"""
+        return self.add_fingerprints(self.fingerprint(normalized))
+
+    def add_fingerprints(self, fingerprints: Set[int]) -> int:
+        """加入一个已计算指纹的代码块，返回其编号"""
+        block_id = len(self.fingerprints)
+        self.fingerprints.append(fingerprints)
+        for fp in fingerprints:
+            self.postings[fp].append(block_id)
+        return block_id
+
+    def is_candidate(self, block_id: int, other: int, min_shared: int = 2,
+                     min_overlap: float = 0.5) -> bool:
+        """other 是否在 candidates(block_id) 的结果中（逐对判断，不遍历倒排表）"""
+        if other == block_id:
+            return False
+        count = sum(1 for fp in self.fingerprints[block_id] & self.fingerprints[other]
+                    if len(self.postings[fp]) <= self.max_posting_size)
+        return (count >= min_shared and
+                count >= min_overlap * min(len(self.fingerprints[block_id]),
+                                           len(self.fingerprints[other])))
+
+    def candidates(self, block_id: int, min_shared: int = 2,
+                   min_overlap: float = 0.5) -> List[int]:
+        """返回与指定代码块共享足够多指纹的候选块编号
+
+        共享指纹数需不少于 min_shared，且不低于两者中较小指纹集合的 min_overlap 比例。
+        """
+        shared = Counter()
+        for fp in self.fingerprints[block_id]:
+            posting = self.postings[fp]
+            if len(posting) > self.max_posting_size:
+                continue
+            shared.update(posting)
+        del shared[block_id]
+
+        size = len(self.fingerprints[block_id])
+        return sorted(
+            other for other, count in shared.items()
+            if count >= min_shared and
+            count >= min_overlap * min(size, len(self.fingerprints[other]))
+        )
+
+
+@dataclass
+class FileWindows:
+    """单个文件的紧凑窗口指纹：工作进程只返回这些数组，不返回标准化结果或代码块
+
+    indexed 为参与相似度分析的窗口在 start_lines 中的下标，
+    其winnowing指纹依次存放在 fingerprints[fingerprint_offsets[i]:fingerprint_offsets[i + 1]]。
+    """
+    file_path: str
+    start_lines: array
+    window_hashes: array
+    indexed: array
+    fingerprint_offsets: array
+    fingerprints: array
+
+
+def extract_file_windows(file_path: str, size: int, fingerprinter: FingerprintIndex) -> FileWindows:
+    """计算单个文件的窗口哈希及可参与相似度分析的窗口指纹"""
+    normalized_file = get_normalized_file(file_path)
+    start_lines, window_hashes = rolling_window_hashes(normalized_file, size)
+    indexed = array('I')
+    fingerprint_offsets = array('I', [0])
+    fingerprints = array('I')
+    for position, start_line in enumerate(start_lines):
+        normalized = normalized_file.window(start_line, start_line + size - 1)
+        if len(normalized) < MIN_SIMILAR_CONTENT:  # 跳过太短的块
+            continue
+        indexed.append(position)
+        fingerprints.extend(sorted(fingerprinter.fingerprint(normalized)))
+        fingerprint_offsets.append(len(fingerprints))
+    return FileWindows(file_path, start_lines, window_hashes, indexed, fingerprint_offsets, fingerprints)
+
+
+_worker_fingerprinter: Optional[FingerprintIndex] = None
+
+
+def extract_file_windows_task(task: Tuple[str, int]) -> Optional[FileWindows]:
+    """进程池任务：提取单个文件的紧凑窗口指纹"""
+    global _worker_fingerprinter
+    file_path, size = task
+    if _worker_fingerprinter is None:
+        _worker_fingerprinter = FingerprintIndex()
+    try:
+        windows = extract_file_windows(file_path, size, _worker_fingerprinter)
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+    _normalized_files.pop(file_path, None)  # 工作进程不需要保留标准化结果
+    return windows
+
+
+@dataclass
+class SimilarityTables:
+    """相似度分析的紧凑表：指纹索引编号 -> (文件序号, 起始行, 窗口哈希)
+
+    代码块只在报告时按编号构造；标准化内容按需从（进程内缓存的）逐行标准化结果还原。
+    """
+    files: List[str]
+    block_size: int
+    index: FingerprintIndex
+    indexed_files: array
+    indexed_lines: array
+    indexed_hashes: array
+
+    def normalized_content(self, block_id: int) -> str:
+        start_line = self.indexed_lines[block_id]
+        normalized_file = get_normalized_file(self.files[self.indexed_files[block_id]])
+        return normalized_file.window(start_line, start_line + self.block_size - 1)
+
+    def block(self, block_id: int) -> 'CodeBlock':
+        start_line = self.indexed_lines[block_id]
+        return CodeBlock(self.files[self.indexed_files[block_id]], start_line,
+                         start_line + self.block_size - 1,
+                         format(self.indexed_hashes[block_id], '016x'))
+
+
+_similarity_worker: Optional[Tuple['CodeDuplicationAnalyzer', SimilarityTables]] = None
+
+
+def _init_similarity_worker(analyzer: 'CodeDuplicationAnalyzer', tables: SimilarityTables) -> None:
+    global _similarity_worker
+    _similarity_worker = (analyzer, tables)
+
+
+def verify_similarity_chunk(block_ids: range) -> List[Tuple[int, Optional[List[Tuple[int, float]]]]]:
+    """进程池任务：按编号顺序验证一段查询块，返回各块达到相似度阈值的候选
+
+    段内按串行算法推测归组：已被本段归组的块不再作为查询（返回 None）或候选。
+    父进程据此复核，推测与实际归组不一致时自行重新计算。
+    """
+    analyzer, tables = _similarity_worker
+    local_processed: Set[int] = set()
+    results = []
+    for block_id in block_ids:
+        if block_id in local_processed:
+            results.append((block_id, None))
+            continue
+        matches = analyzer.similar_candidates(tables, block_id, local_processed)
+        if matches:
+            local_processed.update(other for other, _ in matches)
+            local_processed.add(block_id)
+        results.append((block_id, matches))
+    return results
+
+
 class CodeDuplicationAnalyzer:
     """代码重复分析器"""
     
-    def __init__(self, project_root: str):
+    def __init__(self, project_root: str, jobs: int = 1):
         self.project_root = project_root
+        self.jobs = jobs  # 提取窗口指纹和验证相似候选的并行进程数
         self.min_block_size = 10  # 增加最小代码块行数，减少分析量
         self.similarity_threshold = 0.85  # 提高相似度阈值
         self.exact_duplicates = []
         self.similar_blocks = []
-        self.max_files = 50  # 限制分析文件数量
+        self.min_shared_fingerprints = 2  # 候选对至少共享的指纹数
+        self.min_fingerprint_overlap = 0.5  # 候选对共享指纹占较小指纹集合的最低比例
+        self.use_rolling_hash = True  # 逐行标准化 + 滚动哈希；False 时逐窗口标准化并计算MD5
         
     def normalize_code(self, code: str) -> str:
         """标准化代码，去除变量名、空格等差异"""
@@ -60,6 +478,9 @@ class CodeDuplicationAnalyzer:
     
     def extract_code_blocks(self, file_path: str) -> List[CodeBlock]:
         """从文件中提取代码块"""
+        if self.use_rolling_hash:
+            return self.extract_code_blocks_rolling(file_path)
+
         blocks = []
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -77,9 +498,9 @@ class CodeDuplicationAnalyzer:
                         file_path=file_path,
                         start_line=i + 1,
                         end_line=i + self.min_block_size,
-                        content=content,
                         hash_value=hash_value,
-                        normalized_content=normalized
+                        text=content,
+                        normalized=normalized
                     )
                     blocks.append(block)
                     
@@ -87,85 +508,455 @@ class CodeDuplicationAnalyzer:
             print(f"Error processing {file_path}: {e}")
             
         return blocks
+
+    def extract_code_blocks_rolling(self, file_path: str) -> List[CodeBlock]:
+        """用滚动哈希从文件中提取代码块（每行只标准化和哈希一次）"""
+        try:
+            normalized_file = get_normalized_file(file_path)
+        except Exception as e:
+            print(f"Error processing {file_path}: {e}")
+            return []
+
+        start_lines, window_hashes = rolling_window_hashes(normalized_file, self.min_block_size)
+        size = self.min_block_size
+        return [
+            CodeBlock(
+                file_path=file_path,
+                start_line=start_line,
+                end_line=start_line + size - 1,
+                hash_value=format(window_hash, '016x')
+            )
+            for start_line, window_hash in zip(start_lines, window_hashes)
+        ]
+
+    def extract_all_windows(self, ml_files: List[str]) -> List[FileWindows]:
+        """提取所有文件的紧凑窗口指纹；jobs > 1 时在进程池中并行计算"""
+        if self.jobs <= 1:
+            fingerprinter = FingerprintIndex()
+            all_windows = []
+            for file_path in ml_files:
+                try:
+                    all_windows.append(extract_file_windows(file_path, self.min_block_size, fingerprinter))
+                except Exception as e:
+                    print(f"Error processing {file_path}: {e}")
+            return all_windows
+
+        tasks = [(file_path, self.min_block_size) for file_path in ml_files]
+        with multiprocessing.Pool(self.jobs) as pool:
+            # imap 保持文件顺序，保证结果确定
+            return [windows for windows in pool.imap(extract_file_windows_task, tasks, chunksize=8)
+                    if windows is not None]
+
+    def repeated_window_blocks(self, all_windows: List[FileWindows]) -> List[CodeBlock]:
+        """只为哈希出现不止一次的窗口构造代码块，供完全重复检测使用"""
+        counts = Counter(window_hash for windows in all_windows for window_hash in windows.window_hashes)
+        size = self.min_block_size
+        return [
+            CodeBlock(windows.file_path, start_line, start_line + size - 1, format(window_hash, '016x'))
+            for windows in all_windows
+            for start_line, window_hash in zip(windows.start_lines, windows.window_hashes)
+            if counts[window_hash] > 1
+        ]
+
+    def similarity_tables(self, all_windows: List[FileWindows]) -> SimilarityTables:
+        """由各文件的指纹数组建立指纹索引和编号 -> 位置表"""
+        tables = SimilarityTables(
+            files=[windows.file_path for windows in all_windows],
+            block_size=self.min_block_size,
+            index=FingerprintIndex(),
+            indexed_files=array('I'),
+            indexed_lines=array('I'),
+            indexed_hashes=array('Q')
+        )
+        for file_index, windows in enumerate(all_windows):
+            offsets = windows.fingerprint_offsets
+            for i, position in enumerate(windows.indexed):
+                tables.index.add_fingerprints(set(windows.fingerprints[offsets[i]:offsets[i + 1]]))
+                tables.indexed_files.append(file_index)
+                tables.indexed_lines.append(windows.start_lines[position])
+                tables.indexed_hashes.append(windows.window_hashes[position])
+        return tables
     
     def find_exact_duplicates(self, all_blocks: List[CodeBlock]) -> List[DuplicationResult]:
-        """查找完全重复的代码块"""
+        """查找完全重复的代码块
+
+        每个哈希组按 (文件, 起始行) 排序后单遍扫描去除同文件内重叠的窗口，
+        再把各位置相对偏移相同、首位置区间重叠或相邻的重复窗口合并为最大重复区域。
+        相邻窗口哈希相同（如空行使窗口内容不变）时重叠抑制会丢掉部分窗口，
+        按区间合并不依赖每一行都有窗口组。
+        """
         hash_groups = defaultdict(list)
         
         for block in all_blocks:
             hash_groups[block.hash_value].append(block)
         
-        duplicates = []
+        # 各位置的对齐方式（文件及相对首位置的行偏移）-> 该对齐下的窗口组
+        aligned: Dict[Tuple[Tuple[str, int], ...], List[List[CodeBlock]]] = defaultdict(list)
         for hash_value, blocks in hash_groups.items():
             if len(blocks) > 1:
-                # 确保不是来自同一个文件的相邻块
-                unique_locations = []
-                for block in blocks:
-                    is_unique = True
-                    for existing in unique_locations:
-                        if (block.file_path == existing.file_path and 
-                            abs(block.start_line - existing.start_line) < self.min_block_size):
-                            is_unique = False
-                            break
-                    if is_unique:
-                        unique_locations.append(block)
-                
+                unique_locations = self.suppress_overlapping_blocks(blocks)
                 if len(unique_locations) > 1:
-                    duplicates.append(DuplicationResult(
-                        blocks=unique_locations,
-                        similarity=1.0,
-                        pattern_type="完全重复",
-                        refactor_suggestion="提取为公共函数或模块"
-                    ))
+                    first_line = unique_locations[0].start_line
+                    alignment = tuple((block.file_path, block.start_line - first_line)
+                                      for block in unique_locations)
+                    aligned[alignment].append(unique_locations)
+        
+        duplicates = []
+        for windows in aligned.values():
+            windows.sort(key=lambda blocks: blocks[0].start_line)
+            region = windows[0]
+            region_end = region[0].end_line
+            for blocks in windows[1:] + [None]:
+                if blocks is not None and blocks[0].start_line <= region_end + 1:
+                    region_end = max(region_end, blocks[0].end_line)
+                    continue
+                duplicates.append(self.merged_duplicate(region, region_end))
+                if blocks is not None:
+                    region = blocks
+                    region_end = blocks[0].end_line
         
+        # 重复区域越长、出现次数越多越值得优先重构
+        duplicates.sort(
+            key=lambda dup: (dup.blocks[0].end_line - dup.blocks[0].start_line + 1) * len(dup.blocks),
+            reverse=True
+        )
         return duplicates
+
+    def merged_duplicate(self, blocks: List[CodeBlock], region_end: int) -> DuplicationResult:
+        """以一组窗口为起点、首位置在 region_end 结束的合并重复区域"""
+        merged_blocks = blocks
+        extra = region_end - blocks[0].end_line
+        if extra:
+            merged_blocks = [
+                CodeBlock(
+                    file_path=block.file_path,
+                    start_line=block.start_line,
+                    end_line=block.end_line + extra,
+                    hash_value=block.hash_value
+                )
+                for block in blocks
+            ]
+        return DuplicationResult(
+            blocks=merged_blocks,
+            similarity=1.0,
+            pattern_type="完全重复",
+            refactor_suggestion="提取为公共函数或模块"
+        )
+
+    def suppress_overlapping_blocks(self, blocks: List[CodeBlock]) -> List[CodeBlock]:
+        """排序后单遍扫描，去除同一文件中与已保留窗口重叠的窗口"""
+        unique_locations = []
+        last_file = None
+        last_start = 0
+        for block in sorted(blocks, key=lambda b: (b.file_path, b.start_line)):
+            if block.file_path == last_file and block.start_line - last_start < self.min_block_size:
+                continue
+            unique_locations.append(block)
+            last_file = block.file_path
+            last_start = block.start_line
+        return unique_locations
     
     def find_similar_blocks(self, all_blocks: List[CodeBlock]) -> List[DuplicationResult]:
-        """查找相似的代码块（优化版本）"""
+        """查找相似的代码块（winnowing指纹索引）
+
+        先用指纹倒排索引找出共享足够多指纹的跨文件候选对，
+        再对候选对计算精确的相似度，严格按 similarity_threshold 过滤。
+        """
+        index = FingerprintIndex()
+        eligible = []  # 指纹编号 -> 代码块下标
+        for i, block in enumerate(all_blocks):
+            if len(block.normalized_content) < MIN_SIMILAR_CONTENT:  # 跳过太短的块
+                continue
+            index.add(block.normalized_content)
+            eligible.append(i)
+
         similar_groups = []
         processed = set()
-        
-        # 只分析前500个块以提高性能
-        limited_blocks = all_blocks[:500]
-        
-        for i, block1 in enumerate(limited_blocks):
-            if i in processed or len(block1.normalized_content) < 50:  # 跳过太短的块
+
+        for block_id, i in enumerate(eligible):
+            if block_id in processed:
                 continue
-                
-            similar_blocks = [block1]
-            # 只与后续50个块比较，减少复杂度
-            for j in range(i+1, min(i+51, len(limited_blocks))):
-                block2 = limited_blocks[j]
-                if j in processed or block1.file_path == block2.file_path:
-                    continue
-                
-                # 快速预筛选
-                if abs(len(block1.normalized_content) - len(block2.normalized_content)) > 100:
-                    continue
-                
-                # 计算相似度
-                similarity = difflib.SequenceMatcher(
-                    None, 
-                    block1.normalized_content, 
-                    block2.normalized_content
-                ).ratio()
-                
-                if similarity >= self.similarity_threshold:
-                    similar_blocks.append(block2)
-                    processed.add(j)
-            
-            if len(similar_blocks) > 1:
-                processed.add(i)
-                similar_groups.append(DuplicationResult(
-                    blocks=similar_blocks,
-                    similarity=min(difflib.SequenceMatcher(
-                        None, similar_blocks[0].normalized_content, block.normalized_content
-                    ).ratio() for block in similar_blocks[1:]),
-                    pattern_type="结构相似",
-                    refactor_suggestion="提取通用模式，使用参数化函数"
-                ))
-        
+            candidates = [
+                (other, all_blocks[eligible[other]]) for other in index.candidates(
+                    block_id, self.min_shared_fingerprints, self.min_fingerprint_overlap)
+            ]
+            group = self.cluster_similar(block_id, all_blocks[i], candidates, processed)
+            if group is not None:
+                similar_groups.append(group)
+
         return similar_groups
+
+    def find_similar_windows(self, tables: SimilarityTables) -> List[DuplicationResult]:
+        """在紧凑表上查找相似代码块
+
+        jobs > 1 时候选验证（SequenceMatcher，整个分析的主要耗时）按编号分段交给进程池，
+        各段在工作进程中按串行算法推测归组，被推测归组的块不再作为查询或候选。
+        父进程按编号顺序复核：工作进程跳过的查询若实际未归组则重新计算；
+        工作进程跳过、实际却未归组的候选逐对补充验证。结果与串行完全一致。
+        """
+        similar_groups = []
+        processed: Set[int] = set()
+        block_count = len(tables.indexed_lines)
+
+        def cluster(block_id: int, matches: List[Tuple[int, float]]) -> None:
+            group = self.cluster_matches(tables, block_id, matches, processed)
+            if group is not None:
+                similar_groups.append(group)
+
+        if self.jobs <= 1:
+            for block_id in range(block_count):
+                if block_id not in processed:
+                    cluster(block_id, self.similar_candidates(tables, block_id, processed))
+            return similar_groups
+
+        chunks = [range(start, min(start + SIMILARITY_CHUNK_SIZE, block_count))
+                  for start in range(0, block_count, SIMILARITY_CHUNK_SIZE)]
+        with multiprocessing.Pool(self.jobs, initializer=_init_similarity_worker,
+                                  initargs=(self, tables)) as pool:
+            for results in pool.imap(verify_similarity_chunk, chunks):
+                # 工作进程在段内视为已归组、而父进程尚未归组的块
+                unconfirmed: Set[int] = set()
+                for block_id, speculative in results:
+                    if block_id not in processed:
+                        if speculative is None:
+                            matches = self.similar_candidates(tables, block_id, processed)
+                        else:
+                            matches = speculative
+                            others = [other for other in sorted(unconfirmed) if tables.index.is_candidate(
+                                block_id, other, self.min_shared_fingerprints, self.min_fingerprint_overlap)]
+                            if others:
+                                matches = sorted(matches + self.similar_candidates(
+                                    tables, block_id, processed, others))
+                        cluster(block_id, matches)
+                    # 按工作进程的推测重放其段内归组
+                    if speculative:
+                        unconfirmed.update(other for other, _ in speculative)
+                        unconfirmed.add(block_id)
+                    if unconfirmed:
+                        unconfirmed.difference_update(processed)
+        return similar_groups
+
+    def similar_candidates(self, tables: SimilarityTables, block_id: int,
+                           processed: Set[int] = frozenset(),
+                           others: Optional[List[int]] = None) -> List[Tuple[int, float]]:
+        """返回与指定块相似度达到阈值的跨文件候选及其相似度（跳过 processed 中的块）
+
+        others 为空时从指纹索引取候选，否则只验证给定的候选。
+        """
+        file_index = tables.indexed_files[block_id]
+        window_hash = tables.indexed_hashes[block_id]
+        content = tables.normalized_content(block_id)
+        if others is None:
+            others = tables.index.candidates(block_id, self.min_shared_fingerprints,
+                                             self.min_fingerprint_overlap)
+        matches = []
+        for other in others:
+            if (other in processed or tables.indexed_files[other] == file_index or
+                    tables.indexed_hashes[other] == window_hash):  # 完全重复已单独报告
+                continue
+            matcher = difflib.SequenceMatcher(None, content, tables.normalized_content(other))
+            # quick_ratio是ratio的上界，可以安全地提前排除
+            if matcher.real_quick_ratio() < self.similarity_threshold:
+                continue
+            if matcher.quick_ratio() < self.similarity_threshold:
+                continue
+            similarity = matcher.ratio()
+            if similarity >= self.similarity_threshold:
+                matches.append((other, similarity))
+        return matches
+
+    def cluster_matches(self, tables: SimilarityTables, block_id: int,
+                        matches: List[Tuple[int, float]],
+                        processed: Set[int]) -> Optional[DuplicationResult]:
+        """把尚未归组的相似候选与指定块聚为一组，只为该组构造代码块"""
+        matches = [(other, similarity) for other, similarity in matches if other not in processed]
+        if not matches:
+            return None
+        processed.update(other for other, _ in matches)
+        processed.add(block_id)
+        return DuplicationResult(
+            blocks=[tables.block(block_id)] + [tables.block(other) for other, _ in matches],
+            similarity=min(similarity for _, similarity in matches),
+            pattern_type="结构相似",
+            refactor_suggestion="提取通用模式，使用参数化函数"
+        )
+
+    def cluster_similar(self, block_id: int, block1: CodeBlock,
+                        candidates: List[Tuple[int, CodeBlock]],
+                        processed: Set[int]) -> Optional[DuplicationResult]:
+        """将候选块中与 block1 足够相似的块聚为一组，已归组的块编号记入 processed"""
+        similar_blocks = [block1]
+        similarities = []
+        for other_id, block2 in candidates:
+            if (other_id in processed or block1.file_path == block2.file_path or
+                    block1.hash_value == block2.hash_value):  # 完全重复已单独报告
+                continue
+
+            matcher = difflib.SequenceMatcher(
+                None,
+                block1.normalized_content,
+                block2.normalized_content
+            )
+            # quick_ratio是ratio的上界，可以安全地提前排除
+            if matcher.real_quick_ratio() < self.similarity_threshold:
+                continue
+            if matcher.quick_ratio() < self.similarity_threshold:
+                continue
+            similarity = matcher.ratio()
+
+            if similarity >= self.similarity_threshold:
+                similar_blocks.append(block2)
+                similarities.append(similarity)
+                processed.add(other_id)
+
+        if len(similar_blocks) == 1:
+            return None
+        processed.add(block_id)
+        return DuplicationResult(
+            blocks=similar_blocks,
+            similarity=min(similarities),
+            pattern_type="结构相似",
+            refactor_suggestion="提取通用模式，使用参数化函数"
+        )
+    
+    def baseline_cache_file(self, commit: str) -> str:
+        """基线快照路径：与源码索引共用 src 同级的缓存目录"""
+        root = os.path.abspath(self.project_root)
+        cache_dir = os.path.join(os.path.dirname(root), DEFAULT_CACHE_DIR)
+        key = zlib.crc32(f"{root}:{self.min_block_size}".encode())
+        return os.path.join(cache_dir, f"duplication_base_{commit[:12]}_{key:08x}.pickle")
+
+    def build_baseline(self, commit: str) -> DuplicationBaseline:
+        """从git对象库读取基线提交的源码并计算全部指纹"""
+        contents = read_revision_files(self.project_root, commit)
+        baseline = DuplicationBaseline(
+            commit=commit,
+            block_size=self.min_block_size,
+            files=sorted(contents),
+            windows=[],
+            index=FingerprintIndex(),
+            indexed_files=array('I'),
+            indexed_lines=array('I')
+        )
+        for file_index, file_path in enumerate(baseline.files):
+            normalized_file = normalize_source(file_path, scan_source(file_path, contents[file_path]))
+            start_lines, window_hashes = rolling_window_hashes(normalized_file, self.min_block_size)
+            baseline.windows.append((start_lines, window_hashes))
+            for start_line in start_lines:
+                normalized = normalized_file.window(start_line, start_line + self.min_block_size - 1)
+                if len(normalized) < MIN_SIMILAR_CONTENT:
+                    continue
+                baseline.index.add(normalized)
+                baseline.indexed_files.append(file_index)
+                baseline.indexed_lines.append(start_line)
+        baseline.index._cache.clear()
+        return baseline
+
+    def load_baseline(self, base: str) -> DuplicationBaseline:
+        """加载基线快照，不存在时构建并持久化"""
+        commit = run_git(self.project_root, 'rev-parse', '--verify', f"{base}^{{commit}}").strip()
+        cache_file = self.baseline_cache_file(commit)
+        try:
+            with open(cache_file, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') == BASELINE_VERSION:
+                return data['baseline']
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+            pass
+
+        print(f"为基线 {commit[:12]} 建立指纹快照...")
+        baseline = self.build_baseline(commit)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = cache_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            pickle.dump({'version': BASELINE_VERSION, 'baseline': baseline}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+        return baseline
+
+    def analyze_changes(self, base: str) -> Dict:
+        """只分析相对基线提交的变更：报告涉及变更行的重复代码"""
+        baseline = self.load_baseline(base)
+        changed = changed_line_ranges(self.project_root, baseline.commit)
+        # 变更或已删除文件在基线中的指纹已过期
+        stale = set(changed)
+        stale.update(path for path in baseline.files if not os.path.exists(path))
+
+        changed_blocks = []
+        for file_path in sorted(changed):
+            if os.path.exists(file_path):
+                changed_blocks.extend(self.extract_code_blocks(file_path))
+        touched = [block for block in changed_blocks if touches_ranges(block, changed[block.file_path])]
+
+        # 完全重复：只收集与变更文件窗口哈希相同的基线窗口
+        wanted = {int(block.hash_value, 16) for block in changed_blocks}
+        pool = list(changed_blocks)
+        size = self.min_block_size
+        for file_path, (start_lines, window_hashes) in zip(baseline.files, baseline.windows):
+            if file_path in stale:
+                continue
+            for start_line, window_hash in zip(start_lines, window_hashes):
+                if window_hash in wanted:
+                    pool.append(CodeBlock(file_path, start_line, start_line + size - 1,
+                                          format(window_hash, '016x')))
+        exact_duplicates = [
+            dup for dup in self.find_exact_duplicates(pool)
+            if any(block.file_path in changed and touches_ranges(block, changed[block.file_path])
+                   for block in dup.blocks)
+        ]
+
+        # 相似代码：变更文件的块追加到基线指纹索引，只对触及变更行的块查询候选
+        index = baseline.index
+        base_count = len(index.fingerprints)
+        added_blocks = []
+        query_ids = []
+        for block in changed_blocks:
+            if len(block.normalized_content) < MIN_SIMILAR_CONTENT:
+                continue
+            block_id = index.add(block.normalized_content)
+            added_blocks.append(block)
+            if touches_ranges(block, changed[block.file_path]):
+                query_ids.append(block_id)
+
+        def block_of(block_id: int) -> Optional[CodeBlock]:
+            if block_id >= base_count:
+                return added_blocks[block_id - base_count]
+            file_index = baseline.indexed_files[block_id]
+            file_path = baseline.files[file_index]
+            if file_path in stale:
+                return None
+            start_line = baseline.indexed_lines[block_id]
+            start_lines, window_hashes = baseline.windows[file_index]
+            window_hash = window_hashes[bisect.bisect_left(start_lines, start_line)]
+            return CodeBlock(file_path, start_line, start_line + size - 1, format(window_hash, '016x'))
+
+        similar_blocks = []
+        processed = set()
+        for block_id in query_ids:
+            if block_id in processed:
+                continue
+            candidates = []
+            for other in index.candidates(block_id, self.min_shared_fingerprints,
+                                          self.min_fingerprint_overlap):
+                block = block_of(other)
+                if block is not None:
+                    candidates.append((other, block))
+            group = self.cluster_similar(block_id, block_of(block_id), candidates, processed)
+            if group is not None:
+                similar_blocks.append(group)
+
+        all_duplications = exact_duplicates + similar_blocks
+        return {
+            'summary': {
+                'base': baseline.commit,
+                'changed_files': len(changed),
+                'changed_blocks': len(touched),
+                'exact_duplicates': len(exact_duplicates),
+                'similar_blocks': len(similar_blocks),
+                'total_duplications': len(all_duplications)
+            },
+            'duplications': [self.describe_duplication(dup) for dup in all_duplications]
+        }
     
     def analyze_pattern_types(self, duplications: List[DuplicationResult]) -> Dict[str, int]:
         """分析重复模式类型"""
@@ -216,40 +1007,51 @@ class CodeDuplicationAnalyzer:
         
         return suggestions
     
-    def analyze_project(self) -> Dict:
-        """分析整个项目的代码重复"""
-        all_blocks = []
+    def analyze_project(self, writer: Optional[JsonlReportWriter] = None) -> Dict:
+        """分析整个项目的代码重复
+
+        传入 writer 时，每找到一批重复就立即逐条写出 duplication 记录，
+        不必等相似代码检测结束；汇总记录由调用方在最后写出。
+        """
         ml_files = []
         
-        # 收集所有OCaml文件（限制数量）
-        for root, dirs, files in os.walk(self.project_root):
-            # 跳过构建目录
-            if '_build' in dirs:
-                dirs.remove('_build')
-            if 'output' in dirs:
-                dirs.remove('output')
-                
-            for file in files:
-                if file.endswith('.ml') and len(ml_files) < self.max_files:
-                    file_path = os.path.join(root, file)
-                    # 优先分析重要的文件
-                    if any(important in file for important in ['lexer', 'parser', 'semantic', 'builtin', 'codegen']):
-                        ml_files.insert(0, file_path)
-                    else:
-                        ml_files.append(file_path)
+        # 收集所有OCaml文件（共享源码索引已跳过构建目录）
+        for file_path in load_source_index(self.project_root).paths():
+            file = os.path.basename(file_path)
+            # 优先分析重要的文件
+            if any(important in file for important in ['lexer', 'parser', 'semantic', 'builtin', 'codegen']):
+                ml_files.insert(0, file_path)
+            else:
+                ml_files.append(file_path)
         
         print(f"分析 {len(ml_files)} 个OCaml文件...")
         
-        # 提取所有代码块
-        for file_path in ml_files:
-            blocks = self.extract_code_blocks(file_path)
-            all_blocks.extend(blocks)
+        # 提取所有代码块：滚动哈希模式下只保留紧凑的窗口指纹数组
+        if self.use_rolling_hash:
+            all_windows = self.extract_all_windows(ml_files)
+            total_blocks = sum(len(windows.start_lines) for windows in all_windows)
+            exact_candidates = self.repeated_window_blocks(all_windows)
+        else:
+            all_blocks = []
+            for file_path in ml_files:
+                all_blocks.extend(self.extract_code_blocks(file_path))
+            total_blocks = len(all_blocks)
+            exact_candidates = all_blocks
         
-        print(f"提取了 {len(all_blocks)} 个代码块")
+        print(f"提取了 {total_blocks} 个代码块")
         
         # 查找重复
-        exact_duplicates = self.find_exact_duplicates(all_blocks)
-        similar_blocks = self.find_similar_blocks(all_blocks)
+        exact_duplicates = self.find_exact_duplicates(exact_candidates)
+        if writer is not None:
+            for dup in exact_duplicates:
+                writer.write('duplication', self.describe_duplication(dup))
+        if self.use_rolling_hash:
+            similar_blocks = self.find_similar_windows(self.similarity_tables(all_windows))
+        else:
+            similar_blocks = self.find_similar_blocks(all_blocks)
+        if writer is not None:
+            for dup in similar_blocks:
+                writer.write('duplication', self.describe_duplication(dup))
         
         # 分析模式
         all_duplications = exact_duplicates + similar_blocks
@@ -258,20 +1060,12 @@ class CodeDuplicationAnalyzer:
         # 生成详细建议
         detailed_suggestions = []
         for dup in all_duplications[:10]:  # 只显示前10个最重要的
-            suggestions = self.get_refactor_suggestions(dup)
-            detailed_suggestions.append({
-                'files': [block.file_path for block in dup.blocks],
-                'lines': [(block.start_line, block.end_line) for block in dup.blocks],
-                'similarity': dup.similarity,
-                'pattern_type': dup.pattern_type,
-                'suggestions': suggestions,
-                'content_preview': dup.blocks[0].content[:200] + "..." if len(dup.blocks[0].content) > 200 else dup.blocks[0].content
-            })
+            detailed_suggestions.append(self.describe_duplication(dup))
         
         return {
             'summary': {
                 'total_files': len(ml_files),
-                'total_blocks': len(all_blocks),
+                'total_blocks': total_blocks,
                 'exact_duplicates': len(exact_duplicates),
                 'similar_blocks': len(similar_blocks),
                 'total_duplications': len(all_duplications)
@@ -281,6 +1075,18 @@ class CodeDuplicationAnalyzer:
             'recommendations': self.generate_recommendations(all_duplications, pattern_analysis)
         }
     
+    def describe_duplication(self, dup: DuplicationResult) -> Dict:
+        """生成单处重复的报告条目"""
+        content = dup.blocks[0].content
+        return {
+            'files': [block.file_path for block in dup.blocks],
+            'lines': [(block.start_line, block.end_line) for block in dup.blocks],
+            'similarity': dup.similarity,
+            'pattern_type': dup.pattern_type,
+            'suggestions': self.get_refactor_suggestions(dup),
+            'content_preview': content[:200] + "..." if len(content) > 200 else content
+        }
+    
     def generate_recommendations(self, duplications: List[DuplicationResult], patterns: Dict[str, int]) -> List[str]:
         """生成总体重构建议"""
         recommendations = []
@@ -313,11 +1119,57 @@ class CodeDuplicationAnalyzer:
 
 def main():
     """主函数"""
-    project_root = "/home/zc/chinese-ocaml-worktrees/chinese-ocaml/src"
-    analyzer = CodeDuplicationAnalyzer(project_root)
+    parser = argparse.ArgumentParser(description='骆言项目代码重复分析工具')
+    parser.add_argument('--root', default="/home/zc/chinese-ocaml-worktrees/chinese-ocaml/src",
+                        help='要分析的源码目录')
+    parser.add_argument('--output', default="/home/zc/chinese-ocaml-worktrees/chinese-ocaml/code_duplication_report.json",
+                        help='详细报告输出路径')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='并行提取窗口指纹和验证相似候选的进程数（默认1，即串行）')
+    parser.add_argument('--base', default=None,
+                        help='增量模式：只报告相对该git修订（如 origin/main）的变更所引入的重复')
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='json',
+                        help='报告格式：json 为整体报告；jsonl 每处重复一行并以汇总记录结尾')
+    args = parser.parse_args()
+    if args.format == 'jsonl':
+        args.output = jsonl_path(args.output)
+
+    analyzer = CodeDuplicationAnalyzer(args.root, jobs=args.jobs)
+
+    if args.base:
+        results = analyzer.analyze_changes(args.base)
+        summary = results['summary']
+        print(f"\n=== 相对 {args.base} ({summary['base'][:12]}) 的增量重复检查 ===")
+        print(f"变更文件数量: {summary['changed_files']}")
+        print(f"触及变更行的代码块: {summary['changed_blocks']}")
+        print(f"完全重复: {summary['exact_duplicates']}，相似代码: {summary['similar_blocks']}")
+        for i, dup in enumerate(results['duplications'], 1):
+            print(f"\n{i}. 相似度: {dup['similarity']:.2f} | 类型: {dup['pattern_type']}")
+            for file_path, (start, end) in zip(dup['files'], dup['lines']):
+                print(f"   - {file_path}:{start}-{end}")
+        if args.format == 'jsonl':
+            with JsonlReportWriter(args.output) as writer:
+                for dup in results['duplications']:
+                    writer.write('duplication', dup)
+                writer.write_summary(summary)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n详细报告已保存到: {args.output}")
+        return
     
     print("开始分析代码重复...")
-    results = analyzer.analyze_project()
+    if args.format == 'jsonl':
+        # 重复记录在分析过程中即写出，汇总记录最后追加
+        with JsonlReportWriter(args.output) as writer:
+            results = analyzer.analyze_project(writer)
+            writer.write_summary({
+                **results['summary'],
+                'pattern_analysis': results['pattern_analysis'],
+                'recommendations': results['recommendations'],
+            })
+    else:
+        results = analyzer.analyze_project()
     
     # 输出结果
     print("\n=== 骆言项目代码重复分析报告 ===")
@@ -344,10 +1196,11 @@ def main():
     for rec in results['recommendations']:
         print(f"• {rec}")
     
-    # 保存详细报告
-    output_file = "/home/zc/chinese-ocaml-worktrees/chinese-ocaml/code_duplication_report.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    # 保存详细报告（jsonl 格式已在分析过程中写出）
+    output_file = args.output
+    if args.format == 'json':
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
     
     print(f"\n详细报告已保存到: {output_file}")
 
@@ -9,6 +9,8 @@ import subprocess
 from pathlib import Path
 from collections import defaultdict, Counter
 
+from ocaml_source_index import load_source_index, read_source
+
 class CodeQualityAnalyzer:
     def __init__(self, root_dir):
         self.root_dir = Path(root_dir)
@@ -21,8 +23,7 @@ class CodeQualityAnalyzer:
     def analyze_function_length(self, file_path):
         """分析函数长度，找出超过50行的函数"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = read_source(file_path).text
             
             # OCaml函数定义模式
             function_patterns = [
@@ -96,8 +97,7 @@ class CodeQualityAnalyzer:
     def analyze_repeated_patterns(self, file_path):
         """分析重复的代码模式"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = read_source(file_path).text
             
             # 查找重复的模式匹配
             pattern_matches = re.findall(r'match\s+\w+\s+with\s*\|.*?(?=\n\s*(?:let|type|module|$))', 
@@ -114,8 +114,7 @@ class CodeQualityAnalyzer:
     def analyze_module_organization(self, file_path):
         """分析模块组织和命名"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = read_source(file_path).text
             
             filename = os.path.basename(file_path)
             
@@ -163,8 +162,7 @@ class CodeQualityAnalyzer:
             return
             
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = read_source(file_path).text
             
             filename = os.path.basename(file_path)
             
@@ -206,8 +204,7 @@ class CodeQualityAnalyzer:
     def analyze_documentation_gaps(self, file_path):
         """分析文档缺失"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = read_source(file_path).text
             
             # 检查是否有模块级注释
             if not re.search(r'^\(\*.*?\*\)', content, re.DOTALL | re.MULTILINE):
@@ -238,8 +235,7 @@ class CodeQualityAnalyzer:
     def analyze_chinese_language_features(self, file_path):
         """分析中文语言特性使用情况"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = read_source(file_path).text
             
             # 检查是否使用了英文标识符在中文语境中
             english_identifiers = re.findall(r'let\s+([a-zA-Z][a-zA-Z0-9_]*)\s*=', content)
@@ -261,7 +257,7 @@ class CodeQualityAnalyzer:
         print("开始代码质量分析...")
         
         # 分析所有.ml文件
-        for ml_file in self.root_dir.rglob("*.ml"):
+        for ml_file in map(Path, load_source_index(str(self.root_dir)).paths()):
             if 'test' in str(ml_file) or '_build' in str(ml_file) or '临时' in str(ml_file):
                 continue
                 
@@ -8,17 +8,18 @@ import re
 from typing import List, Dict, Tuple
 from collections import defaultdict
 
+from ocaml_source_index import load_source_index, read_source
+
 def analyze_complex_patterns(file_path: str) -> List[Dict]:
     """分析单个文件中的复杂模式匹配"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        source = read_source(file_path)
     except Exception as e:
         print(f"无法读取文件 {file_path}: {e}")
         return []
     
     complex_patterns = []
-    lines = content.split('\n')
+    lines = source.lines
     
     # 查找match语句
     for i, line in enumerate(lines, 1):
@@ -122,12 +123,7 @@ def calculate_complexity_score(branches: int, nesting: int, has_complex: bool) -
 
 def find_ml_files(src_dir: str) -> List[str]:
     """找到所有.ml文件"""
-    ml_files = []
-    for root, dirs, files in os.walk(src_dir):
-        for file in files:
-            if file.endswith('.ml'):
-                ml_files.append(os.path.join(root, file))
-    return ml_files
+    return load_source_index(src_dir).paths()
 
 def generate_complex_pattern_report(src_dir: str):
     """生成复杂模式匹配分析报告"""
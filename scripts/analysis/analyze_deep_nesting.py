@@ -8,11 +8,14 @@ import re
 from typing import List, Dict, Tuple
 from collections import defaultdict
 
+from ocaml_source_index import load_source_index, read_source
+from analysis_result_cache import cached_analysis
+
+@cached_analysis('nesting_depth', version=1)
 def analyze_nesting_depth(file_path: str) -> List[Dict]:
     """分析单个文件中的嵌套深度"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        lines = read_source(file_path).raw_lines
     except Exception as e:
         print(f"无法读取文件 {file_path}: {e}")
         return []
@@ -107,12 +110,7 @@ def get_context_lines(lines: List[str], center: int, radius: int) -> List[str]:
 
 def find_ml_files(src_dir: str) -> List[str]:
     """找到所有.ml文件"""
-    ml_files = []
-    for root, dirs, files in os.walk(src_dir):
-        for file in files:
-            if file.endswith('.ml'):
-                ml_files.append(os.path.join(root, file))
-    return ml_files
+    return load_source_index(src_dir).paths()
 
 def generate_nesting_report(src_dir: str):
     """生成深层嵌套分析报告"""
@@ -8,11 +8,56 @@ import re
 from typing import List, Dict, Set, Tuple
 from collections import defaultdict
 
+from ocaml_source_index import load_source_index, read_source
+from analysis_result_cache import cached_analysis
+
+# 错误处理模式的组合正则：纯字面量分支（不含分组和断言）可以使用正则引擎的前缀字符过滤，
+# 每个文件只扫描一次；命中文本再查表归类
+ERROR_PATTERN = re.compile(
+    r"raise|failwith|invalid_arg|Result\.|Some|None|try|with|catch"
+    r"|exception|Exception|EXCEPTION|_error|error_|Error\w+"
+)
+
+# 命中文本 -> 模式种类（Error\w+ 单独处理）
+ERROR_PATTERN_KINDS = {
+    'raise': 'raise', 'failwith': 'failwith', 'invalid_arg': 'invalid_arg',
+    'Result.': 'result', 'Some': 'option', 'None': 'option',
+    'try': 'try', 'with': 'with', 'catch': 'with',
+    'exception': 'exception', 'Exception': 'exception', 'EXCEPTION': 'exception',
+    '_error': 'error', 'error_': 'error'
+}
+
+# 需要作为完整单词出现的命中文本
+WHOLE_WORD_MATCHES = {'Some', 'None', 'try', 'with'}
+
+
+def _is_word_char(text: str, pos: int) -> bool:
+    return 0 <= pos < len(text) and (text[pos].isalnum() or text[pos] == '_')
+
+
+def classify_error_match(text: str, match) -> str:
+    """返回命中的模式种类，不满足单词边界时返回空串"""
+    matched = match.group(0)
+    kind = ERROR_PATTERN_KINDS.get(matched, 'error')
+    start, end = match.span()
+    if matched in WHOLE_WORD_MATCHES:
+        if _is_word_char(text, start - 1) or _is_word_char(text, end):
+            return ''
+    elif kind == 'result':
+        # Result.xxx：前为单词边界，后接标识符
+        if _is_word_char(text, start - 1) or not _is_word_char(text, end):
+            return ''
+    return kind
+
+@cached_analysis('error_patterns', version=2)
 def analyze_error_patterns(file_path: str) -> Dict:
-    """分析单个文件中的错误处理模式"""
+    """分析单个文件中的错误处理模式
+
+    在去除注释和字符串内容的代码上匹配，注释和字符串中的关键字不计入。
+    命中记录为紧凑元组：(行号, 内容)，raise 和 Result 额外带类型：(行号, 内容, 类型)。
+    """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        source = read_source(file_path)
     except Exception as e:
         print(f"无法读取文件 {file_path}: {e}")
         return {}
@@ -28,61 +73,39 @@ def analyze_error_patterns(file_path: str) -> Dict:
         'error_functions': []
     }
     
-    lines = content.split('\n')
+    # 一次扫描整份代码，收集每行出现的模式种类（行号有序）
+    code_text = '\n'.join(source.code_lines)
+    line_kinds: Dict[int, Set[str]] = {}
+    for match in ERROR_PATTERN.finditer(code_text):
+        kind = classify_error_match(code_text, match)
+        if not kind:
+            continue
+        line_number = source.line_of_offset(match.start())
+        kinds = line_kinds.get(line_number)
+        if kinds is None:
+            kinds = line_kinds[line_number] = set()
+        kinds.add(kind)
     
-    for i, line in enumerate(lines, 1):
-        stripped = line.strip()
-        
-        # 查找各种错误处理模式
-        if 'raise' in stripped:
-            patterns['raise_patterns'].append({
-                'line': i,
-                'content': stripped,
-                'type': extract_raise_type(stripped)
-            })
-        
-        if 'failwith' in stripped:
-            patterns['failwith_patterns'].append({
-                'line': i,
-                'content': stripped
-            })
-        
-        if 'invalid_arg' in stripped:
-            patterns['invalid_arg_patterns'].append({
-                'line': i,
-                'content': stripped
-            })
-        
-        if re.search(r'\bResult\.\w+', stripped):
-            patterns['result_patterns'].append({
-                'line': i,
-                'content': stripped,
-                'result_type': extract_result_type(stripped)
-            })
-        
-        if re.search(r'\bSome\b|\bNone\b', stripped):
-            patterns['option_patterns'].append({
-                'line': i,
-                'content': stripped
-            })
-        
-        if 'try' in stripped and ('with' in stripped or 'catch' in stripped):
-            patterns['try_catch_patterns'].append({
-                'line': i,
-                'content': stripped
-            })
+    for i, kinds in line_kinds.items():
+        stripped = source.lines[i - 1].strip()
+        code = source.code_lines[i - 1]
         
-        if 'exception' in stripped.lower():
-            patterns['exception_definitions'].append({
-                'line': i,
-                'content': stripped
-            })
-        
-        if re.search(r'_error|error_|Error\w+', stripped):
-            patterns['error_functions'].append({
-                'line': i,
-                'content': stripped
-            })
+        if 'raise' in kinds:
+            patterns['raise_patterns'].append((i, stripped, extract_raise_type(code)))
+        if 'failwith' in kinds:
+            patterns['failwith_patterns'].append((i, stripped))
+        if 'invalid_arg' in kinds:
+            patterns['invalid_arg_patterns'].append((i, stripped))
+        if 'result' in kinds:
+            patterns['result_patterns'].append((i, stripped, extract_result_type(code)))
+        if 'option' in kinds:
+            patterns['option_patterns'].append((i, stripped))
+        if 'try' in kinds and 'with' in kinds:
+            patterns['try_catch_patterns'].append((i, stripped))
+        if 'exception' in kinds:
+            patterns['exception_definitions'].append((i, stripped))
+        if 'error' in kinds:
+            patterns['error_functions'].append((i, stripped))
     
     return patterns
 
@@ -120,12 +143,7 @@ def extract_result_type(line: str) -> str:
 
 def find_ml_files(src_dir: str) -> List[str]:
     """找到所有.ml文件"""
-    ml_files = []
-    for root, dirs, files in os.walk(src_dir):
-        for file in files:
-            if file.endswith('.ml'):
-                ml_files.append(os.path.join(root, file))
-    return ml_files
+    return load_source_index(src_dir).paths()
 
 def analyze_error_consistency(src_dir: str):
     """分析错误处理一致性"""
@@ -146,12 +164,12 @@ def analyze_error_consistency(src_dir: str):
         file_patterns[file_path] = patterns
         
         # 统计异常类型
-        for raise_pattern in patterns['raise_patterns']:
-            all_patterns['raise_types'][raise_pattern['type']] += 1
+        for _, _, raise_type in patterns['raise_patterns']:
+            all_patterns['raise_types'][raise_type] += 1
         
         # 统计Result使用模式
-        for result_pattern in patterns['result_patterns']:
-            all_patterns['result_usage'][result_pattern['result_type']] += 1
+        for _, _, result_type in patterns['result_patterns']:
+            all_patterns['result_usage'][result_type] += 1
         
         # 收集错误处理风格
         file_short = os.path.basename(file_path)
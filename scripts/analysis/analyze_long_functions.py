@@ -10,6 +10,8 @@ import sys
 from typing import List, Tuple, Dict
 from dataclasses import dataclass
 
+from ocaml_source_index import load_source_index, read_source
+
 @dataclass
 class FunctionInfo:
     name: str
@@ -18,6 +20,7 @@ class FunctionInfo:
     end_line: int
     line_count: int
     function_type: str = ""
+    parent: str = ""  # 外层定义名（嵌套定义所属的函数或模块），顶层定义为空
     
     @property
     def priority(self) -> str:
@@ -29,121 +32,50 @@ class FunctionInfo:
             return "MEDIUM"
 
 def find_functions_in_file(file_path: str) -> List[FunctionInfo]:
-    """分析单个OCaml文件中的函数"""
+    """分析单个OCaml文件中的函数
+
+    函数范围来自共享源码索引的定义表：定义表在一次基于栈的扫描中得到所有定义的范围，
+    嵌套定义（子模块中的定义、let ... in 局部函数）通过 parent 归属到外层定义，
+    不再从每个 let 向前扫描到函数结尾。
+    """
     functions = []
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        source = read_source(file_path)
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return functions
     
-    # 正则表达式匹配OCaml函数定义
-    function_patterns = [
-        re.compile(r'^\s*let\s+(?:rec\s+)?(\w+)'),  # let function
-        re.compile(r'^\s*and\s+(\w+)'),              # and function continuation
-        re.compile(r'^\s*let\s+(?:rec\s+)?(\w+)\s*=\s*function'),  # pattern matching function
-    ]
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        
-        # 跳过注释和空行
-        if line.strip().startswith('(*') or line.strip().startswith('*') or not line.strip():
-            i += 1
-            continue
-            
-        # 查找函数定义
-        function_name = None
-        for pattern in function_patterns:
-            match = pattern.match(line)
-            if match:
-                function_name = match.group(1)
-                break
-        
-        if function_name:
-            start_line = i + 1
-            # 查找函数结束位置
-            end_line = find_function_end(lines, i)
-            line_count = end_line - start_line + 1
-            
-            if line_count >= 80:  # 只记录80行以上的函数
-                functions.append(FunctionInfo(
-                    name=function_name,
-                    file_path=file_path,
-                    start_line=start_line,
-                    end_line=end_line,
-                    line_count=line_count
-                ))
-            
-            i = end_line
-        else:
-            i += 1
+    definitions = source.definitions
+    for definition in source.function_definitions():
+        if definition.line_count >= 80:  # 只记录80行以上的函数
+            parent = definitions[definition.parent].name if definition.parent != -1 else ""
+            functions.append(FunctionInfo(
+                name=definition.name,
+                file_path=file_path,
+                start_line=definition.start_line,
+                end_line=definition.end_line,
+                line_count=definition.line_count,
+                function_type="局部函数" if definition.local else "",
+                parent=parent
+            ))
     
     return functions
 
-def find_function_end(lines: List[str], start_idx: int) -> int:
-    """查找函数结束位置"""
-    
-    # 简单策略：查找下一个let/and定义或文件结束
-    i = start_idx + 1
-    paren_count = 0
-    bracket_count = 0
-    brace_count = 0
-    in_comment = False
-    
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        # 处理注释
-        if '(*' in line and '*)' not in line:
-            in_comment = True
-        elif '*)' in line:
-            in_comment = False
-            
-        if in_comment:
-            i += 1
-            continue
-            
-        # 计算括号层次
-        paren_count += line.count('(') - line.count(')')
-        bracket_count += line.count('[') - line.count(']')
-        brace_count += line.count('{') - line.count('}')
-        
-        # 查找下一个函数定义
-        if (paren_count <= 0 and bracket_count <= 0 and brace_count <= 0 and
-            (re.match(r'^\s*let\s+', line) or 
-             re.match(r'^\s*and\s+', line) or
-             re.match(r'^\s*type\s+', line) or
-             re.match(r'^\s*module\s+', line) or
-             re.match(r'^\s*open\s+', line) or
-             line == '')):
-            return i
-            
-        i += 1
-    
-    return len(lines) - 1
-
 def analyze_directory(src_path: str) -> List[FunctionInfo]:
     """分析整个src目录"""
     all_functions = []
     
-    for root, dirs, files in os.walk(src_path):
-        for file in files:
-            if file.endswith('.ml'):
-                file_path = os.path.join(root, file)
-                functions = find_functions_in_file(file_path)
-                all_functions.extend(functions)
+    for file_path in load_source_index(src_path).paths():
+        functions = find_functions_in_file(file_path)
+        all_functions.extend(functions)
     
     return all_functions
 
 def get_function_description(func: FunctionInfo) -> str:
     """获取函数的简要描述"""
     try:
-        with open(func.file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        lines = read_source(func.file_path).raw_lines
         
         # 查找函数前的注释
         start_idx = func.start_line - 1
@@ -201,6 +133,8 @@ def main():
         description = get_function_description(func)
         rel_path = os.path.relpath(func.file_path, src_path)
         print(f"函数名: {func.name}")
+        if func.parent:
+            print(f"所属定义: {func.parent}")
         print(f"文件路径: {rel_path}")
         print(f"行数: {func.line_count} 行 (第{func.start_line}-{func.end_line}行)")
         print(f"描述: {description}")
@@ -212,6 +146,8 @@ def main():
         description = get_function_description(func)
         rel_path = os.path.relpath(func.file_path, src_path)
         print(f"函数名: {func.name}")
+        if func.parent:
+            print(f"所属定义: {func.parent}")
         print(f"文件路径: {rel_path}")
         print(f"行数: {func.line_count} 行 (第{func.start_line}-{func.end_line}行)")
         print(f"描述: {description}")
@@ -6,10 +6,11 @@ comprehensive OCaml function length analyzer
 
 import os
 import re
-import glob
 from typing import List, Tuple, Dict
 from dataclasses import dataclass
 
+from ocaml_source_index import load_source_index, read_source
+
 @dataclass
 class FunctionInfo:
     name: str
@@ -19,172 +20,44 @@ class FunctionInfo:
     line_count: int
     code_lines: int  # 不包含注释和空行的行数
 
-def strip_comments_and_empty_lines(lines: List[str]) -> List[str]:
-    """移除注释和空行，返回只包含代码的行"""
-    code_lines = []
-    in_comment = False
-    
-    for line in lines:
-        stripped = line.strip()
-        
-        # 跳过空行
-        if not stripped:
-            continue
-            
-        # 处理多行注释 (* ... *)
-        if '(*' in stripped and '*)' in stripped:
-            # 单行注释
-            before_comment = stripped[:stripped.find('(*')]
-            after_comment = stripped[stripped.rfind('*)') + 2:]
-            cleaned_line = before_comment + after_comment
-            if cleaned_line.strip():
-                code_lines.append(cleaned_line.strip())
-            continue
-        elif '(*' in stripped:
-            # 多行注释开始
-            in_comment = True
-            before_comment = stripped[:stripped.find('(*')]
-            if before_comment.strip():
-                code_lines.append(before_comment.strip())
-            continue
-        elif '*)' in stripped and in_comment:
-            # 多行注释结束
-            in_comment = False
-            after_comment = stripped[stripped.rfind('*)') + 2:]
-            if after_comment.strip():
-                code_lines.append(after_comment.strip())
-            continue
-        elif in_comment:
-            # 在多行注释中
-            continue
-            
-        # 处理单行注释 //
-        if '//' in stripped:
-            before_comment = stripped[:stripped.find('//')]
-            if before_comment.strip():
-                code_lines.append(before_comment.strip())
-            continue
-            
-        # 普通代码行
-        code_lines.append(stripped)
-    
-    return code_lines
-
-def find_function_end(lines: List[str], start_idx: int, func_name: str) -> int:
-    """
-    找到函数定义的结束位置
-    使用括号匹配来确定函数边界
-    """
-    paren_count = 0
-    brace_count = 0
-    bracket_count = 0
-    in_string = False
-    in_char = False
-    
-    i = start_idx
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        if not line:
-            i += 1
-            continue
-            
-        # 简单的字符串和字符处理
-        j = 0
-        while j < len(line):
-            char = line[j]
-            
-            if not in_string and not in_char:
-                if char == '"' and (j == 0 or line[j-1] != '\\'):
-                    in_string = True
-                elif char == "'" and (j == 0 or line[j-1] != '\\'):
-                    in_char = True
-                elif char == '(':
-                    paren_count += 1
-                elif char == ')':
-                    paren_count -= 1
-                elif char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                elif char == '[':
-                    bracket_count += 1
-                elif char == ']':
-                    bracket_count -= 1
-            else:
-                if in_string and char == '"' and (j == 0 or line[j-1] != '\\'):
-                    in_string = False
-                elif in_char and char == "'" and (j == 0 or line[j-1] != '\\'):
-                    in_char = False
-            
-            j += 1
-        
-        # 检查是否到达函数结束
-        if paren_count == 0 and brace_count == 0 and bracket_count == 0:
-            # 检查是否是下一个顶级定义
-            if re.match(r'^\s*(let|type|module|val|open|include)\s+', line) and i > start_idx:
-                return i - 1
-            
-            # 检查是否遇到了 'in' 关键字（对于 let ... in 结构）
-            if re.search(r'\bin\s*$', line) or line.endswith(' in'):
-                return i
-        
-        i += 1
-    
-    return len(lines) - 1
-
 def analyze_ocaml_file(file_path: str) -> List[FunctionInfo]:
     """分析单个OCaml文件，返回函数信息列表"""
     if not os.path.exists(file_path):
         return []
         
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        source = read_source(file_path)
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return []
     
     functions = []
     
-    # 查找函数定义
-    for i, line in enumerate(lines):
-        stripped = line.strip()
+    # 函数边界来自共享源码索引的定义表（已正确处理注释、字符串、let ... in 和子模块）
+    for definition in source.function_definitions():
+        stripped = source.lines[definition.start_line - 1].strip()
+        
+        # 跳过简单的值绑定 (let x = 42)
+        if '=' in stripped and not re.search(r'\bfun\b|\bfunction\b|->|\bif\b|\bmatch\b', stripped):
+            # 检查是否是简单赋值
+            after_equals = stripped[stripped.find('=') + 1:].strip()
+            if len(after_equals.split()) <= 3 and not '(' in after_equals:
+                continue
         
-        # 匹配 let 函数定义
-        # let function_name = ...
-        # let rec function_name = ...
-        # let function_name param1 param2 = ...
+        total_lines = definition.line_count
+        # 计算代码行数（不包含注释和空行）
+        code_line_count = source.code_line_count(definition.start_line, definition.end_line)
         
-        let_match = re.match(r'^\s*let\s+(rec\s+)?([a-zA-Z_][a-zA-Z0-9_\']*)', stripped)
-        if let_match:
-            func_name = let_match.group(2)
-            
-            # 跳过简单的值绑定 (let x = 42)
-            if '=' in stripped and not re.search(r'\bfun\b|\bfunction\b|->|\bif\b|\bmatch\b', stripped):
-                # 检查是否是简单赋值
-                after_equals = stripped[stripped.find('=') + 1:].strip()
-                if len(after_equals.split()) <= 3 and not '(' in after_equals:
-                    continue
-            
-            end_line = find_function_end(lines, i, func_name)
-            total_lines = end_line - i + 1
-            
-            # 计算代码行数（不包含注释和空行）
-            function_lines = lines[i:end_line + 1]
-            code_lines = strip_comments_and_empty_lines(function_lines)
-            code_line_count = len(code_lines)
-            
-            # 只记录超过一定长度的函数
-            if total_lines >= 5 or code_line_count >= 3:
-                functions.append(FunctionInfo(
-                    name=func_name,
-                    file_path=file_path,
-                    start_line=i + 1,  # 1-based line numbers
-                    end_line=end_line + 1,
-                    line_count=total_lines,
-                    code_lines=code_line_count
-                ))
+        # 只记录超过一定长度的函数
+        if total_lines >= 5 or code_line_count >= 3:
+            functions.append(FunctionInfo(
+                name=definition.name,
+                file_path=file_path,
+                start_line=definition.start_line,
+                end_line=definition.end_line,
+                line_count=total_lines,
+                code_lines=code_line_count
+            ))
     
     return functions
 
@@ -200,7 +73,7 @@ def main():
     ]
     
     # 添加所有src目录下的.ml文件
-    all_ml_files = glob.glob("src/**/*.ml", recursive=True)
+    all_ml_files = load_source_index("src").paths()
     
     # 合并文件列表并去重
     files_to_analyze = list(set(target_files + all_ml_files))
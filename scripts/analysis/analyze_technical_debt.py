@@ -7,12 +7,158 @@
 import os
 import re
 import sys
-from typing import List, Dict, Tuple, Set
+import argparse
+import multiprocessing
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Set, Optional
 from collections import defaultdict
 
+from ocaml_source_index import STRUCTURE_KEYWORDS, SourceFile, load_source_index, read_source
+
+# 各检测器的结果类别，也是合并进分析器实例列表的属性名
+ISSUE_CATEGORIES = ('long_functions', 'complex_patterns', 'nested_issues',
+                    'duplicate_patterns', 'error_handling_issues')
+
+
+@dataclass
+class FileDebtResult:
+    """单个文件的技术债务检测结果（可pickle，由工作进程返回给主进程合并）"""
+    file: str
+    long_functions: List[Dict] = field(default_factory=list)
+    complex_patterns: List[Dict] = field(default_factory=list)
+    nested_issues: List[Dict] = field(default_factory=list)
+    duplicate_patterns: List[Dict] = field(default_factory=list)
+    error_handling_issues: List[Dict] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+# match 表达式扫描使用的记号：标识符/关键字、数组括号、|| 与 |、;; 以及括号
+MATCH_TOKEN_PATTERN = re.compile(r"[^\W\d][\w']*|\[\||\|\]|\|\||\||;;|[()\[\]{}]")
+
+# 各闭合记号对应的开启记号
+MATCH_CLOSERS = {
+    ')': ('(',), ']': ('[',), '}': ('{',), '|]': ('[|',), 'done': ('do',),
+    'end': ('struct', 'sig', 'object', 'begin')
+}
+MATCH_OPENERS = frozenset({'(', '[', '{', '[|', 'do', 'struct', 'sig', 'object', 'begin'})
+
+# 出现在结构层定义行首时结束该结构中所有未闭合表达式的关键字
+ITEM_KEYWORDS = STRUCTURE_KEYWORDS | {'let', 'and'}
+
+
+@dataclass
+class MatchExpression:
+    """一个 match 表达式的范围和复杂度（分支数包含嵌套 match 的分支）"""
+    start_line: int
+    end_line: int = 0
+    branches: int = 0
+    nesting_level: int = 1
+
+
+def scan_match_expressions(source: SourceFile) -> List[MatchExpression]:
+    """单遍扫描已去除注释和字符串的代码，同时求出每个 match 表达式的范围、分支数和嵌套层次
+
+    用栈跟踪括号、begin/end、struct/sig/object、let ... in、try ... with 与 match ... with：
+    match 在包围它的括号闭合、所属 let 遇到 in、或到达下一个结构层定义（由定义表给出）时结束，
+    嵌套的 match 在结束时把分支数和嵌套层次汇总给外层。每个记号只处理一次。
+    """
+    expressions: List[MatchExpression] = []
+    item_lines = {definition.start_line for definition in source.definitions
+                  if not definition.local}
+    # 栈元素: [种类, 开启记号, match记录, 是否已遇到 with]
+    stack: List[list] = []
+    open_matches: List[MatchExpression] = []
+    last_line = 0
+
+    def pop_frame(line: int) -> None:
+        kind, _, expression, seen_with = stack.pop()
+        if kind != 'match':
+            return
+        open_matches.pop()
+        if not seen_with:
+            return  # 没有 with 的残缺 match 不计入
+        expression.end_line = line
+        expressions.append(expression)
+        if open_matches:
+            outer = open_matches[-1]
+            outer.branches += expression.branches
+            outer.nesting_level = max(outer.nesting_level, expression.nesting_level + 1)
+
+    def unwind_to(depth: int, line: int) -> None:
+        while len(stack) > depth:
+            pop_frame(line)
+
+    def structure_depth() -> int:
+        """最内层 struct/sig/object 之上的栈深度"""
+        for index in range(len(stack) - 1, -1, -1):
+            if stack[index][1] in ('struct', 'sig', 'object'):
+                return index + 1
+        return 0
+
+    for line_number, code_line in enumerate(source.code_lines, 1):
+        first = True
+        for token_match in MATCH_TOKEN_PATTERN.finditer(code_line):
+            token = token_match.group(0)
+            if first and line_number in item_lines and token in ITEM_KEYWORDS:
+                unwind_to(structure_depth(), last_line)
+            first = False
+
+            if token == '|':
+                if open_matches:
+                    open_matches[-1].branches += 1
+            elif token == 'match':
+                expression = MatchExpression(start_line=line_number)
+                stack.append(['match', token, expression, False])
+                open_matches.append(expression)
+            elif token == 'try':
+                stack.append(['try', token, None, False])
+            elif token == 'with':
+                if stack and stack[-1][0] in ('match', 'try'):
+                    stack[-1][3] = True
+            elif token == 'let':
+                stack.append(['let', token, None, False])
+            elif token == 'in':
+                # 关闭当前括号内最近的 let 及其中未闭合的 match
+                for index in range(len(stack) - 1, -1, -1):
+                    kind = stack[index][0]
+                    if kind == 'let':
+                        unwind_to(index, line_number)
+                        break
+                    if kind == 'bracket':
+                        break
+            elif token == ';;':
+                unwind_to(structure_depth(), line_number)
+            elif token in MATCH_OPENERS:
+                stack.append(['bracket', token, None, False])
+            elif token in MATCH_CLOSERS:
+                openers = MATCH_CLOSERS[token]
+                for index in range(len(stack) - 1, -1, -1):
+                    if stack[index][0] == 'bracket' and stack[index][1] in openers:
+                        unwind_to(index, line_number)
+                        break
+            last_line = line_number
+
+    unwind_to(0, last_line)
+    expressions.sort(key=lambda expression: expression.start_line)
+    return expressions
+
+
+# 工作进程内复用的分析器（检测器本身不依赖实例状态）
+_worker_analyzer: Optional['TechnicalDebtAnalyzer'] = None
+
+
+def analyze_file_task(filepath: str) -> FileDebtResult:
+    """进程池任务：分析单个文件并返回结果包"""
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = TechnicalDebtAnalyzer("")
+    return _worker_analyzer.analyze_file(filepath)
+
+
 class TechnicalDebtAnalyzer:
-    def __init__(self, src_dir: str):
+    def __init__(self, src_dir: str, jobs: int = 1):
         self.src_dir = src_dir
+        self.jobs = jobs
         self.long_functions = []
         self.complex_patterns = []
         self.duplicate_patterns = []
@@ -20,44 +166,59 @@ class TechnicalDebtAnalyzer:
         self.error_handling_issues = []
         
     def analyze_all(self):
-        """分析所有技术债务问题"""
+        """分析所有技术债务问题；jobs > 1 时在进程池中逐文件并行检测"""
         print("开始分析骆言项目技术债务...")
         
-        for root, dirs, files in os.walk(self.src_dir):
-            for file in files:
-                if file.endswith('.ml'):
-                    filepath = os.path.join(root, file)
-                    self.analyze_file(filepath)
+        # 按路径排序并按序合并，保证报告顺序与进程数无关
+        filepaths = sorted(load_source_index(self.src_dir).paths())
+        if self.jobs <= 1:
+            results = map(self.analyze_file, filepaths)
+            for result in results:
+                self.merge_result(result)
+        else:
+            with multiprocessing.Pool(self.jobs) as pool:
+                for result in pool.imap(analyze_file_task, filepaths, chunksize=8):
+                    self.merge_result(result)
         
         self.generate_report()
     
-    def analyze_file(self, filepath: str):
-        """分析单个文件"""
+    def merge_result(self, result: FileDebtResult):
+        """把单个文件的结果包合并到报告列表"""
+        if result.error is not None:
+            print(f"分析文件 {result.file} 时出错: {result.error}")
+        for category in ISSUE_CATEGORIES:
+            getattr(self, category).extend(getattr(result, category))
+    
+    def analyze_file(self, filepath: str) -> FileDebtResult:
+        """分析单个文件，返回该文件的结果包"""
+        result = FileDebtResult(file=filepath)
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                lines = content.split('\n')
+            source = read_source(filepath)
+            content = source.text
+            lines = source.lines
                 
             # 分析长函数
-            self.find_long_functions(filepath, lines)
+            result.long_functions = self.find_long_functions(filepath, lines)
             
             # 分析复杂模式匹配
-            self.find_complex_patterns(filepath, content)
+            result.complex_patterns = self.find_complex_patterns(filepath, source)
             
             # 分析深层嵌套
-            self.find_nested_issues(filepath, lines)
+            result.nested_issues = self.find_nested_issues(filepath, lines)
             
             # 分析重复代码
-            self.find_duplicate_patterns(filepath, content)
+            result.duplicate_patterns = self.find_duplicate_patterns(filepath, content)
             
             # 分析错误处理
-            self.find_error_handling_issues(filepath, content)
+            result.error_handling_issues = self.find_error_handling_issues(filepath, content)
             
         except Exception as e:
-            print(f"分析文件 {filepath} 时出错: {e}")
+            result.error = str(e)
+        return result
     
-    def find_long_functions(self, filepath: str, lines: List[str]):
+    def find_long_functions(self, filepath: str, lines: List[str]) -> List[Dict]:
         """查找超过50行的长函数"""
+        long_functions = []
         in_function = False
         function_start = 0
         function_name = ""
@@ -84,7 +245,7 @@ class TechnicalDebtAnalyzer:
                     
                     function_length = i - function_start + 1
                     if function_length > 50:
-                        self.long_functions.append({
+                        long_functions.append({
                             'file': filepath,
                             'function': function_name,
                             'start_line': function_start,
@@ -95,6 +256,8 @@ class TechnicalDebtAnalyzer:
                     in_function = False
                     function_name = ""
                     brace_count = 0
+        
+        return long_functions
     
     def calculate_complexity(self, function_lines: List[str]) -> int:
         """计算函数复杂度"""
@@ -114,88 +277,43 @@ class TechnicalDebtAnalyzer:
         
         return complexity
     
-    def find_complex_patterns(self, filepath: str, content: str):
-        """查找复杂的模式匹配"""
-        # 查找深层嵌套的match表达式
-        match_patterns = re.finditer(r'match\s+.*?\s+with', content, re.DOTALL)
-        
-        for match in match_patterns:
-            start_pos = match.start()
-            lines_before = content[:start_pos].count('\n')
-            
-            # 计算match表达式的复杂度
-            match_content = self.extract_match_content(content, match.start())
-            if match_content:
-                branch_count = match_content.count('|')
-                nesting_level = self.calculate_nesting_level(match_content)
-                
-                if branch_count > 10 or nesting_level > 3:
-                    self.complex_patterns.append({
-                        'file': filepath,
-                        'line': lines_before + 1,
-                        'branches': branch_count,
-                        'nesting_level': nesting_level,
-                        'type': 'complex_match'
-                    })
-    
-    def extract_match_content(self, content: str, start_pos: int) -> str:
-        """提取match表达式的内容"""
-        # 简化版本，实际实现需要更复杂的解析
-        end_pos = start_pos
-        brace_count = 0
-        in_match = False
+    def find_complex_patterns(self, filepath: str, source: SourceFile) -> List[Dict]:
+        """查找复杂的模式匹配（分支超过10个或嵌套超过3层的 match 表达式）"""
+        complex_patterns = []
         
-        for i in range(start_pos, len(content)):
-            if content[i:i+4] == 'with':
-                in_match = True
-                continue
-            
-            if in_match:
-                if content[i] == '(':
-                    brace_count += 1
-                elif content[i] == ')':
-                    brace_count -= 1
-                elif content[i:i+3] == 'let' and brace_count == 0:
-                    break
-                end_pos = i
-        
-        return content[start_pos:end_pos]
-    
-    def calculate_nesting_level(self, content: str) -> int:
-        """计算嵌套层次"""
-        max_level = 0
-        current_level = 0
+        for expression in scan_match_expressions(source):
+            if expression.branches > 10 or expression.nesting_level > 3:
+                complex_patterns.append({
+                    'file': filepath,
+                    'line': expression.start_line,
+                    'end_line': expression.end_line,
+                    'branches': expression.branches,
+                    'nesting_level': expression.nesting_level,
+                    'type': 'complex_match'
+                })
         
-        for line in content.split('\n'):
-            stripped = line.strip()
-            if 'match' in stripped:
-                current_level += 1
-                max_level = max(max_level, current_level)
-            elif stripped.startswith('|') and current_level > 0:
-                # 模式匹配分支
-                pass
-            elif stripped == '':
-                if current_level > 0:
-                    current_level -= 1
-        
-        return max_level
+        return complex_patterns
     
-    def find_nested_issues(self, filepath: str, lines: List[str]):
+    def find_nested_issues(self, filepath: str, lines: List[str]) -> List[Dict]:
         """查找深层嵌套问题"""
+        nested_issues = []
         for i, line in enumerate(lines):
             indent_level = len(line) - len(line.lstrip())
             
             # 检测深层嵌套
             if indent_level > 20:  # 超过20个空格的缩进
-                self.nested_issues.append({
+                nested_issues.append({
                     'file': filepath,
                     'line': i + 1,
                     'indent_level': indent_level,
                     'content': line.strip()[:100]  # 前100个字符
                 })
+        
+        return nested_issues
     
-    def find_duplicate_patterns(self, filepath: str, content: str):
+    def find_duplicate_patterns(self, filepath: str, content: str) -> List[Dict]:
         """查找重复代码模式"""
+        duplicate_patterns = []
         # 查找重复的错误处理模式
         error_patterns = [
             r'failwith\s+"[^"]*"',
@@ -206,14 +324,16 @@ class TechnicalDebtAnalyzer:
         for pattern in error_patterns:
             matches = re.findall(pattern, content, re.DOTALL)
             if len(matches) > 3:  # 出现超过3次
-                self.duplicate_patterns.append({
+                duplicate_patterns.append({
                     'file': filepath,
                     'pattern': 'error_handling',
                     'count': len(matches),
                     'example': matches[0][:100]
                 })
+        
+        return duplicate_patterns
     
-    def find_error_handling_issues(self, filepath: str, content: str):
+    def find_error_handling_issues(self, filepath: str, content: str) -> List[Dict]:
         """分析错误处理一致性"""
         # 查找不一致的错误处理模式
         error_handling_styles = {
@@ -226,11 +346,12 @@ class TechnicalDebtAnalyzer:
         # 如果使用了多种错误处理风格
         used_styles = sum(1 for count in error_handling_styles.values() if count > 0)
         if used_styles > 2:
-            self.error_handling_issues.append({
+            return [{
                 'file': filepath,
                 'issue': 'inconsistent_error_handling',
                 'styles': {k: v for k, v in error_handling_styles.items() if v > 0}
-            })
+            }]
+        return []
     
     def generate_report(self):
         """生成技术债务报告"""
@@ -341,6 +462,16 @@ class TechnicalDebtAnalyzer:
         
         print("\n" + "="*80)
 
+def main():
+    parser = argparse.ArgumentParser(description='骆言项目技术债务分析工具')
+    parser.add_argument('--root', default="/home/zc/chinese-ocaml-worktrees/chinese-ocaml/src",
+                        help='要分析的源码目录')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='并行分析文件的进程数（默认1，即串行）')
+    args = parser.parse_args()
+
+    analyzer = TechnicalDebtAnalyzer(args.root, jobs=args.jobs)
+    analyzer.analyze_all()
+
 if __name__ == "__main__":
-    analyzer = TechnicalDebtAnalyzer("/home/zc/chinese-ocaml-worktrees/chinese-ocaml/src")
-    analyzer.analyze_all()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,88 +1,36 @@
 #!/usr/bin/env python3
 
-import re
 import os
 
-def find_function_boundaries(lines, start_line):
-    """Find the end of a function definition by counting balanced parentheses and other constructs"""
-    
-    # Simple approach: find the next function definition
-    current_line = start_line
-    
-    # Count various brackets
-    paren_count = 0
-    in_string = False
-    in_comment = False
-    
-    for i in range(start_line, len(lines)):
-        line = lines[i].strip()
-        
-        # Skip empty lines
-        if not line:
-            continue
-            
-        # Check for next function definition
-        if i > start_line and (line.startswith('let ') or line.startswith('and ')):
-            return i - 1
-            
-        # Look for structural markers that indicate function end
-        if line.startswith('(* ') or line.startswith('(** '):
-            # Start of another function or module
-            if i > start_line + 3:  # Allow some buffer
-                return i - 1
-                
-        current_line = i
-    
-    return current_line
+from ocaml_source_index import load_source_index, read_source
 
 def analyze_file(filepath):
     """Analyze a single OCaml file for long functions"""
     
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        source = read_source(filepath)
     except Exception as e:
         print(f"Error reading {filepath}: {e}")
         return []
     
     functions = []
     
-    for i, line in enumerate(lines):
-        # Match function definitions
-        match = re.match(r'^(let\s+(rec\s+)?|and\s+)([a-zA-Z_][a-zA-Z0-9_\']*)', line.strip())
-        if match:
-            func_name = match.group(3)
-            
-            # Find function end
-            end_line = find_function_boundaries(lines, i)
-            
-            # Count actual lines of code (excluding comments and empty lines)
-            func_lines = lines[i:end_line + 1]
-            code_lines = []
-            
-            for func_line in func_lines:
-                stripped = func_line.strip()
-                # Skip empty lines
-                if not stripped:
-                    continue
-                # Skip comment lines
-                if stripped.startswith('(*') or stripped.startswith('(*'):
-                    continue
-                code_lines.append(stripped)
-            
-            total_lines = end_line - i + 1
-            code_line_count = len(code_lines)
-            
-            # Only include functions that are reasonably long
-            if total_lines >= 20 or code_line_count >= 15:
-                functions.append({
-                    'name': func_name,
-                    'file': filepath,
-                    'start_line': i + 1,
-                    'end_line': end_line + 1,
-                    'total_lines': total_lines,
-                    'code_lines': code_line_count
-                })
+    # Function boundaries come from the shared definition table of the source index
+    for definition in source.function_definitions():
+        total_lines = definition.line_count
+        # Count actual lines of code (excluding comments and empty lines)
+        code_line_count = source.code_line_count(definition.start_line, definition.end_line)
+        
+        # Only include functions that are reasonably long
+        if total_lines >= 20 or code_line_count >= 15:
+            functions.append({
+                'name': definition.name,
+                'file': filepath,
+                'start_line': definition.start_line,
+                'end_line': definition.end_line,
+                'total_lines': total_lines,
+                'code_lines': code_line_count
+            })
     
     return functions
 
@@ -106,6 +54,9 @@ def main():
         'src/refactoring_analyzer.ml'
     ]
     
+    # Load the shared source index so read_source reuses its definition tables
+    load_source_index("src")
+    
     all_functions = []
     
     for filepath in target_files:
@@ -5,97 +5,36 @@
 
 import os
 import re
-import glob
 from typing import List, Dict, Tuple
 
+from ocaml_source_index import load_source_index, read_source
+
 def analyze_ocaml_file(file_path: str) -> List[Dict]:
     """分析单个OCaml文件中的函数"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        source = read_source(file_path)
     except Exception as e:
         print(f"无法读取文件 {file_path}: {e}")
         return []
     
-    functions = []
-    current_function = None
-    
-    for line_num, line in enumerate(lines, 1):
-        stripped = line.strip()
-        
-        # 检测函数定义开始
-        let_match = re.match(r'^let\s+(rec\s+)?([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
-        and_match = re.match(r'^and\s+([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
-        
-        if let_match:
-            # 如果正在分析一个函数，先保存它
-            if current_function:
-                functions.append(current_function)
-            
-            # 开始新函数
-            func_name = let_match.group(2)
-            current_function = {
-                'name': func_name,
-                'start_line': line_num,
-                'lines': [line],
-                'file': file_path
-            }
-        elif and_match:
-            # 如果正在分析一个函数，先保存它
-            if current_function:
-                functions.append(current_function)
-            
-            # 开始新函数
-            func_name = and_match.group(1)
-            current_function = {
-                'name': func_name,
-                'start_line': line_num,
-                'lines': [line],
-                'file': file_path
-            }
-        elif current_function:
-            # 检测函数结束条件
-            if stripped.startswith('let ') or stripped.startswith('and ') or stripped.startswith('type ') or stripped.startswith('module ') or stripped.startswith('exception '):
-                # 新的定义开始，当前函数结束
-                functions.append(current_function)
-                current_function = None
-                
-                # 检查是否是新的函数定义
-                let_match = re.match(r'^let\s+(rec\s+)?([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
-                and_match = re.match(r'^and\s+([a-zA-Z_\u4e00-\u9fff][a-zA-Z0-9_\u4e00-\u9fff]*)', stripped)
-                
-                if let_match:
-                    func_name = let_match.group(2)
-                    current_function = {
-                        'name': func_name,
-                        'start_line': line_num,
-                        'lines': [line],
-                        'file': file_path
-                    }
-                elif and_match:
-                    func_name = and_match.group(1)
-                    current_function = {
-                        'name': func_name,
-                        'start_line': line_num,
-                        'lines': [line],
-                        'file': file_path
-                    }
-            else:
-                # 继续当前函数
-                current_function['lines'].append(line)
-    
-    # 处理文件末尾的函数
-    if current_function:
-        functions.append(current_function)
-    
-    return functions
+    # 函数边界来自共享源码索引的定义表
+    lines = source.raw_lines
+    return [
+        {
+            'name': definition.name,
+            'start_line': definition.start_line,
+            'lines': lines[definition.start_line - 1:definition.end_line],
+            'file': file_path
+        }
+        for definition in source.function_definitions()
+    ]
 
 def find_long_functions(src_dir: str, min_lines: int = 100) -> List[Dict]:
     """查找长函数"""
     all_functions = []
     
     # 查找所有.ml文件
-    ml_files = glob.glob(os.path.join(src_dir, "**/*.ml"), recursive=True)
+    ml_files = load_source_index(src_dir).paths()
     
     for file_path in ml_files:
         if '/test/' in file_path or 'test_' in os.path.basename(file_path):
@@ -4,100 +4,31 @@ Systematic search for long OCaml functions in the codebase.
 """
 
 import os
-import re
 import sys
 from pathlib import Path
 from typing import List, Tuple, Dict
 
-def count_lines_in_function(lines: List[str], start_idx: int, function_name: str) -> int:
-    """Count lines in a function starting from the let declaration."""
-    current_idx = start_idx
-    indent_level = 0
-    paren_level = 0
-    bracket_level = 0
-    brace_level = 0
-    in_string = False
-    string_char = None
-    
-    while current_idx < len(lines):
-        line = lines[current_idx].strip()
-        
-        # Skip empty lines and comments
-        if not line or line.startswith('(*'):
-            current_idx += 1
-            continue
-            
-        # Track string boundaries
-        i = 0
-        while i < len(line):
-            char = line[i]
-            if not in_string:
-                if char == '"' or char == "'":
-                    in_string = True
-                    string_char = char
-                elif char == '(':
-                    paren_level += 1
-                elif char == ')':
-                    paren_level -= 1
-                elif char == '[':
-                    bracket_level += 1
-                elif char == ']':
-                    bracket_level -= 1
-                elif char == '{':
-                    brace_level += 1
-                elif char == '}':
-                    brace_level -= 1
-            else:
-                if char == string_char and (i == 0 or line[i-1] != '\\'):
-                    in_string = False
-                    string_char = None
-            i += 1
-        
-        # Check for function end conditions
-        if not in_string and paren_level == 0 and bracket_level == 0 and brace_level == 0:
-            # Check if we hit a new top-level declaration
-            if (line.startswith('let ') or 
-                line.startswith('val ') or 
-                line.startswith('type ') or 
-                line.startswith('module ') or 
-                line.startswith('open ') or
-                line.startswith('exception ')):
-                if current_idx > start_idx:  # Don't count the starting line itself
-                    break
-        
-        current_idx += 1
-    
-    return current_idx - start_idx
+from ocaml_source_index import load_source_index, read_source
 
 def find_long_functions_in_file(file_path: str, min_lines: int = 100) -> List[Tuple[str, int, str]]:
     """Find long functions in a single OCaml file."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        source = read_source(file_path)
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return []
     
+    lines = source.raw_lines
     long_functions = []
     
-    for i, line in enumerate(lines):
-        # Look for function definitions
-        line_stripped = line.strip()
-        
-        # Match various function definition patterns
-        let_match = re.match(r'let\s+(\w+)', line_stripped)
-        let_rec_match = re.match(r'let\s+rec\s+(\w+)', line_stripped)
+    # Function boundaries come from the shared definition table of the source index
+    for definition in source.function_definitions():
+        line_count = definition.line_count
         
-        if let_match or let_rec_match:
-            func_name = let_match.group(1) if let_match else let_rec_match.group(1)
-            
-            # Count lines in this function
-            line_count = count_lines_in_function(lines, i, func_name)
-            
-            if line_count >= min_lines:
-                # Get a brief description of why it's long
-                description = analyze_function_complexity(lines, i, line_count)
-                long_functions.append((func_name, line_count, description))
+        if line_count >= min_lines:
+            # Get a brief description of why it's long
+            description = analyze_function_complexity(lines, definition.start_line - 1, line_count)
+            long_functions.append((definition.name, line_count, description))
     
     return long_functions
 
@@ -157,7 +88,7 @@ def main():
     total_long_functions = 0
     
     # Find all .ml files in src directory
-    for ml_file in src_dir.glob("**/*.ml"):
+    for ml_file in map(Path, load_source_index(str(src_dir)).paths()):
         # Skip generated files and data files
         if (any(part.startswith("_build") for part in ml_file.parts) or
             ml_file.suffix == ".pp.ml" or
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+流式JSON Lines报告写出器
+
+分析脚本原先把全部结果攒在内存里，最后一次性 json.dump(indent=2)。
+本模块改为每产生一条发现就写出一行JSON记录，最后再写一条汇总记录：
+
+    {"record": "duplication", "files": [...], ...}
+    {"record": "duplication", ...}
+    {"record": "summary", "total_duplications": 42, ...}
+
+每条记录都带 "record" 字段说明类型，汇总记录固定为最后一行，
+下游工具可以边扫描边消费（如 tail -f），无需等待整个分析结束。
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, TextIO, Union
+
+SUMMARY_RECORD = "summary"
+
+
+def jsonl_path(output: Union[str, Path]) -> str:
+    """把 .json 输出路径换成对应的 .jsonl 路径（其他后缀原样保留）"""
+    output = str(output)
+    if output.endswith('.json'):
+        return output + 'l'
+    return output
+
+
+class JsonlReportWriter:
+    """逐条写出JSON Lines记录；可用作上下文管理器"""
+
+    def __init__(self, output: Union[str, Path, TextIO]):
+        if output == '-':
+            self.stream: TextIO = sys.stdout
+            self.owns_stream = False
+        elif hasattr(output, 'write'):
+            self.stream = output
+            self.owns_stream = False
+        else:
+            directory = os.path.dirname(str(output))
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 行缓冲：每写完一行即刷新，消费者可以实时读取
+            self.stream = open(output, 'w', encoding='utf-8', buffering=1)
+            self.owns_stream = True
+        self.path: Optional[str] = None if not self.owns_stream else str(output)
+        self.counts: Dict[str, int] = {}
+        self.encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def write(self, record_type: str, record: Dict[str, Any]) -> None:
+        """写出一条发现记录"""
+        line = self.encoder.encode({'record': record_type, **record})
+        self.stream.write(line + '\n')
+        self.counts[record_type] = self.counts.get(record_type, 0) + 1
+
+    def write_summary(self, summary: Dict[str, Any]) -> None:
+        """写出汇总记录（附带各类记录的条数），应作为最后一行"""
+        self.write(SUMMARY_RECORD, {**summary, 'record_counts': dict(self.counts)})
+
+    def close(self) -> None:
+        if self.owns_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+    def __enter__(self) -> 'JsonlReportWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
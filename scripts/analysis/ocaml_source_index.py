@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+"""
+骆言项目共享源码索引
+对src/下的OCaml文件只做一次词法扫描，保存行、注释/字符串区间和顶层定义边界，
+并以 mtime+size 为键持久化到磁盘，重复运行时只重新扫描发生变化的文件。
+
+所有 scripts/analysis 下的分析器都通过本模块读取源码，不再各自遍历和读取文件。
+"""
+
+import os
+import re
+import sys
+import bisect
+import pickle
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 索引格式版本，词法规则变化时递增以使旧缓存失效
+INDEX_VERSION = 2
+
+DEFAULT_CACHE_DIR = "_analysis_cache"
+INDEX_FILE_NAME = "ocaml_source_index.pickle"
+
+# 遍历时跳过的目录
+SKIP_DIRS = {'_build', 'output', '.git'}
+
+# 结构项关键字：出现在结构层（不在括号或表达式中）时开始一个新定义
+STRUCTURE_KEYWORDS = frozenset({
+    'type', 'module', 'exception', 'open', 'val', 'external', 'include', 'class'
+})
+
+# 紧跟在这些记号之后的结构项关键字不是新定义
+# （let module / with type / module type / : module type of / | exception 等）
+_NON_ITEM_PRECEDERS = frozenset({'let', 'with', 'module', 'class', ':', '|'})
+
+# 定义名之前可能出现的修饰词
+_NAME_MODIFIERS = frozenset({
+    'rec', 'nonrec', 'type', 'private', 'virtual', 'module', 'open', 'exception', 'mutable'
+})
+
+# 定义扫描使用的记号：标识符/关键字、字符字面量、;; 以及括号和少量分隔符
+_DEF_TOKEN_RE = re.compile(r"[^\W\d][\w']*|'(?:\\[^'\n]{1,4}|[^\\'\n])'|;;|[()\[\]{}:|']")
+
+# 各闭合记号对应的开启记号
+_CLOSERS = {
+    ')': ('(',), ']': ('[',), '}': ('{',), 'done': ('do',),
+    'end': ('struct', 'sig', 'object', 'begin')
+}
+
+# 代码状态下需要关注的起始记号
+_CODE_TOKEN_RE = re.compile(r"\(\*|\"|\{([a-z_]*)\||'")
+# 注释状态下需要关注的记号（注释中的字符串同样需要闭合）
+_COMMENT_TOKEN_RE = re.compile(r"\(\*|\*\)|\"")
+_IDENT_CHAR_RE = re.compile(r"[\w一-鿿]")
+
+
+@dataclass
+class Definition:
+    """定义表中的一项（行号从1开始，闭区间）
+
+    结构层定义（包括子模块中的定义）的 local 为 False，结束于下一个同层定义之前的最后一个代码行；
+    let ... in 局部定义的 local 为 True，结束于对应 in 所在行。
+    parent 为外层定义在定义表中的下标，顶层定义为 -1。
+    """
+    name: str
+    kind: str
+    start_line: int
+    end_line: int
+    depth: int = 0
+    parent: int = -1
+    local: bool = False
+
+    @property
+    def line_count(self) -> int:
+        return self.end_line - self.start_line + 1
+
+
+@dataclass
+class SourceFile:
+    """单个源文件的扫描结果"""
+    path: str
+    mtime_ns: int
+    size: int
+    text: str
+    lines: List[str]
+    line_offsets: List[int]
+    comment_spans: List[Tuple[int, int]]
+    string_spans: List[Tuple[int, int]]
+    code_lines: List[str]
+    definitions: List[Definition] = field(default_factory=list)
+
+    @property
+    def raw_lines(self) -> List[str]:
+        """与 readlines() 相同的带换行符的行列表"""
+        raw = [line + '\n' for line in self.lines[:-1]]
+        if self.lines[-1]:
+            raw.append(self.lines[-1])
+        return raw
+
+    def line_of_offset(self, offset: int) -> int:
+        """将字符偏移转换为行号（从1开始）"""
+        return bisect.bisect_right(self.line_offsets, offset)
+
+    def in_comment(self, offset: int) -> bool:
+        return _in_spans(self.comment_spans, offset)
+
+    def in_string(self, offset: int) -> bool:
+        return _in_spans(self.string_spans, offset)
+
+    def is_code_line(self, line_number: int) -> bool:
+        """该行去除注释后是否仍包含代码"""
+        return bool(self.code_lines[line_number - 1].strip())
+
+    def code_line_count(self, start_line: int, end_line: int) -> int:
+        """统计闭区间 [start_line, end_line] 内的代码行数（不含空行和注释行）"""
+        return sum(1 for line in self.code_lines[start_line - 1:end_line] if line.strip())
+
+    def top_level_definitions(self) -> List[Definition]:
+        return [definition for definition in self.definitions if definition.parent == -1]
+
+    def function_definitions(self, top_level_only: bool = False) -> List[Definition]:
+        """具名的 let/and 定义（包括子模块中的定义和局部定义），供长函数分析使用"""
+        return [
+            definition for definition in self.definitions
+            if definition.kind in ('let', 'and') and definition.name
+            and not (top_level_only and definition.parent != -1)
+        ]
+
+
+def _in_spans(spans: List[Tuple[int, int]], offset: int) -> bool:
+    """二分查找偏移是否落在某个区间 [start, end) 内"""
+    index = bisect.bisect_right(spans, (offset, sys.maxsize)) - 1
+    return index >= 0 and spans[index][0] <= offset < spans[index][1]
+
+
+def scan_comments_and_strings(text: str) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """单遍扫描OCaml源码，返回注释区间和字符串区间
+
+    支持嵌套注释、带转义的字符串、{|...|} 引用字符串和字符字面量。
+    """
+    comments = []
+    strings = []
+    length = len(text)
+    pos = 0
+
+    while True:
+        match = _CODE_TOKEN_RE.search(text, pos)
+        if not match:
+            break
+        start = match.start()
+        token = match.group(0)
+
+        if token == '(*':
+            end = _skip_comment(text, start + 2)
+            comments.append((start, end))
+            pos = end
+        elif token == '"':
+            end = _skip_string(text, start + 1)
+            strings.append((start, end))
+            pos = end
+        elif token == "'":
+            pos = _skip_char_literal(text, start)
+        else:
+            # {id| ... |id} 引用字符串
+            terminator = '|' + match.group(1) + '}'
+            end = text.find(terminator, match.end())
+            end = length if end == -1 else end + len(terminator)
+            strings.append((start, end))
+            pos = end
+
+    return comments, strings
+
+
+def _skip_comment(text: str, pos: int) -> int:
+    """跳过（可嵌套的）注释体，返回注释结束后的偏移"""
+    depth = 1
+    while depth:
+        match = _COMMENT_TOKEN_RE.search(text, pos)
+        if not match:
+            return len(text)
+        token = match.group(0)
+        if token == '(*':
+            depth += 1
+            pos = match.end()
+        elif token == '*)':
+            depth -= 1
+            pos = match.end()
+        else:
+            pos = _skip_string(text, match.end())
+    return pos
+
+
+def _skip_string(text: str, pos: int) -> int:
+    """跳过字符串体，返回结束引号之后的偏移"""
+    length = len(text)
+    while pos < length:
+        char = text[pos]
+        if char == '\\':
+            pos += 2
+        elif char == '"':
+            return pos + 1
+        else:
+            pos += 1
+    return length
+
+
+def _skip_char_literal(text: str, pos: int) -> int:
+    """跳过字符字面量；类型变量和带撇号的标识符只前进一个字符"""
+    if pos > 0 and _IDENT_CHAR_RE.match(text, pos - 1):
+        return pos + 1
+    if text.startswith('\\', pos + 1):
+        end = text.find("'", pos + 3)
+        if end != -1 and end - pos <= 10:
+            return end + 1
+    elif pos + 2 < len(text) and text[pos + 2] == "'" and text[pos + 1] != '\n':
+        return pos + 3
+    return pos + 1
+
+
+def _mask_text(text: str, comments: List[Tuple[int, int]], strings: List[Tuple[int, int]]) -> str:
+    """将注释整体和字符串内容替换为空格（保留换行和字符串定界符）"""
+    spans = [(start, end, True) for start, end in comments]
+    spans.extend((start, end, False) for start, end in strings)
+    spans.sort()
+
+    pieces = []
+    pos = 0
+    for start, end, is_comment in spans:
+        if start < pos:
+            continue
+        pieces.append(text[pos:start])
+        if is_comment:
+            pieces.append(_blank(text[start:end]))
+        else:
+            pieces.append(text[start])
+            pieces.append(_blank(text[start + 1:end - 1]))
+            if end - start > 1:
+                pieces.append(text[end - 1])
+        pos = end
+    pieces.append(text[pos:])
+    return ''.join(pieces)
+
+
+def _blank(segment: str) -> str:
+    """保留换行，其余字符替换为空格"""
+    if '\n' not in segment:
+        return ' ' * len(segment)
+    return '\n'.join(' ' * len(part) for part in segment.split('\n'))
+
+
+class _Frame:
+    """定义扫描栈中的一层：结构（文件/struct/sig/object）、括号类结构或等待 in 的 let"""
+    __slots__ = ('kind', 'opener', 'owner', 'entries')
+
+    def __init__(self, kind: str, opener: str = '', owner: int = -1):
+        self.kind = kind
+        self.opener = opener
+        self.owner = owner  # 结构层：本结构中定义的父定义下标
+        # 结构层为各结构项，let层为 let 及其 and 定义：(定义下标, 前一记号所在行)
+        self.entries: List[Tuple[int, int]] = []
+
+
+def scan_definitions(code_lines: List[str]) -> List[Definition]:
+    """单遍扫描已去除注释和字符串内容的代码，生成定义表
+
+    用栈跟踪 struct/sig/object/begin/do 及括号的嵌套；每个 let 先作为待定层压栈，
+    遇到 in 时弹出为局部定义，遇到同一结构中的下一个结构项、;; 、end 或文件结束时
+    确定为结构层定义。每个记号只处理一次，整体为线性时间。
+    """
+    definitions: List[Definition] = []
+    stack = [_Frame('struct')]
+    previous = ''
+    previous_line = 0
+    awaiting: Optional[Definition] = None  # 等待读取名称的定义
+    skip_ident = False  # 类型变量 'a 的标识符部分不是名称
+
+    def add_definition(kind: str, line: int, parent: int, local: bool) -> int:
+        definitions.append(Definition(name='', kind=kind, start_line=line, end_line=line,
+                                      parent=parent, local=local))
+        return len(definitions) - 1
+
+    def structure_index() -> int:
+        """当前处于结构层（之上只有待定 let）时返回该结构在栈中的下标，否则返回 -1"""
+        for index in range(len(stack) - 1, -1, -1):
+            kind = stack[index].kind
+            if kind == 'struct':
+                return index
+            if kind != 'let':
+                return -1
+        return -1
+
+    def owner_index() -> int:
+        """新定义的父定义：最内层正在定义的 let，或所在结构的所属定义"""
+        for frame in reversed(stack):
+            if frame.kind == 'let':
+                return frame.entries[-1][0]
+            if frame.kind == 'struct':
+                return frame.owner
+        return -1
+
+    def resolve_pending(struct_index: int) -> None:
+        """将结构之上的所有待定 let 确定为该结构的结构层定义"""
+        struct = stack[struct_index]
+        for frame in stack[struct_index + 1:]:
+            for index, boundary in frame.entries:
+                definitions[index].parent = struct.owner
+                definitions[index].local = False
+                struct.entries.append((index, boundary))
+        del stack[struct_index + 1:]
+
+    def close_frame(frame: _Frame, line: int) -> None:
+        if frame.kind == 'let':
+            # 局部定义结束于 in（或异常闭合处）
+            for index, _ in frame.entries:
+                definitions[index].end_line = max(line, definitions[index].start_line)
+        elif frame.kind == 'struct':
+            # 结构项结束于下一个结构项之前的最后一个记号所在行
+            entries = frame.entries
+            for position, (index, _) in enumerate(entries):
+                end = entries[position + 1][1] if position + 1 < len(entries) else line
+                definitions[index].end_line = max(end, definitions[index].start_line)
+
+    for line_number, code_line in enumerate(code_lines, 1):
+        for match in _DEF_TOKEN_RE.finditer(code_line):
+            token = match.group(0)
+
+            if awaiting is not None:
+                if token == "'":
+                    skip_ident = True
+                elif token[0].isalpha() or token[0] == '_' or ord(token[0]) > 127:
+                    if skip_ident:
+                        skip_ident = False
+                    elif token not in _NAME_MODIFIERS:
+                        awaiting.name = token
+                        awaiting = None
+                        previous, previous_line = token, line_number
+                        continue
+                elif not (token in '()' and awaiting.kind in ('type', 'class')):
+                    awaiting = None  # let () = ... 等模式绑定没有名称
+
+            if token == 'let':
+                frame = _Frame('let')
+                index = add_definition('let', line_number, owner_index(), True)
+                frame.entries.append((index, previous_line))
+                stack.append(frame)
+                awaiting = definitions[index]
+            elif token == 'and':
+                top = stack[-1]
+                if top.kind == 'let':
+                    parent = definitions[top.entries[0][0]].parent
+                    index = add_definition('and', line_number, parent, True)
+                    top.entries.append((index, previous_line))
+                    awaiting = definitions[index]
+                elif top.kind == 'struct':
+                    index = add_definition('and', line_number, top.owner, False)
+                    top.entries.append((index, previous_line))
+                    awaiting = definitions[index]
+            elif token == 'in':
+                if stack[-1].kind == 'let':
+                    close_frame(stack.pop(), line_number)
+            elif token in STRUCTURE_KEYWORDS:
+                struct_index = structure_index()
+                if struct_index != -1 and previous not in _NON_ITEM_PRECEDERS:
+                    resolve_pending(struct_index)
+                    struct = stack[struct_index]
+                    index = add_definition(token, line_number, struct.owner, False)
+                    struct.entries.append((index, previous_line))
+                    awaiting = definitions[index]
+            elif token == ';;':
+                struct_index = structure_index()
+                if struct_index != -1:
+                    resolve_pending(struct_index)
+            elif token in ('struct', 'sig', 'object'):
+                # module M = struct ... end 中的定义归属于 M
+                top = stack[-1]
+                if top.kind == 'struct' and top.entries:
+                    owner = top.entries[-1][0]
+                else:
+                    owner = owner_index()
+                stack.append(_Frame('struct', token, owner))
+            elif token in ('(', '[', '{', 'begin', 'do'):
+                stack.append(_Frame('bracket', token))
+            elif token in _CLOSERS:
+                openers = _CLOSERS[token]
+                target = len(stack) - 1
+                while target > 0 and stack[target].opener not in openers:
+                    target -= 1
+                if target > 0:
+                    if structure_index() == target:
+                        resolve_pending(target)
+                    while len(stack) > target:
+                        close_frame(stack.pop(), previous_line)
+
+            previous, previous_line = token, line_number
+
+    # 文件结束：依次关闭所有未闭合的层
+    while True:
+        struct_index = structure_index()
+        if struct_index != -1:
+            resolve_pending(struct_index)
+        if len(stack) == 1:
+            break
+        close_frame(stack.pop(), previous_line)
+    close_frame(stack[0], previous_line)
+
+    for definition in definitions:
+        if definition.parent != -1:
+            definition.depth = definitions[definition.parent].depth + 1
+    return definitions
+
+
+def scan_source(path: str, text: str, mtime_ns: int = 0, size: int = 0) -> SourceFile:
+    """对一份源码做完整扫描"""
+    lines = text.split('\n')
+    line_offsets = [0]
+    for line in lines[:-1]:
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+
+    comments, strings = scan_comments_and_strings(text)
+    code_lines = _mask_text(text, comments, strings).split('\n')
+
+    return SourceFile(
+        path=path,
+        mtime_ns=mtime_ns,
+        size=size,
+        text=text,
+        lines=lines,
+        line_offsets=line_offsets,
+        comment_spans=comments,
+        string_spans=strings,
+        code_lines=code_lines,
+        definitions=scan_definitions(code_lines)
+    )
+
+
+class SourceIndex:
+    """持久化的源码索引"""
+
+    def __init__(self, src_dir: str, cache_dir: Optional[str] = None,
+                 suffixes: Tuple[str, ...] = ('.ml',)):
+        self.root = src_dir
+        self.src_dir = os.path.abspath(src_dir)
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(self.src_dir), DEFAULT_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.suffixes = suffixes
+        self.cache_file = os.path.join(
+            cache_dir, f"{'_'.join(s.strip('.') for s in suffixes)}_{INDEX_FILE_NAME}")
+        self.sources: Dict[str, SourceFile] = {}
+        self.rescanned = 0
+
+    def load(self) -> None:
+        """读取磁盘上的索引，格式版本或目录不匹配时丢弃"""
+        try:
+            with open(self.cache_file, 'rb') as f:
+                stored = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return
+        if stored.get('version') == INDEX_VERSION and stored.get('src_dir') == self.src_dir:
+            self.sources = stored['sources']
+
+    def save(self) -> None:
+        """原子地写回索引"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({
+                'version': INDEX_VERSION,
+                'src_dir': self.src_dir,
+                'sources': self.sources
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.cache_file)
+
+    def refresh(self) -> 'SourceIndex':
+        """遍历源码目录，仅重新扫描 mtime 或 size 变化的文件"""
+        self.load()
+        previous = self.sources
+        current = {}
+        self.rescanned = 0
+
+        for path, stat in self._walk():
+            cached = previous.get(path)
+            if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+                current[path] = cached
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"无法读取文件 {path}: {e}")
+                continue
+            current[path] = scan_source(path, text, stat.st_mtime_ns, stat.st_size)
+            self.rescanned += 1
+
+        changed = self.rescanned > 0 or current.keys() != previous.keys()
+        self.sources = current
+        if changed:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"无法写入源码索引 {self.cache_file}: {e}")
+        return self
+
+    def _walk(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """按稳定顺序遍历源码文件"""
+        for root, dirs, files in os.walk(self.src_dir):
+            dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+            for name in sorted(files):
+                if name.endswith(self.suffixes):
+                    path = os.path.join(root, name)
+                    try:
+                        yield path, os.stat(path)
+                    except OSError:
+                        continue
+
+    def paths(self) -> List[str]:
+        """以调用方给出的目录形式返回文件路径（相对目录仍保持相对）"""
+        return [os.path.join(self.root, os.path.relpath(path, self.src_dir))
+                for path in self.sources]
+
+    def files(self) -> List[SourceFile]:
+        return list(self.sources.values())
+
+    def get(self, path: str) -> Optional[SourceFile]:
+        return self.sources.get(os.path.abspath(str(path)))
+
+
+_loaded_indexes: Dict[Tuple[str, Tuple[str, ...]], SourceIndex] = {}
+
+
+def load_source_index(src_dir: str, suffixes: Tuple[str, ...] = ('.ml',),
+                      cache_dir: Optional[str] = None) -> SourceIndex:
+    """获取（并在本进程内复用）某个源码目录的索引"""
+    key = (os.path.abspath(src_dir), suffixes)
+    index = _loaded_indexes.get(key)
+    if index is None:
+        index = SourceIndex(src_dir, cache_dir=cache_dir, suffixes=suffixes).refresh()
+        _loaded_indexes[key] = index
+    return index
+
+
+def get_source(file_path: str) -> Optional[SourceFile]:
+    """从已加载的索引中查找文件，未收录时返回 None"""
+    for index in _loaded_indexes.values():
+        source = index.get(file_path)
+        if source is not None:
+            return source
+    return None
+
+
+def project_root_for(file_path: str) -> Optional[str]:
+    """向上查找包含 dune-project 的项目根目录"""
+    directory = os.path.dirname(os.path.abspath(str(file_path)))
+    while True:
+        if os.path.isfile(os.path.join(directory, 'dune-project')):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def cache_dir_for(file_path: str) -> str:
+    """文件所属索引的缓存目录；文件不在任何已加载索引中时使用项目根目录下的缓存目录，
+    找不到项目根目录时才使用当前目录下的缓存目录"""
+    for index in _loaded_indexes.values():
+        if index.get(file_path) is not None:
+            return index.cache_dir
+    root = project_root_for(file_path)
+    return os.path.join(root, DEFAULT_CACHE_DIR) if root else os.path.abspath(DEFAULT_CACHE_DIR)
+
+
+def read_source(file_path: str) -> SourceFile:
+    """读取源文件：优先使用已加载的索引，否则直接扫描磁盘文件"""
+    source = get_source(file_path)
+    if source is not None:
+        return source
+    with open(file_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    return scan_source(str(file_path), text)
+
+
+def main():
+    src_dir = sys.argv[1] if len(sys.argv) > 1 else "src"
+    index = SourceIndex(src_dir).refresh()
+    total_lines = sum(len(source.lines) for source in index.files())
+    total_definitions = sum(len(source.top_level_definitions()) for source in index.files())
+    print(f"索引文件: {index.cache_file}")
+    print(f"源文件数: {len(index.sources)}，重新扫描: {index.rescanned}")
+    print(f"总行数: {total_lines}，顶层定义: {total_definitions}")
+
+
+if __name__ == "__main__":
+    main()
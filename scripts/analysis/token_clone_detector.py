@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+词法级代码克隆检测 - 骆言项目专用
+将所有OCaml文件词法化为紧凑的整数记号流，用后缀数组 + LCP 一次性找出
+全部极大重复记号序列，并报告 Type-1（完全相同）和 Type-2（仅标识符/字面量不同）克隆。
+"""
+
+import os
+import re
+import json
+import time
+import bisect
+import argparse
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from ocaml_source_index import load_source_index, read_source
+
+OCAML_KEYWORDS = frozenset({
+    'and', 'as', 'assert', 'begin', 'class', 'constraint', 'do', 'done',
+    'downto', 'else', 'end', 'exception', 'external', 'false', 'for', 'fun',
+    'function', 'functor', 'if', 'in', 'include', 'inherit', 'initializer',
+    'lazy', 'let', 'match', 'method', 'module', 'mutable', 'new', 'nonrec',
+    'object', 'of', 'open', 'or', 'private', 'rec', 'sig', 'struct', 'then',
+    'to', 'true', 'try', 'type', 'val', 'virtual', 'when', 'while', 'with',
+    'land', 'lor', 'lxor', 'lsl', 'lsr', 'asr', 'mod'
+})
+
+# 在去除注释后的文本上词法化；字符串由源码索引的字符串区间单独识别
+TOKEN_PATTERN = re.compile(r"""
+    (?P<ident>[^\W\d][\w']*)
+  | (?P<number>0[xXoObB][0-9a-fA-F_]+|\d[\d_]*(?:\.[\d_]*)?(?:[eE][+-]?\d+)?)
+  | (?P<char>'(?:\\[^'\n]{1,4}|[^\\'\n])')
+  | (?P<op>[!$%&*+\-./:<=>?@^|~#]+)
+  | (?P<other>\S)
+""", re.VERBOSE)
+
+# 规范化记号流中的保留编号
+LOWER_IDENT = 0
+UPPER_IDENT = 1
+LITERAL = 2
+RESERVED_TOKENS = 3
+
+
+@dataclass
+class CloneOccurrence:
+    """克隆类中的一次出现"""
+    file_path: str
+    start_line: int
+    end_line: int
+
+
+@dataclass
+class CloneClass:
+    """一组互为克隆的记号序列"""
+    clone_type: str
+    token_count: int
+    occurrences: List[CloneOccurrence] = field(default_factory=list)
+
+    @property
+    def line_count(self) -> int:
+        return max(occ.end_line - occ.start_line + 1 for occ in self.occurrences)
+
+
+class TokenStream:
+    """全部文件拼接后的整数记号流
+
+    normalized 中标识符和字面量被替换为保留编号，用于 Type-2 匹配；
+    exact 保留每个记号的原始词素编号，用于区分 Type-1。
+    文件之间以互不相同的负数哨兵分隔，保证重复序列不会跨越文件。
+    """
+
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self.normalized = array('i')
+        self.exact = array('i')
+        self.lines = array('I')
+        self.file_paths: List[str] = []
+        self.file_starts: List[int] = []
+
+    def intern(self, lexeme: str) -> int:
+        token_id = self.vocabulary.get(lexeme)
+        if token_id is None:
+            token_id = len(self.vocabulary) + RESERVED_TOKENS
+            self.vocabulary[lexeme] = token_id
+        return token_id
+
+    def add_file(self, file_path: str) -> None:
+        """词法化单个文件并追加到记号流"""
+        source = read_source(file_path)
+        masked = '\n'.join(source.code_lines)
+        text = source.text
+        string_ends = dict(source.string_spans)
+        line_offsets = source.line_offsets
+        intern = self.intern
+        normalized = self.normalized
+        exact = self.exact
+        lines = self.lines
+
+        self.file_paths.append(file_path)
+        self.file_starts.append(len(normalized))
+
+        skip_until = 0
+        for match in TOKEN_PATTERN.finditer(masked):
+            start = match.start()
+            if start < skip_until:
+                continue
+            kind = match.lastgroup
+            string_end = string_ends.get(start)
+            if string_end is not None:
+                skip_until = string_end
+                exact_id = intern(text[start:string_end])
+                normalized_id = LITERAL
+            else:
+                lexeme = match.group(kind)
+                exact_id = intern(lexeme)
+                if kind == 'ident':
+                    if lexeme in OCAML_KEYWORDS:
+                        normalized_id = exact_id
+                    elif lexeme[0].isupper():
+                        normalized_id = UPPER_IDENT
+                    else:
+                        normalized_id = LOWER_IDENT
+                elif kind == 'number' or kind == 'char':
+                    normalized_id = LITERAL
+                else:
+                    normalized_id = exact_id
+            normalized.append(normalized_id)
+            exact.append(exact_id)
+            lines.append(bisect.bisect_right(line_offsets, start))
+
+        sentinel = -len(self.file_paths)
+        normalized.append(sentinel)
+        exact.append(sentinel)
+        lines.append(0)
+
+    def locate(self, position: int) -> int:
+        """返回记号位置所属文件的序号"""
+        return bisect.bisect_right(self.file_starts, position) - 1
+
+
+def build_suffix_array(tokens: array) -> List[int]:
+    """前缀倍增构造后缀数组
+
+    每轮只对仍未区分开的后缀组按第二关键字重排，组号取组在后缀数组中的起始下标，
+    因此大部分后缀在前几轮即确定位置，重复区域越短收敛越快。
+    """
+    n = len(tokens)
+    suffix_array = sorted(range(n), key=tokens.__getitem__)
+    rank = [0] * n
+    groups = []
+    group_start = 0
+    for index in range(1, n + 1):
+        if index == n or tokens[suffix_array[index]] != tokens[suffix_array[group_start]]:
+            for position in suffix_array[group_start:index]:
+                rank[position] = group_start
+            if index - group_start > 1:
+                groups.append((group_start, index))
+            group_start = index
+
+    step = 1
+    while groups:
+        next_groups = []
+        updates = []
+        for begin, end in groups:
+            members = suffix_array[begin:end]
+            keys = [rank[p + step] if p + step < n else -1 for p in members]
+            order = sorted(range(end - begin), key=keys.__getitem__)
+            suffix_array[begin:end] = [members[i] for i in order]
+            sub_start = 0
+            for offset in range(1, end - begin + 1):
+                if offset == end - begin or keys[order[offset]] != keys[order[sub_start]]:
+                    new_rank = begin + sub_start
+                    if new_rank != begin:
+                        updates.append((new_rank, begin + sub_start, begin + offset))
+                    if offset - sub_start > 1:
+                        next_groups.append((begin + sub_start, begin + offset))
+                    sub_start = offset
+        # 本轮所有分组确定后再更新组号，避免同轮比较读到新值
+        for new_rank, begin, end in updates:
+            for position in suffix_array[begin:end]:
+                rank[position] = new_rank
+        groups = next_groups
+        step *= 2
+    return suffix_array
+
+
+def build_lcp_array(tokens: array, suffix_array: List[int]) -> array:
+    """Kasai 算法：lcp[i] 为 suffix_array[i-1] 与 suffix_array[i] 的最长公共前缀"""
+    n = len(tokens)
+    rank = [0] * n
+    for index, position in enumerate(suffix_array):
+        rank[position] = index
+    lcp = array('i', bytes(4 * n))
+    common = 0
+    for position in range(n):
+        index = rank[position]
+        if index == 0:
+            common = 0
+            continue
+        previous = suffix_array[index - 1]
+        while (position + common < n and previous + common < n
+               and tokens[position + common] == tokens[previous + common]):
+            common += 1
+        lcp[index] = common
+        if common:
+            common -= 1
+    return lcp
+
+
+class TokenCloneDetector:
+    """基于后缀数组的词法级克隆检测器"""
+
+    def __init__(self, project_root: str, min_tokens: int = 50):
+        self.project_root = project_root
+        self.min_tokens = min_tokens
+        self.stream = TokenStream()
+
+    def tokenize_project(self) -> None:
+        for file_path in load_source_index(self.project_root).paths():
+            self.stream.add_file(file_path)
+
+    def find_clones(self) -> List[CloneClass]:
+        """枚举长度不小于 min_tokens 的全部极大重复序列"""
+        tokens = self.stream.normalized
+        suffix_array = build_suffix_array(tokens)
+        lcp = build_lcp_array(tokens, suffix_array)
+
+        clones = []
+        n = len(tokens)
+        # 栈中保存 (公共前缀长度, 区间左端)
+        stack = [(0, 0)]
+        for index in range(1, n + 1):
+            current = lcp[index] if index < n else 0
+            left = index - 1
+            while current < stack[-1][0]:
+                length, left = stack.pop()
+                if length >= self.min_tokens:
+                    clone = self.build_clone(suffix_array[left:index], length)
+                    if clone is not None:
+                        clones.append(clone)
+            if current > stack[-1][0]:
+                stack.append((current, left))
+
+        clones.sort(key=lambda clone: clone.token_count * len(clone.occurrences), reverse=True)
+        return clones
+
+    def build_clone(self, positions: List[int], length: int):
+        """对一个 LCP 区间生成克隆类；非左极大或去重叠后不足两处时返回 None"""
+        tokens = self.stream.normalized
+        # 左极大：若所有出现之前的记号都相同，该序列包含在更长的重复中
+        if all(p > 0 for p in positions):
+            preceding = tokens[positions[0] - 1]
+            if all(tokens[p - 1] == preceding for p in positions):
+                return None
+
+        # 同一文件内相互重叠的出现（周期性代码）只保留最靠前的一处
+        kept = []
+        last_end = -1
+        for position in sorted(positions):
+            if position < last_end:
+                continue
+            kept.append(position)
+            last_end = position + length
+        if len(kept) < 2:
+            return None
+
+        exact = self.stream.exact
+        first = exact[kept[0]:kept[0] + length]
+        identical = all(exact[p:p + length] == first for p in kept[1:])
+
+        lines = self.stream.lines
+        clone = CloneClass(
+            clone_type="Type-1" if identical else "Type-2",
+            token_count=length
+        )
+        for position in kept:
+            clone.occurrences.append(CloneOccurrence(
+                file_path=self.stream.file_paths[self.stream.locate(position)],
+                start_line=lines[position],
+                end_line=lines[position + length - 1]
+            ))
+        return clone
+
+    def analyze_project(self) -> Dict:
+        start_time = time.time()
+        self.tokenize_project()
+        tokenize_time = time.time() - start_time
+        clones = self.find_clones()
+
+        return {
+            'summary': {
+                'total_files': len(self.stream.file_paths),
+                'total_tokens': len(self.stream.normalized) - len(self.stream.file_paths),
+                'clone_classes': len(clones),
+                'type1_classes': sum(1 for clone in clones if clone.clone_type == "Type-1"),
+                'type2_classes': sum(1 for clone in clones if clone.clone_type == "Type-2"),
+                'min_tokens': self.min_tokens,
+                'tokenize_seconds': round(tokenize_time, 2),
+                'total_seconds': round(time.time() - start_time, 2)
+            },
+            'clones': [
+                {
+                    'type': clone.clone_type,
+                    'tokens': clone.token_count,
+                    'lines': clone.line_count,
+                    'occurrences': [
+                        {'file': occ.file_path, 'start_line': occ.start_line, 'end_line': occ.end_line}
+                        for occ in clone.occurrences
+                    ]
+                }
+                for clone in clones
+            ]
+        }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='骆言项目词法级克隆检测工具')
+    parser.add_argument('--root', default='src', help='要分析的源码目录')
+    parser.add_argument('--output', default='token_clone_report.json', help='详细报告输出路径')
+    parser.add_argument('--min-tokens', type=int, default=50,
+                        help='克隆的最少记号数（默认50）')
+    parser.add_argument('--top', type=int, default=10, help='打印的克隆类数量')
+    args = parser.parse_args()
+
+    detector = TokenCloneDetector(args.root, min_tokens=args.min_tokens)
+    print("开始词法级克隆检测...")
+    results = detector.analyze_project()
+    summary = results['summary']
+
+    print("\n=== 骆言项目词法级克隆检测报告 ===")
+    print(f"分析文件数量: {summary['total_files']}")
+    print(f"记号总数: {summary['total_tokens']}")
+    print(f"克隆类数量: {summary['clone_classes']} "
+          f"(Type-1: {summary['type1_classes']}, Type-2: {summary['type2_classes']})")
+    print(f"耗时: {summary['total_seconds']} 秒（词法化 {summary['tokenize_seconds']} 秒）")
+
+    print("\n=== 最大克隆类 ===")
+    for i, clone in enumerate(results['clones'][:args.top], 1):
+        print(f"\n{i}. {clone['type']} | {clone['tokens']} 个记号 | {len(clone['occurrences'])} 处")
+        for occ in clone['occurrences'][:5]:
+            print(f"   - {os.path.basename(occ['file'])}:{occ['start_line']}-{occ['end_line']}")
+        if len(clone['occurrences']) > 5:
+            print(f"   ... 另有 {len(clone['occurrences']) - 5} 处")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n详细报告已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Token转换批次的二分验证
+
+批次验证失败时不必整批回滚：把批次修改的文件二分，分别验证"只应用这一半转换"的状态，
+通过的部分保留，失败且只剩一个文件的即为最小失败文件。条件允许时（git 仓库、jobs > 1、
+工作区除本批次文件外没有其他未提交修改）各组在独立的 git worktree 中并行验证，
+否则在当前工作区中依次验证。
+
+每次验证与最初失败的检查范围相同（full=True 时为完整的 dune build / runtest）。
+单独验证通过的文件合在一起仍可能互相冲突，因此最后会验证保留集合的整体状态；
+整体失败时在工作区中逐组累加验证。最终状态仍未通过验证时报告失败而不是成功。
+
+Author: Alpha, 主要工作专员
+"""
+
+import os
+import queue
+import shutil
+import tempfile
+import subprocess
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Set
+
+from conversion_backup_store import ConversionBackupStore
+from dune_validation import IncrementalValidator
+
+
+@dataclass
+class BisectResult:
+    """二分验证结果（文件均为相对项目根目录的路径）"""
+    batch: str
+    kept_files: List[str] = field(default_factory=list)
+    failing_files: List[str] = field(default_factory=list)
+    validations: int = 0
+    used_worktrees: bool = False
+    success: bool = False
+
+
+def write_bytes_atomic(file_path: Path, content: bytes) -> None:
+    """内容不同时才原子地写入文件"""
+    if file_path.exists() and file_path.read_bytes() == content:
+        return
+    fd, temp_path = tempfile.mkstemp(dir=str(file_path.parent), prefix=f".{file_path.name}.",
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        if file_path.exists():
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def run_git(cwd: Path, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(['git', *args], cwd=cwd, capture_output=True, text=True)
+
+
+class BatchBisector:
+    """对验证失败的批次做二分，找出最小失败文件并保留能构建的转换"""
+
+    def __init__(self, root_path: Path, backup_store: ConversionBackupStore, cache_file: Path,
+                 jobs: int = 1, mode: str = 'build', timeout: int = 300, full: bool = False):
+        self.root_path = Path(root_path).resolve()
+        self.backup_store = backup_store
+        self.cache_file = Path(cache_file)
+        self.jobs = jobs
+        self.mode = mode
+        self.timeout = timeout
+        self.full = full
+
+    def bisect(self, batch: str) -> BisectResult:
+        """二分一个整体验证已失败的批次，结束时工作区只保留通过验证的转换"""
+        result = BisectResult(batch=batch)
+        manifest = self.backup_store.read_manifest(batch)
+        files = sorted(manifest)
+        if not files:
+            print(f"⚠️ 批次 {batch} 没有修改记录，无需二分")
+            return result
+
+        self.files = files
+        self.converted = {rel: (self.root_path / rel).read_bytes() for rel in files}
+        self.original = {rel: self.backup_store.blob_path(digest).read_bytes()
+                         for rel, digest in manifest.items()}
+        self.batch = batch
+        self.result = result
+
+        print(f"🔪 开始二分验证批次 {batch}（{len(files)} 个修改文件）...")
+        good: List[str] = []
+        failing: List[str] = []
+        worktrees = self.create_worktrees()
+        result.used_worktrees = bool(worktrees)
+        try:
+            # 第一阶段：各组相互独立地验证"只应用该组转换"的状态，逐层二分失败的组
+            pending = self.split(files) if len(files) > 1 else []
+            if not pending:
+                failing.extend(files)
+            while pending:
+                outcomes = self.check_groups(pending, worktrees)
+                next_pending = []
+                for group, ok in zip(pending, outcomes):
+                    if ok:
+                        good.extend(group)
+                    elif len(group) == 1:
+                        failing.extend(group)
+                    else:
+                        next_pending.extend(self.split(group))
+                pending = next_pending
+        finally:
+            self.remove_worktrees(worktrees)
+
+        # 第二阶段：在工作区验证保留集合的整体状态
+        kept = sorted(good)
+        if kept and not self.check_in_tree(set(kept)):
+            print("⚠️ 单独通过的转换合并后验证失败，改为逐组累加验证...")
+            kept = []
+            self.accumulate(sorted(good), kept, failing)
+
+        # 最终保留的状态必须通过原始检查（已验证通过的状态直接命中验证缓存）
+        result.success = self.check_in_tree(set(kept))
+        result.kept_files = sorted(kept)
+        result.failing_files = sorted(failing)
+        if result.success:
+            print(f"✅ 二分验证完成: 保留 {len(result.kept_files)} 个文件的转换，"
+                  f"回退 {len(result.failing_files)} 个失败文件（共验证 {result.validations} 次）")
+        else:
+            print(f"❌ 二分验证失败: 保留 {len(result.kept_files)} 个文件的转换后仍未通过验证，"
+                  f"失败可能不是由本批次转换引起（共验证 {result.validations} 次）")
+        for rel_path in result.failing_files:
+            print(f"   ❌ {rel_path}")
+        return result
+
+    @staticmethod
+    def split(group: List[str]) -> List[List[str]]:
+        middle = len(group) // 2
+        return [group[:middle], group[middle:]]
+
+    def accumulate(self, group: List[str], kept: List[str], failing: List[str]) -> None:
+        """在已保留集合上累加验证一组转换，失败时继续二分该组"""
+        if not group:
+            return
+        if self.check_in_tree(set(kept) | set(group)):
+            kept.extend(group)
+        elif len(group) == 1:
+            failing.extend(group)
+        else:
+            for half in self.split(group):
+                self.accumulate(half, kept, failing)
+
+    def apply_state(self, converted: Set[str], root: Path) -> None:
+        """把批次文件写成指定状态：集合内为转换后内容，其余为原始内容"""
+        for rel_path in self.files:
+            content = self.converted[rel_path] if rel_path in converted else self.original[rel_path]
+            write_bytes_atomic(root / rel_path, content)
+
+    def validate_at(self, root: Path) -> bool:
+        validator = IncrementalValidator(root, self.cache_file)
+        return validator.validate(self.batch, self.files, mode=self.mode, timeout=self.timeout,
+                                  full=self.full)
+
+    def check_in_tree(self, converted: Set[str]) -> bool:
+        self.result.validations += 1
+        self.apply_state(converted, self.root_path)
+        return self.validate_at(self.root_path)
+
+    def check_groups(self, groups: List[List[str]], worktrees: List[Path]) -> List[bool]:
+        """验证每组"只应用该组转换"的状态；有工作树时并行进行"""
+        if not worktrees:
+            return [self.check_in_tree(set(group)) for group in groups]
+
+        available: "queue.Queue[Path]" = queue.Queue()
+        for worktree in worktrees:
+            available.put(worktree)
+
+        def check(group: List[str]) -> bool:
+            root = available.get()
+            try:
+                self.apply_state(set(group), root)
+                return self.validate_at(root)
+            finally:
+                available.put(root)
+
+        self.result.validations += len(groups)
+        with ThreadPoolExecutor(max_workers=len(worktrees)) as executor:
+            return list(executor.map(check, groups))
+
+    def create_worktrees(self) -> List[Path]:
+        """条件允许时创建 jobs 个分离的 git 工作树，返回其中与项目根目录对应的路径"""
+        if self.jobs <= 1 or len(self.files) <= 1:
+            return []
+        toplevel = run_git(self.root_path, 'rev-parse', '--show-toplevel')
+        if toplevel.returncode != 0:
+            return []
+        git_root = Path(toplevel.stdout.strip()).resolve()
+        prefix = self.root_path.relative_to(git_root)
+
+        # 工作区中除本批次文件外还有未提交修改时，工作树无法重现当前状态
+        batch_paths = {(prefix / rel_path).as_posix() for rel_path in self.files}
+        status = run_git(git_root, 'status', '--porcelain', '--untracked-files=no')
+        for line in status.stdout.splitlines():
+            if line[3:].strip('"') not in batch_paths:
+                print("ℹ️ 工作区有本批次以外的未提交修改，在当前工作区中依次验证")
+                return []
+
+        self.worktree_base = Path(tempfile.mkdtemp(prefix="token_bisect_"))
+        worktrees = []
+        for index in range(self.jobs):
+            path = self.worktree_base / f"wt{index}"
+            added = run_git(git_root, 'worktree', 'add', '--detach', str(path), 'HEAD')
+            if added.returncode != 0:
+                print(f"⚠️ 创建工作树失败: {added.stderr.strip()}")
+                break
+            worktrees.append(path / prefix)
+        if not worktrees:
+            shutil.rmtree(self.worktree_base, ignore_errors=True)
+        else:
+            print(f"🌲 在 {len(worktrees)} 个工作树中并行验证")
+        return worktrees
+
+    def remove_worktrees(self, worktrees: List[Path]) -> None:
+        if not worktrees:
+            return
+        for index in range(len(worktrees)):
+            run_git(self.root_path, 'worktree', 'remove', '--force',
+                    str(self.worktree_base / f"wt{index}"))
+        shutil.rmtree(self.worktree_base, ignore_errors=True)
+        run_git(self.root_path, 'worktree', 'prune')
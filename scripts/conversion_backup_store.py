@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Token转换工具共用的内容寻址备份仓库
+
+备份目录结构:
+    objects/<哈希前2位>/<哈希>   原始文件内容（按内容哈希去重，同样内容只存一份）
+    manifests/<批次>.jsonl        每个被修改文件一行: {"path": 相对路径, "blob": 哈希}
+
+只有确实要改写的文件才会在写入前登记到批次清单；清单以追加方式写入，
+并行转换的多个进程可以同时登记。回滚即按清单逐个恢复，只涉及实际修改过的文件。
+
+Author: Alpha, 主要工作专员
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+class ConversionBackupStore:
+    """内容寻址的转换备份仓库"""
+
+    def __init__(self, backup_dir: Path, root_path: Path):
+        self.backup_dir = Path(backup_dir)
+        self.root_path = Path(root_path)
+        self.objects_dir = self.backup_dir / "objects"
+        self.manifests_dir = self.backup_dir / "manifests"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+
+    def manifest_path(self, batch: str) -> Path:
+        return self.manifests_dir / f"{batch}.jsonl"
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def store_blob(self, content: bytes) -> str:
+        """保存内容并返回其哈希；已存在的内容不重复写入"""
+        digest = hashlib.sha1(content).hexdigest()
+        blob_path = self.blob_path(digest)
+        if not blob_path.exists():
+            blob_path.parent.mkdir(exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=str(blob_path.parent), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(content)
+                os.replace(temp_path, blob_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+        return digest
+
+    def backup(self, batch: str, file_path: Path) -> str:
+        """在改写文件之前登记其原始内容，返回内容哈希"""
+        digest = self.store_blob(Path(file_path).read_bytes())
+        entry = {'path': str(Path(file_path).relative_to(self.root_path)), 'blob': digest}
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        # O_APPEND 单次写入整行，多个进程同时登记也不会交错
+        fd = os.open(self.manifest_path(batch), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        return digest
+
+    def read_manifest(self, batch: str) -> Dict[str, str]:
+        """读取批次清单：相对路径 -> 内容哈希（同一文件多次登记时保留最早的原始内容）"""
+        entries: Dict[str, str] = {}
+        manifest_path = self.manifest_path(batch)
+        if not manifest_path.exists():
+            return entries
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 中断时可能留下不完整的最后一行
+                entries.setdefault(entry['path'], entry['blob'])
+        return entries
+
+    def batches(self) -> List[str]:
+        """按名称排序的全部批次"""
+        return sorted(path.stem for path in self.manifests_dir.glob("*.jsonl"))
+
+    def restore(self, batch: str) -> Tuple[List[str], List[str]]:
+        """按批次清单恢复文件，返回 (已恢复, 恢复失败) 的相对路径；全部成功后删除清单"""
+        restored, failed = [], []
+        for rel_path, digest in self.read_manifest(batch).items():
+            file_path = self.root_path / rel_path
+            try:
+                content = self.blob_path(digest).read_bytes()
+                fd, temp_path = tempfile.mkstemp(dir=str(file_path.parent),
+                                                 prefix=f".{file_path.name}.", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(content)
+                    if file_path.exists():
+                        os.chmod(temp_path, file_path.stat().st_mode & 0o7777)
+                    os.replace(temp_path, file_path)
+                except BaseException:
+                    if os.path.exists(temp_path):
+                        os.unlink(temp_path)
+                    raise
+                restored.append(rel_path)
+            except OSError as e:
+                print(f"❌ 回滚失败: {rel_path} - {e}")
+                failed.append(rel_path)
+        if not failed and self.manifest_path(batch).exists():
+            self.manifest_path(batch).unlink()
+        return restored, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Token转换备份仓库')
+    parser.add_argument('backup_dir', help='备份目录（如 _conversion_backups）')
+    parser.add_argument('--root', default='.', help='项目根目录路径')
+    parser.add_argument('--restore', metavar='BATCH', help='按清单回滚指定批次')
+    args = parser.parse_args()
+
+    store = ConversionBackupStore(Path(args.backup_dir), Path(args.root))
+    if args.restore:
+        restored, failed = store.restore(args.restore)
+        print(f"已恢复 {len(restored)} 个文件，失败 {len(failed)} 个")
+        return
+
+    for batch in store.batches():
+        print(f"{batch}: {len(store.read_manifest(batch))} 个文件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Token转换工具共用的统一diff输出
+
+转换工具的 --dry-run 模式不改写源码，而是把每个文件的转换结果以统一diff格式
+逐个写出（标准输出或补丁文件），路径带 a/ b/ 前缀，可直接用 git apply 审阅后应用:
+
+    python scripts/token_batch_converter.py --batch 1 --dry-run --patch batch1.patch
+    git apply --check batch1.patch && git apply batch1.patch
+
+Author: Alpha, 主要工作专员
+"""
+
+import sys
+import difflib
+from pathlib import Path
+from typing import List, TextIO, Union
+
+NO_NEWLINE_MARKER = "\\ No newline at end of file\n"
+
+
+def unified_file_diff(rel_path: str, original_lines: List[str], converted_lines: List[str]) -> str:
+    """生成单个文件的统一diff文本；内容相同时返回空字符串"""
+    rel_path = Path(rel_path).as_posix()
+    chunks = []
+    for line in difflib.unified_diff(original_lines, converted_lines,
+                                     fromfile=f"a/{rel_path}", tofile=f"b/{rel_path}"):
+        if line.endswith('\n'):
+            chunks.append(line)
+        else:
+            # 文件末尾没有换行的行需要标记，否则 git apply 会补上换行
+            chunks.append(line + '\n' + NO_NEWLINE_MARKER)
+    return ''.join(chunks)
+
+
+class UnifiedDiffWriter:
+    """逐个文件写出统一diff；output 为 '-'（标准输出）、文件路径或文本流"""
+
+    def __init__(self, output: Union[str, Path, TextIO] = '-'):
+        if output == '-':
+            self.stream: TextIO = sys.stdout
+            self.owns_stream = False
+        elif hasattr(output, 'write'):
+            self.stream = output
+            self.owns_stream = False
+        else:
+            self.stream = open(output, 'w', encoding='utf-8')
+            self.owns_stream = True
+        self.files_written = 0
+
+    def write_diff(self, diff_text: str) -> None:
+        """写出一段已生成的diff文本（如工作进程返回的结果）"""
+        if diff_text:
+            self.stream.write(diff_text)
+            self.stream.flush()
+            self.files_written += 1
+
+    def write_file_diff(self, rel_path: str, original_lines: List[str],
+                        converted_lines: List[str]) -> None:
+        self.write_diff(unified_file_diff(rel_path, original_lines, converted_lines))
+
+    def close(self) -> None:
+        if self.owns_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+    def __enter__(self) -> 'UnifiedDiffWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
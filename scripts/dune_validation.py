@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Token转换工具共用的增量dune验证
+
+解析项目中的 dune 文件，找出包含被修改文件的 library/executable/test，
+再沿 libraries 字段求出（直接或间接）依赖受影响库的全部定义，只构建这些定义所在目录的
+@@<目录>/check 别名，只运行其中测试目录的 @@<目录>/runtest 别名，而不是每个批次都执行
+完整的 dune build / dune test。批次修改了文件却无法确定任何目标时改为完整验证。
+
+通过的验证结果按批次缓存在备份目录的 validation_cache.json 中，键包含目标列表、
+被修改文件的内容哈希和工作区整体状态（HEAD、未提交改动、未跟踪的源文件），
+整个源码树未变时重复验证直接返回缓存结果；失败结果不缓存。
+
+Author: Alpha, 主要工作专员
+"""
+
+import os
+import re
+import json
+import hashlib
+import argparse
+import threading
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 遍历时跳过的目录
+SKIP_DIRS = {'_build', '_opam', '.git', 'node_modules'}
+
+# dune 文件的记号：块注释、行注释、字符串、括号、原子
+DUNE_TOKEN_PATTERN = re.compile(r'#\|.*?\|#|;[^\n]*|"(?:\\.|[^"\\])*"|[()]|[^\s()";]+', re.DOTALL)
+
+STANZA_KINDS = ('library', 'executable', 'executables', 'test', 'tests')
+
+# 计入工作区状态的未跟踪文件
+SOURCE_SUFFIXES = ('.ml', '.mli', '.mll', '.mly')
+DUNE_FILES = ('dune', 'dune-project')
+
+# 无法确定受影响目标时的完整验证别名
+FULL_TARGETS = {'build': ['@@default'], 'test': ['@runtest']}
+
+
+def parse_sexps(text: str) -> List:
+    """把 dune 文件解析为嵌套列表（原子为字符串，忽略注释）"""
+    stack: List[List] = [[]]
+    for token in DUNE_TOKEN_PATTERN.findall(text):
+        if token.startswith(';') or token.startswith('#|'):
+            continue
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) > 1:
+                item = stack.pop()
+                stack[-1].append(item)
+        else:
+            stack[-1].append(token.strip('"'))
+    return stack[0]
+
+
+def module_name(name: str) -> str:
+    """dune 模块名与文件名比较时只规范首字母大小写"""
+    return name[:1].upper() + name[1:]
+
+
+def _flatten(items: Iterable) -> List[str]:
+    atoms = []
+    for item in items:
+        if isinstance(item, list):
+            atoms.extend(_flatten(item))
+        else:
+            atoms.append(item)
+    return atoms
+
+
+@dataclass
+class DuneStanza:
+    """dune 文件中的一个 library/executable/test 定义"""
+    kind: str
+    directory: str  # 相对项目根目录
+    names: List[str]
+    public_names: List[str] = field(default_factory=list)
+    modules: Optional[Set[str]] = None  # None 表示目录中的全部模块
+    excluded_modules: Set[str] = field(default_factory=set)
+    libraries: List[str] = field(default_factory=list)
+
+    @property
+    def is_test(self) -> bool:
+        return self.kind in ('test', 'tests')
+
+    @property
+    def label(self) -> str:
+        return f"{self.kind} {' '.join(self.names)} ({self.directory or '.'})"
+
+    def contains_module(self, name: str) -> bool:
+        name = module_name(name)
+        if name in self.excluded_modules:
+            return False
+        return self.modules is None or name in self.modules
+
+
+def parse_stanza(kind: str, fields: List, directory: str) -> DuneStanza:
+    stanza = DuneStanza(kind=kind, directory=directory, names=[])
+    for item in fields:
+        if not isinstance(item, list) or not item:
+            continue
+        key, values = item[0], _flatten(item[1:])
+        if key in ('name', 'names'):
+            stanza.names.extend(values)
+        elif key in ('public_name', 'public_names'):
+            stanza.public_names.extend(values)
+        elif key == 'libraries':
+            stanza.libraries.extend(value for value in values if not value.startswith(':'))
+        elif key == 'modules':
+            if ':standard' in values:
+                # (:standard \ a b) 为目录全部模块减去列出的模块
+                if '\\' in values:
+                    excluded = values[values.index('\\') + 1:]
+                    stanza.excluded_modules = {module_name(value) for value in excluded}
+            else:
+                stanza.modules = {module_name(value) for value in values if value != '\\'}
+    return stanza
+
+
+class DuneProject:
+    """项目中所有 dune 定义的索引"""
+
+    def __init__(self, root_path: Path):
+        self.root_path = Path(root_path)
+        self.stanzas: List[DuneStanza] = []
+        self.include_subdirs: Set[str] = set()
+        self.directories: Set[str] = set()
+        self._scan()
+
+    def _scan(self) -> None:
+        for dirpath, dirnames, filenames in os.walk(self.root_path):
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.'))
+            if 'dune' not in filenames:
+                continue
+            directory = os.path.relpath(dirpath, self.root_path)
+            directory = '' if directory == '.' else Path(directory).as_posix()
+            self.directories.add(directory)
+            try:
+                with open(os.path.join(dirpath, 'dune'), 'r', encoding='utf-8') as f:
+                    sexps = parse_sexps(f.read())
+            except (OSError, UnicodeDecodeError):
+                continue
+            for sexp in sexps:
+                if not isinstance(sexp, list) or not sexp:
+                    continue
+                if sexp[0] in STANZA_KINDS:
+                    self.stanzas.append(parse_stanza(sexp[0], sexp[1:], directory))
+                elif sexp[0] == 'include_subdirs' and sexp[1:] != ['no']:
+                    self.include_subdirs.add(directory)
+
+    def owning_directory(self, rel_dir: str) -> Optional[str]:
+        """源文件所属的 dune 目录：所在目录，或启用 include_subdirs 的上层目录"""
+        if rel_dir in self.directories:
+            return rel_dir
+        parts = rel_dir.split('/') if rel_dir else []
+        while parts:
+            parts.pop()
+            candidate = '/'.join(parts)
+            if candidate in self.include_subdirs:
+                return candidate
+        return None
+
+    def owners(self, rel_path: str) -> List[DuneStanza]:
+        """包含给定源文件（相对项目根目录）的所有定义"""
+        rel = Path(rel_path)
+        if rel.suffix not in SOURCE_SUFFIXES:
+            return []
+        directory = self.owning_directory(rel.parent.as_posix() if str(rel.parent) != '.' else '')
+        if directory is None:
+            return []
+        return [stanza for stanza in self.stanzas
+                if stanza.directory == directory and stanza.contains_module(rel.stem)]
+
+    def dependents(self, owners: List[DuneStanza]) -> List[DuneStanza]:
+        """直接或间接依赖给定定义中各库的其他定义（按 names/public_names 匹配 libraries）"""
+        provided: Set[str] = set()
+        for stanza in owners:
+            if stanza.kind == 'library':
+                provided.update(stanza.names)
+                provided.update(stanza.public_names)
+        dependents: List[DuneStanza] = []
+        changed = True
+        while changed:
+            changed = False
+            for stanza in self.stanzas:
+                if stanza in owners or stanza in dependents:
+                    continue
+                if provided.intersection(stanza.libraries):
+                    dependents.append(stanza)
+                    changed = True
+                    if stanza.kind == 'library':
+                        provided.update(stanza.names)
+                        provided.update(stanza.public_names)
+        return dependents
+
+    def affected(self, rel_paths: Iterable[str]
+                 ) -> Tuple[List[DuneStanza], List[DuneStanza], List[DuneStanza]]:
+        """返回 (包含被修改文件的定义, 传递依赖受影响库的定义, 其中受影响的测试定义)"""
+        owners: List[DuneStanza] = []
+        for rel_path in rel_paths:
+            for stanza in self.owners(rel_path):
+                if stanza not in owners:
+                    owners.append(stanza)
+        dependents = self.dependents(owners)
+        tests = [stanza for stanza in owners + dependents if stanza.is_test]
+        return owners, dependents, tests
+
+
+def build_targets(owners: List[DuneStanza]) -> List[str]:
+    """受影响定义所在目录的非递归 check 别名"""
+    return sorted({f"@@{stanza.directory}/check" if stanza.directory else "@@check"
+                   for stanza in owners})
+
+
+def test_targets(tests: List[DuneStanza]) -> List[str]:
+    """受影响测试所在目录的非递归 runtest 别名"""
+    return sorted({f"@@{stanza.directory}/runtest" if stanza.directory else "@@runtest"
+                   for stanza in tests})
+
+
+class IncrementalValidator:
+    """按批次增量验证转换结果并缓存验证结果"""
+
+    # 多个验证器（如二分验证的各个工作树）可能在不同线程中共用同一缓存文件
+    _cache_lock = threading.Lock()
+
+    def __init__(self, root_path: Path, cache_file: Path):
+        self.root_path = Path(root_path)
+        self.cache_file = Path(cache_file)
+        self._project: Optional[DuneProject] = None
+
+    @property
+    def project(self) -> DuneProject:
+        if self._project is None:
+            self._project = DuneProject(self.root_path)
+        return self._project
+
+    def load_cache(self) -> Dict[str, Dict]:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_cache(self, cache: Dict[str, Dict]) -> None:
+        temp_path = self.cache_file.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.cache_file)
+
+    def tree_state(self) -> Optional[bytes]:
+        """工作区整体状态的摘要：HEAD、已跟踪文件的未提交改动和未跟踪的源文件内容。
+        构建结果取决于整个源码树而不只是批次文件；不在 git 仓库中时返回 None（不缓存）"""
+        def git(*args: str) -> Optional[bytes]:
+            try:
+                result = subprocess.run(['git', *args], cwd=self.root_path, capture_output=True)
+            except OSError:
+                return None
+            return result.stdout if result.returncode == 0 else None
+
+        head = git('rev-parse', 'HEAD')
+        diff = git('diff', 'HEAD', '--binary', '--', '.')
+        untracked = git('ls-files', '--others', '--exclude-standard', '-z', '--', '.')
+        if head is None or diff is None or untracked is None:
+            return None
+        digest = hashlib.sha1(head)
+        digest.update(hashlib.sha1(diff).digest())
+        for rel_path in sorted(untracked.split(b'\0')):
+            name = os.fsdecode(rel_path)
+            if not (Path(name).suffix in SOURCE_SUFFIXES or Path(name).name in DUNE_FILES):
+                continue
+            try:
+                content = (self.root_path / name).read_bytes()
+            except OSError:
+                continue
+            digest.update(rel_path + b'\0' + hashlib.sha1(content).digest())
+        return digest.digest()
+
+    def cache_key(self, mode: str, targets: List[str], rel_paths: List[str]) -> Optional[str]:
+        state = self.tree_state()
+        if state is None:
+            return None
+        digest = hashlib.sha1(mode.encode('utf-8'))
+        digest.update(state)
+        for target in targets:
+            digest.update(target.encode('utf-8') + b'\0')
+        for rel_path in sorted(rel_paths):
+            file_path = self.root_path / rel_path
+            content = file_path.read_bytes() if file_path.exists() else b''
+            digest.update(rel_path.encode('utf-8') + b'\0' + hashlib.sha1(content).digest())
+        return digest.hexdigest()
+
+    def validate(self, batch: str, rel_paths: List[str], mode: str = 'build',
+                 timeout: int = 300, full: bool = False) -> bool:
+        """只构建（mode='build'）或测试（mode='test'）受批次修改影响的目标；
+        full=True 时执行完整验证。通过的结果按工作区整体状态缓存"""
+        label = "编译检查" if mode == 'build' else "测试验证"
+        owners, dependents, tests = ([], [], []) if full else self.project.affected(rel_paths)
+        stanzas = owners + dependents if mode == 'build' else tests
+        targets = build_targets(stanzas) if mode == 'build' else test_targets(stanzas)
+        if full:
+            print(f"🎯 完整{label}")
+            targets = FULL_TARGETS[mode]
+        elif not rel_paths:
+            print(f"✅ {label}: 批次 {batch} 没有修改文件")
+            return True
+        elif not targets:
+            # 修改了文件却找不到受影响的目标（如 dune 解析不全），不能据此判定通过
+            print(f"⚠️ {label}: 无法确定批次 {batch} 影响的 dune 目标，改为完整验证")
+            targets = FULL_TARGETS[mode]
+        else:
+            print(f"🎯 {label}目标: {', '.join(targets)}")
+            if dependents:
+                print(f"   （含 {len(dependents)} 个依赖受影响库的定义）")
+            for stanza in stanzas[:10]:
+                print(f"   - {stanza.label}")
+
+        key = self.cache_key(mode, targets, rel_paths)
+        cached = None
+        if key is not None:
+            with self._cache_lock:
+                cached = self.load_cache().get(batch, {}).get(key)
+        if cached is not None and cached['success']:
+            print(f"♻️ 使用批次 {batch} 的缓存{label}结果")
+            return True
+
+        try:
+            result = subprocess.run(
+                ['dune', 'build', '--display', 'quiet', *targets],
+                cwd=self.root_path,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            print(f"⚠️ {label}超时")
+            return False
+        except Exception as e:
+            print(f"❌ {label}异常: {e}")
+            return False
+
+        if result.returncode != 0:
+            # 失败可能来自批次以外的文件，修复后应重新验证，因此只缓存通过的结果
+            print(f"❌ {label}失败:")
+            print(result.stderr)
+            return False
+
+        print(f"✅ {label}通过")
+        if key is not None:
+            with self._cache_lock:
+                cache = self.load_cache()
+                cache.setdefault(batch, {})[key] = {'success': True, 'targets': targets}
+                self.save_cache(cache)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列出受修改文件影响的dune目标')
+    parser.add_argument('files', nargs='+', help='被修改的源文件（相对项目根目录）')
+    parser.add_argument('--root', default='.', help='项目根目录路径')
+    args = parser.parse_args()
+
+    project = DuneProject(Path(args.root))
+    owners, dependents, tests = project.affected(args.files)
+    print("包含这些文件的定义:")
+    for stanza in owners:
+        print(f"  {stanza.label}")
+    print(f"依赖受影响库的定义: {len(dependents)} 个")
+    for stanza in dependents:
+        print(f"  {stanza.label}")
+    print(f"构建目标: {' '.join(build_targets(owners + dependents)) or '(无)'}")
+    print(f"测试目标: {' '.join(test_targets(tests)) or '(无)'}（{len(tests)} 个测试）")
+
+if __name__ == '__main__':
+    main()
@@ -18,28 +18,56 @@ import shutil
 import argparse
 import subprocess
 import time
+import mmap
+import codecs
 from pathlib import Path
 from typing import Dict, List, Tuple, Set, Optional, Any
 from dataclasses import dataclass, asdict
-from collections import defaultdict, Counter
-from enum import Enum
+from collections import Counter
+import sys
+import contextlib
 
-class ConversionComplexity(Enum):
-    """转换复杂度级别"""
-    SIMPLE = "simple"      # 直接映射
-    MEDIUM = "medium"      # 需要逻辑调整
-    COMPLEX = "complex"    # 需要架构重构
+sys.path.append(os.path.join(os.path.dirname(__file__), 'analysis'))
+from jsonl_report_writer import JsonlReportWriter
+from conversion_diff import UnifiedDiffWriter
+from token_reference_table import ConversionComplexity, TokenReferenceTable
+from token_symbol_index import load_symbol_index
+
+# Token引用模式（均包含不区分大小写的 token，可用字节级子串预筛选候选行）
+TOKEN_REFERENCE_PATTERNS = [
+    (re.compile(r'\btoken_(\w+)', re.IGNORECASE), 'direct_reference'),
+    (re.compile(r'\bToken_(\w+)', re.IGNORECASE), 'module_reference'),
+    (re.compile(r'\b(\w+)_token\b', re.IGNORECASE), 'suffix_reference'),
+    (re.compile(r'\btoken\s*\.\s*(\w+)', re.IGNORECASE), 'accessor_reference')
+]
+TOKEN_PREFILTER_PATTERN = re.compile(rb'[Tt][Oo][Kk][Ee][Nn]')
+
+
+def detect_file_encoding(data) -> str:
+    """一次性判断文件内容是否为合法UTF-8；否则按 latin-1 解码（任何字节序列都合法）"""
+    try:
+        codecs.utf_8_decode(data, 'strict', True)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def find_candidate_lines(data) -> List[Tuple[int, bytes]]:
+    """在文件字节中查找包含 token 子串的行，返回 (行号, 行字节)"""
+    candidates = []
+    line_number = 1
+    counted = 0
+    match = TOKEN_PREFILTER_PATTERN.search(data)
+    while match:
+        line_start = data.rfind(b'\n', 0, match.start()) + 1
+        line_end = data.find(b'\n', match.end())
+        line_end = len(data) if line_end == -1 else line_end + 1
+        line_number += data[counted:line_start].count(b'\n')
+        counted = line_start
+        candidates.append((line_number, data[line_start:line_end]))
+        match = TOKEN_PREFILTER_PATTERN.search(data, line_end)
+    return candidates
 
-@dataclass
-class TokenReference:
-    """Token引用信息"""
-    file_path: str
-    line_number: int
-    context: str
-    token_type: str
-    reference_pattern: str
-    complexity: ConversionComplexity
-    conversion_confidence: float
 
 @dataclass
 class ConversionBatch:
@@ -73,8 +101,9 @@ class PerformanceBenchmark:
 class EnhancedTokenBatchConverter:
     """增强的Token批量转换器"""
     
-    def __init__(self, root_path: str):
+    def __init__(self, root_path: str, report_format: str = 'json'):
         self.root_path = Path(root_path)
+        self.report_format = report_format
         self.backup_dir = self.root_path / "_enhanced_conversion_backups"
         self.analysis_dir = self.root_path / "_conversion_analysis"
         self.reports_dir = self.root_path / "_conversion_reports"
@@ -84,7 +113,7 @@ class EnhancedTokenBatchConverter:
             dir_path.mkdir(exist_ok=True)
         
         # 初始化组件
-        self.token_references: List[TokenReference] = []
+        self.token_references = TokenReferenceTable()
         self.conversion_batches: List[ConversionBatch] = []
         self.performance_baseline: Optional[PerformanceBenchmark] = None
         
@@ -162,9 +191,18 @@ class EnhancedTokenBatchConverter:
         print("🔍 开始Token引用全面审计...")
         
         start_time = time.time()
-        token_references = []
+        token_references = TokenReferenceTable()
         file_count = 0
         
+        # jsonl 格式：每条引用在扫描时即写出，最后追加汇总记录
+        writer = None
+        if self.report_format == 'jsonl':
+            audit_file = self.analysis_dir / "token_reference_audit.jsonl"
+            writer = JsonlReportWriter(audit_file)
+        
+        # 符号索引覆盖 src/：索引中没有任何 token 标识符的文件无需打开
+        symbol_index = load_symbol_index(str(self.root_path))
+        
         # 扫描所有源文件
         for pattern in ['**/*.ml', '**/*.mli']:
             for file_path in self.root_path.glob(pattern):
@@ -172,26 +210,16 @@ class EnhancedTokenBatchConverter:
                     continue
                 
                 file_count += 1
-                refs = self._analyze_file_token_references(file_path)
-                token_references.extend(refs)
-        
-        # 分类统计
-        by_complexity = defaultdict(int)
-        by_type = defaultdict(int)
-        by_confidence = defaultdict(int)
-        
-        for ref in token_references:
-            by_complexity[ref.complexity.value] += 1
-            by_type[ref.token_type] += 1
-            confidence_range = f"{int(ref.conversion_confidence * 10) * 10}%"
-            by_confidence[confidence_range] += 1
-        
-        # 转换为JSON可序列化的格式
-        serializable_references = []
-        for ref in token_references:
-            ref_dict = asdict(ref)
-            ref_dict['complexity'] = ref.complexity.value  # 转换enum为字符串
-            serializable_references.append(ref_dict)
+                if symbol_index.file_identifiers(str(file_path.relative_to(self.root_path))) == []:
+                    continue
+                first_row = len(token_references)
+                self._analyze_file_token_references(file_path, token_references)
+                if writer is not None:
+                    for record in token_references.records(first_row):
+                        writer.write('reference', record)
+        
+        # 分类统计：直接在编码列上分组计数
+        by_complexity = token_references.count_by_complexity()
         
         audit_result = {
             'audit_summary': {
@@ -199,25 +227,31 @@ class EnhancedTokenBatchConverter:
                 'total_token_references': len(token_references),
                 'audit_duration': time.time() - start_time
             },
-            'complexity_distribution': dict(by_complexity),
-            'token_type_distribution': dict(by_type),
-            'confidence_distribution': dict(by_confidence),
-            'references': serializable_references
+            'complexity_distribution': by_complexity,
+            'token_type_distribution': token_references.count_by_type(),
+            'confidence_distribution': token_references.count_by_confidence_range()
         }
         
-        # 保存审计结果
-        audit_file = self.analysis_dir / "token_reference_audit.json"
-        with open(audit_file, 'w', encoding='utf-8') as f:
-            json.dump(audit_result, f, indent=2, ensure_ascii=False)
+        # 保存审计结果；列式引用表另存为紧凑的二进制文件供后续步骤加载
+        token_references.save(self.analysis_dir / "token_reference_audit.tokrefs")
+        if writer is not None:
+            writer.write_summary(audit_result)
+            writer.close()
+        else:
+            audit_result['references'] = list(token_references.records())
+            audit_file = self.analysis_dir / "token_reference_audit.json"
+            with open(audit_file, 'w', encoding='utf-8') as f:
+                json.dump(audit_result, f, indent=2, ensure_ascii=False)
+            del audit_result['references']
         
         self.token_references = token_references
         
         print(f"✅ Token引用审计完成:")
         print(f"   扫描文件: {file_count}")
         print(f"   发现引用: {len(token_references)}")
-        print(f"   简单转换: {by_complexity['simple']}")
-        print(f"   中等转换: {by_complexity['medium']}")
-        print(f"   复杂转换: {by_complexity['complex']}")
+        print(f"   简单转换: {by_complexity.get('simple', 0)}")
+        print(f"   中等转换: {by_complexity.get('medium', 0)}")
+        print(f"   复杂转换: {by_complexity.get('complex', 0)}")
         
         return audit_result
     
@@ -225,31 +259,32 @@ class EnhancedTokenBatchConverter:
         """Task 2.2.2: 转换复杂度分级"""
         print("📊 开始转换复杂度分级...")
         
+        if not self.token_references:
+            # 未在本次运行中审计时，加载上次审计保存的引用表
+            table_file = self.analysis_dir / "token_reference_audit.tokrefs"
+            if table_file.exists():
+                self.token_references = TokenReferenceTable.load(table_file)
+                print(f"📂 已加载审计引用表: {len(self.token_references)} 条引用")
+        
         if not self.token_references:
             print("⚠️ 需要先执行Token引用审计")
             return {}
         
-        # 按复杂度分组
-        complexity_groups = {
-            ConversionComplexity.SIMPLE: [],
-            ConversionComplexity.MEDIUM: [],
-            ConversionComplexity.COMPLEX: []
-        }
-        
-        for ref in self.token_references:
-            complexity_groups[ref.complexity].append(ref)
+        # 按 (复杂度, 文件) 分组计数
+        file_counts = self.token_references.file_counts_by_complexity()
+        level_counts = {level: sum(counts.values()) for level, counts in file_counts.items()}
         
         # 生成分级转换计划
         conversion_plan = {
             'classification_summary': {
-                'simple_conversions': len(complexity_groups[ConversionComplexity.SIMPLE]),
-                'medium_conversions': len(complexity_groups[ConversionComplexity.MEDIUM]),
-                'complex_conversions': len(complexity_groups[ConversionComplexity.COMPLEX])
+                'simple_conversions': level_counts[ConversionComplexity.SIMPLE],
+                'medium_conversions': level_counts[ConversionComplexity.MEDIUM],
+                'complex_conversions': level_counts[ConversionComplexity.COMPLEX]
             },
             'resource_allocation': {
-                'simple_estimated_time': len(complexity_groups[ConversionComplexity.SIMPLE]) * 0.1,
-                'medium_estimated_time': len(complexity_groups[ConversionComplexity.MEDIUM]) * 0.5,
-                'complex_estimated_time': len(complexity_groups[ConversionComplexity.COMPLEX]) * 2.0
+                'simple_estimated_time': level_counts[ConversionComplexity.SIMPLE] * 0.1,
+                'medium_estimated_time': level_counts[ConversionComplexity.MEDIUM] * 0.5,
+                'complex_estimated_time': level_counts[ConversionComplexity.COMPLEX] * 2.0
             },
             'conversion_strategy': {
                 'phase_1': "批量处理简单转换（自动化）",
@@ -259,7 +294,7 @@ class EnhancedTokenBatchConverter:
         }
         
         # 生成转换批次
-        self._generate_conversion_batches(complexity_groups)
+        self._generate_conversion_batches(file_counts)
         
         # 保存分级结果
         classification_file = self.analysis_dir / "conversion_complexity_classification.json"
@@ -290,8 +325,11 @@ class EnhancedTokenBatchConverter:
         print("✅ 批量转换工具开发完成")
         return tool_features
     
-    def execute_progressive_conversion(self) -> Dict[str, Any]:
-        """Task 2.2.4: 分批次渐进转换"""
+    def execute_progressive_conversion(self, diff_writer: Optional[UnifiedDiffWriter] = None) -> Dict[str, Any]:
+        """Task 2.2.4: 分批次渐进转换；给出 diff_writer 时只预览，不改动源码树"""
+        if diff_writer is not None:
+            return self.preview_progressive_conversion(diff_writer)
+        
         print("🚀 开始分批次渐进转换...")
         
         conversion_results = []
@@ -316,6 +354,45 @@ class EnhancedTokenBatchConverter:
         print(f"✅ 分批次转换完成: {len(conversion_results)}/{len(self.conversion_batches)} 批次")
         return progressive_summary
     
+    def preview_progressive_conversion(self, diff_writer: UnifiedDiffWriter) -> Dict[str, Any]:
+        """预览分批次转换：对每个目标文件应用其所在批次复杂度的转换规则，逐个文件流式写出统一diff"""
+        print("📝 开始预览分批次转换...")
+        
+        # 同一文件可能出现在多个复杂度的批次中，合并为一份diff
+        levels_by_file: Dict[str, Set[ConversionComplexity]] = {}
+        for batch in self.conversion_batches:
+            for file_path in batch.target_files:
+                levels_by_file.setdefault(file_path, set()).add(batch.complexity_level)
+        
+        changed_files = 0
+        for rel_path, levels in levels_by_file.items():
+            rules = [rule for rule in self.conversion_rules if rule.complexity in levels]
+            try:
+                with open(self.root_path / rel_path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"⚠️ 无法读取文件 {rel_path}: {e}")
+                continue
+            
+            converted_lines = []
+            for line in lines:
+                for rule in rules:
+                    line = rule.pattern.sub(rule.replacement, line)
+                converted_lines.append(line)
+            
+            if converted_lines != lines:
+                diff_writer.write_file_diff(rel_path, lines, converted_lines)
+                changed_files += 1
+        
+        preview_summary = {
+            'total_batches': len(self.conversion_batches),
+            'target_files': len(levels_by_file),
+            'changed_files': changed_files
+        }
+        
+        print(f"✅ 转换预览完成: {changed_files}/{len(levels_by_file)} 个文件将被修改")
+        return preview_summary
+    
     def build_specialized_test_suite(self) -> Dict[str, Any]:
         """Task 2.2.5: 专项测试套件建设"""
         print("🧪 建设专项测试套件...")
@@ -379,57 +456,40 @@ class EnhancedTokenBatchConverter:
         
         return benchmark
     
-    def _analyze_file_token_references(self, file_path: Path) -> List[TokenReference]:
-        """分析文件中的Token引用"""
-        references = []
-        
+    def _analyze_file_token_references(self, file_path: Path, references: TokenReferenceTable) -> None:
+        """分析文件中的Token引用并追加到引用表：内存映射文件字节，只解码和匹配包含 token 子串的行"""
         try:
-            # 尝试多种编码
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            lines = None
-            
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        lines = f.readlines()
-                    break
-                except UnicodeDecodeError:
-                    continue
+            with open(file_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    encoding = detect_file_encoding(data)
+                    candidates = find_candidate_lines(data)
             
-            if lines is None:
-                print(f"⚠️ 无法解码文件: {file_path}")
-                return references
-            
-            for line_num, line in enumerate(lines, 1):
-                # 查找各种Token引用模式
-                token_patterns = [
-                    (r'\btoken_(\w+)', 'direct_reference'),
-                    (r'\bToken_(\w+)', 'module_reference'),
-                    (r'\b(\w+)_token\b', 'suffix_reference'),
-                    (r'\btoken\s*\.\s*(\w+)', 'accessor_reference')
-                ]
+            rel_path = str(file_path.relative_to(self.root_path))
+            for line_num, raw_line in candidates:
+                line = raw_line.decode(encoding).replace('\r\n', '\n')
+                context = line.strip()
                 
-                for pattern, token_type in token_patterns:
-                    matches = re.finditer(pattern, line, re.IGNORECASE)
-                    for match in matches:
+                # 查找各种Token引用模式
+                for pattern, token_type in TOKEN_REFERENCE_PATTERNS:
+                    for match in pattern.finditer(line):
                         complexity = self._determine_reference_complexity(line, match)
                         confidence = self._calculate_conversion_confidence(line, match)
                         
-                        ref = TokenReference(
-                            file_path=str(file_path.relative_to(self.root_path)),
+                        references.append(
+                            file_path=rel_path,
                             line_number=line_num,
-                            context=line.strip(),
+                            column=match.start(),
+                            context=context,
                             token_type=token_type,
                             reference_pattern=match.group(0),
                             complexity=complexity,
                             conversion_confidence=confidence
                         )
-                        references.append(ref)
         
         except Exception as e:
             print(f"⚠️ 分析文件失败 {file_path}: {e}")
-        
-        return references
     
     def _determine_reference_complexity(self, line: str, match) -> ConversionComplexity:
         """确定引用的转换复杂度"""
@@ -467,14 +527,14 @@ class EnhancedTokenBatchConverter:
         
         return max(0.1, min(1.0, confidence))
     
-    def _generate_conversion_batches(self, complexity_groups: Dict) -> None:
-        """生成转换批次"""
+    def _generate_conversion_batches(self, file_counts: Dict[ConversionComplexity, Dict[str, int]]) -> None:
+        """生成转换批次；file_counts 为各复杂度下每个文件的引用数"""
         batch_id = 1
         
         # 简单转换批次（大批次）
-        simple_refs = complexity_groups[ConversionComplexity.SIMPLE]
-        if simple_refs:
-            simple_files = list(set(ref.file_path for ref in simple_refs))
+        simple_counts = file_counts[ConversionComplexity.SIMPLE]
+        if simple_counts:
+            simple_files = list(simple_counts)
             batch_size = max(1, len(simple_files) // 5)  # 分5个批次
             
             for i in range(0, len(simple_files), batch_size):
@@ -483,7 +543,7 @@ class EnhancedTokenBatchConverter:
                     batch_id=batch_id,
                     batch_name=f"简单转换批次-{batch_id}",
                     complexity_level=ConversionComplexity.SIMPLE,
-                    estimated_refs=len([r for r in simple_refs if r.file_path in batch_files]),
+                    estimated_refs=sum(simple_counts[file_path] for file_path in batch_files),
                     target_files=batch_files,
                     expected_time=len(batch_files) * 0.1
                 )
@@ -491,9 +551,9 @@ class EnhancedTokenBatchConverter:
                 batch_id += 1
         
         # 中等转换批次（中批次）
-        medium_refs = complexity_groups[ConversionComplexity.MEDIUM]
-        if medium_refs:
-            medium_files = list(set(ref.file_path for ref in medium_refs))
+        medium_counts = file_counts[ConversionComplexity.MEDIUM]
+        if medium_counts:
+            medium_files = list(medium_counts)
             batch_size = max(1, len(medium_files) // 10)  # 分10个批次
             
             for i in range(0, len(medium_files), batch_size):
@@ -502,7 +562,7 @@ class EnhancedTokenBatchConverter:
                     batch_id=batch_id,
                     batch_name=f"中等转换批次-{batch_id}",
                     complexity_level=ConversionComplexity.MEDIUM,
-                    estimated_refs=len([r for r in medium_refs if r.file_path in batch_files]),
+                    estimated_refs=sum(medium_counts[file_path] for file_path in batch_files),
                     target_files=batch_files,
                     expected_time=len(batch_files) * 0.5
                 )
@@ -510,16 +570,15 @@ class EnhancedTokenBatchConverter:
                 batch_id += 1
         
         # 复杂转换批次（小批次）
-        complex_refs = complexity_groups[ConversionComplexity.COMPLEX]
-        if complex_refs:
-            complex_files = list(set(ref.file_path for ref in complex_refs))
+        complex_counts = file_counts[ConversionComplexity.COMPLEX]
+        if complex_counts:
             # 每个文件一个批次
-            for file_path in complex_files:
+            for file_path, count in complex_counts.items():
                 batch = ConversionBatch(
                     batch_id=batch_id,
                     batch_name=f"复杂转换-{Path(file_path).name}",
                     complexity_level=ConversionComplexity.COMPLEX,
-                    estimated_refs=len([r for r in complex_refs if r.file_path == file_path]),
+                    estimated_refs=count,
                     target_files=[file_path],
                     expected_time=2.0
                 )
@@ -598,8 +657,8 @@ class EnhancedTokenBatchConverter:
         """测量转换后性能"""
         return {"compile_time": 9.5, "test_time": 4.8, "memory_mb": 95.0}
     
-    def run_full_phase_2_2_pipeline(self) -> Dict[str, Any]:
-        """运行完整的Phase 2.2流水线"""
+    def run_full_phase_2_2_pipeline(self, diff_writer: Optional[UnifiedDiffWriter] = None) -> Dict[str, Any]:
+        """运行完整的Phase 2.2流水线；给出 diff_writer 时转换步骤只预览diff"""
         print("🚀 开始Token系统Phase 2.2完整转换流水线...")
         
         pipeline_results = {}
@@ -614,7 +673,7 @@ class EnhancedTokenBatchConverter:
         pipeline_results['tool_development'] = self.develop_batch_conversion_tool()
         
         # Task 2.2.4: 分批次渐进转换
-        pipeline_results['progressive_conversion'] = self.execute_progressive_conversion()
+        pipeline_results['progressive_conversion'] = self.execute_progressive_conversion(diff_writer)
         
         # Task 2.2.5: 专项测试套件建设
         pipeline_results['test_suite'] = self.build_specialized_test_suite()
@@ -638,10 +697,30 @@ def main():
     parser.add_argument('--task', choices=[
         'audit', 'classify', 'develop', 'convert', 'test', 'benchmark', 'full'
     ], default='full', help='要执行的任务')
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='json',
+                        help='审计结果格式：json 为整体报告；jsonl 每条引用一行并以汇总记录结尾')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='预览模式（convert/full 任务）：不改动源码，输出转换的统一diff')
+    parser.add_argument('--patch', default='-',
+                        help='预览模式的diff输出路径（默认 - 为标准输出），可用 git apply 应用')
     
     args = parser.parse_args()
     
-    converter = EnhancedTokenBatchConverter(args.root)
+    if args.dry_run and args.task in ('convert', 'full'):
+        # diff 写到标准输出时，进度信息改写到标准错误
+        log = sys.stderr if args.patch == '-' else sys.stdout
+        with UnifiedDiffWriter(args.patch) as diff_writer, contextlib.redirect_stdout(log):
+            converter = EnhancedTokenBatchConverter(args.root, report_format=args.format)
+            if args.task == 'full':
+                converter.run_full_phase_2_2_pipeline(diff_writer)
+            else:
+                # 预览需要批次划分，先完成审计和分级
+                converter.audit_token_references()
+                converter.classify_conversion_complexity()
+                converter.execute_progressive_conversion(diff_writer)
+        return
+    
+    converter = EnhancedTokenBatchConverter(args.root, report_format=args.format)
     
     if args.task == 'audit':
         converter.audit_token_references()
@@ -12,6 +12,8 @@ import shutil
 import glob
 from pathlib import Path
 
+from token_symbol_index import TokenSymbolIndex
+
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent
 SRC_DIR = PROJECT_ROOT / "src"
@@ -230,6 +232,33 @@ def analyze_current_structure():
             print(f"     - {file}")
         if len(files) > 3:
             print(f"     - ... 还有 {len(files)-3} 个文件")
+    
+    report_module_references(token_files)
+
+def report_module_references(token_files):
+    """根据符号索引统计各token模块被哪些文件引用（迁移后这些引用需要同步更新）"""
+    index = TokenSymbolIndex(str(PROJECT_ROOT)).refresh()
+    
+    references = {}
+    for file_path in token_files:
+        stem = Path(file_path).stem
+        module_name = stem[:1].upper() + stem[1:]
+        if module_name in references:
+            continue
+        own_files = {Path(file_path).with_suffix(suffix).as_posix() for suffix in ('.ml', '.mli')}
+        references[module_name] = [
+            rel_path for rel_path in index.files_using_module(module_name)
+            if rel_path not in own_files
+        ]
+    
+    affected = set()
+    for files in references.values():
+        affected.update(files)
+    print(f"\n📎 token模块共被 {len(affected)} 个文件引用（符号索引: {index.rescanned} 个文件重新扫描）")
+    for module_name, files in sorted(references.items(), key=lambda item: -len(item[1]))[:10]:
+        if files:
+            print(f"   {module_name}: {len(files)} 个文件")
+    return references
 
 if __name__ == "__main__":
     print("🚀 Token系统重组迁移脚本")
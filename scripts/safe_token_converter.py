@@ -13,13 +13,23 @@ Author: Alpha, 主要工作专员
 import os
 import re
 import json
-import shutil
 import argparse
 from pathlib import Path
-from typing import Dict, List, Tuple, Set, Optional
+from typing import Callable, Dict, List, Tuple, Set, Optional
 from dataclasses import dataclass, asdict
 from collections import defaultdict, Counter
+import sys
 import subprocess
+import time
+import bisect
+import contextlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'analysis'))
+from ocaml_source_index import scan_comments_and_strings
+from conversion_backup_store import ConversionBackupStore
+from conversion_diff import UnifiedDiffWriter
+from dune_validation import IncrementalValidator
+from token_symbol_index import load_symbol_index
 
 @dataclass
 class SafeConversionRule:
@@ -30,13 +40,87 @@ class SafeConversionRule:
     description: str
     safety_checks: List[str]
 
+    def __post_init__(self):
+        self.expand = compile_replacement(self.replacement)
+
+GROUP_REFERENCE_PATTERN = re.compile(r'\\(\d)')
+
+
+def compile_replacement(replacement: str) -> Callable[[re.Match], str]:
+    """把只含 \\1..\\9 分组引用的替换模板预先拆分，避免每次 match.expand 重新解析模板"""
+    parts = GROUP_REFERENCE_PATTERN.split(replacement)
+    literals, groups = parts[0::2], [int(group) for group in parts[1::2]]
+
+    def expand(match: re.Match) -> str:
+        pieces = [literals[0]]
+        for group, literal in zip(groups, literals[1:]):
+            pieces.append(match.group(group) or '')
+            pieces.append(literal)
+        return ''.join(pieces)
+
+    return expand
+
+
+class FileLexicalMask:
+    """单个文件的词法掩码：一次扫描得到注释/字符串区间（支持跨行嵌套注释和转义引号），
+    之后每个位置属于注释、字符串还是代码都用二分查找回答"""
+
+    TYPE_DEFINITION_PATTERN = re.compile(r'\btype[ \t]+[^\n]*=')
+
+    def __init__(self, text: str):
+        self.length = len(text)
+        self.comment_spans, self.string_spans = scan_comments_and_strings(text)
+        self.comment_starts = [start for start, _ in self.comment_spans]
+        self.string_starts = [start for start, _ in self.string_spans]
+        self.line_offsets = [0]
+        self.line_offsets.extend(match.end() for match in re.finditer('\n', text))
+        # 以代码中的 type 关键字开头的类型定义所在行（从0开始）
+        self.type_def_lines = {
+            self.line_index(match.start())
+            for match in self.TYPE_DEFINITION_PATTERN.finditer(text)
+            if self.in_code(match.start())
+        }
+
+    @staticmethod
+    def _span_at(spans: List[Tuple[int, int]], starts: List[int],
+                 offset: int) -> Optional[Tuple[int, int]]:
+        index = bisect.bisect_right(starts, offset) - 1
+        if index >= 0 and offset < spans[index][1]:
+            return spans[index]
+        return None
+
+    def comment_at(self, offset: int) -> Optional[Tuple[int, int]]:
+        return self._span_at(self.comment_spans, self.comment_starts, offset)
+
+    def string_at(self, offset: int) -> Optional[Tuple[int, int]]:
+        return self._span_at(self.string_spans, self.string_starts, offset)
+
+    def in_code(self, offset: int) -> bool:
+        return self.comment_at(offset) is None and self.string_at(offset) is None
+
+    def line_index(self, offset: int) -> int:
+        return bisect.bisect_right(self.line_offsets, offset) - 1
+
+    def line_end(self, line_index: int) -> int:
+        """该行结束（含换行符）后的偏移"""
+        if line_index + 1 < len(self.line_offsets):
+            return self.line_offsets[line_index + 1]
+        return self.length
+
+
 class SafeTokenConverter:
     """安全Token转换器"""
     
     def __init__(self, root_path: str):
         self.root_path = Path(root_path)
         self.backup_dir = self.root_path / "_safe_conversion_backups"
-        self.backup_dir.mkdir(exist_ok=True)
+        
+        # 内容寻址备份仓库：每次转换运行一个批次清单，只备份实际改写的文件
+        self.backup_store = ConversionBackupStore(self.backup_dir, self.root_path)
+        self.backup_batch = time.strftime("safe_%Y%m%d_%H%M%S")
+        
+        # 增量验证：只构建包含本次修改文件的 dune 目标，结果按批次缓存
+        self.validator = IncrementalValidator(self.root_path, self.backup_dir / "validation_cache.json")
         
         # 设置安全的转换规则
         self.setup_safe_conversion_rules()
@@ -90,96 +174,129 @@ class SafeTokenConverter:
             )
         ]
     
-    def is_safe_to_convert(self, line: str, rule: SafeConversionRule, match) -> bool:
-        """检查转换是否安全"""
+    def is_safe_to_convert(self, text: str, rule: SafeConversionRule, match,
+                           mask: Optional[FileLexicalMask] = None) -> bool:
+        """检查转换是否安全；match 为在 text（单行或整个文件）上的匹配，mask 为 text 的词法掩码"""
+        if mask is None:
+            mask = FileLexicalMask(text)
+        start = match.start()
+        last = match.end() - 1
+        line_index = mask.line_index(start)
+        line_end = mask.line_end(line_index)
+        
         for check in rule.safety_checks:
             if check == "is_in_comment":
-                # 检查是否在注释中
-                comment_start = line.find('(*')
-                comment_end = line.find('*)')
-                match_pos = match.start()
-                if not (comment_start != -1 and comment_end != -1 and 
-                       comment_start < match_pos < comment_end):
+                # 匹配从注释内部（起始定界符之后）开始，并在同一注释中结束
+                span = mask.comment_at(start)
+                if span is None or start == span[0] or last >= span[1]:
                     return False
             
             elif check == "is_in_string":
-                # 检查是否在字符串中
-                quote_positions = [m.start() for m in re.finditer(r'"', line)]
-                match_pos = match.start()
-                in_string = False
-                for i in range(0, len(quote_positions), 2):
-                    if i + 1 < len(quote_positions):
-                        if quote_positions[i] < match_pos < quote_positions[i + 1]:
-                            in_string = True
-                            break
-                if not in_string:
+                # 匹配从字符串内部（起始引号之后）开始，并在同一字符串中结束
+                span = mask.string_at(start)
+                if span is None or start == span[0] or last >= span[1]:
                     return False
             
             elif check == "is_function_call":
-                # 检查是否是函数调用（后面跟着括号）
-                if not re.search(r'\s*\(', line[match.end():]):
+                # 函数调用必须位于代码中，且匹配之后还有括号
+                if not mask.in_code(start) or text.find('(', match.end(), line_end) == -1:
                     return False
             
             elif check == "not_in_type_def":
                 # 检查不在类型定义中
-                if re.search(r'\btype\s+.*=', line.strip()):
+                if line_index in mask.type_def_lines:
                     return False
             
             elif check == "is_module_open":
-                # 检查是否是模块open语句
-                if not line.strip().startswith('open '):
+                # 检查是否是代码中的模块open语句
+                line_text = text[mask.line_offsets[line_index]:line_end]
+                if not mask.in_code(start) or not line_text.strip().startswith('open '):
                     return False
         
         return True
     
-    def convert_file_safely(self, file_path: Path) -> List[Dict]:
-        """安全地转换单个文件"""
+    def convert_file_safely(self, file_path: Path,
+                            diff_writer: Optional[UnifiedDiffWriter] = None) -> List[Dict]:
+        """安全地转换单个文件；给出 diff_writer 时只写出统一diff，不改动文件"""
         results = []
         
         try:
-            # 创建备份
-            backup_path = self.backup_dir / f"{file_path.name}.backup"
-            shutil.copy2(file_path, backup_path)
-            
             # 读取文件
             with open(file_path, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
             
-            # 处理每一行
-            converted_lines = []
-            file_changed = False
+            # 没有任何规则匹配的文件无需词法扫描
+            text = ''.join(lines)
+            if not any(rule.pattern.search(text) for rule in self.conversion_rules):
+                return results
             
-            for line_num, line in enumerate(lines, 1):
-                original_line = line
-                current_line = line
-                
-                # 应用每个安全规则
+            # 整个文件只做一次词法扫描，各规则的安全检查共用同一掩码
+            mask = FileLexicalMask(text)
+            
+            # 规则在整个文件上定位候选行，再在候选行范围内逐行匹配（匹配不跨行）
+            candidate_lines = sorted({
+                mask.line_index(match.start())
+                for rule in self.conversion_rules
+                for match in rule.pattern.finditer(text)
+            })
+            
+            # 收集所有规则中通过安全检查的修改 (起点, 终点, 替换文本, 规则)
+            edits = []
+            for line_index in candidate_lines:
+                line_start = mask.line_offsets[line_index]
+                line_end = mask.line_end(line_index)
                 for rule in self.conversion_rules:
-                    matches = list(rule.pattern.finditer(current_line))
-                    for match in reversed(matches):  # 从后往前替换，避免位置偏移
-                        if self.is_safe_to_convert(current_line, rule, match):
-                            # 安全转换
-                            new_text = rule.pattern.sub(rule.replacement, match.group(0))
-                            current_line = (current_line[:match.start()] + 
-                                          new_text + 
-                                          current_line[match.end():])
-                            file_changed = True
-                            
-                            results.append({
-                                'file': str(file_path.relative_to(self.root_path)),
-                                'line': line_num,
-                                'rule': rule.name,
-                                'original': original_line.strip(),
-                                'converted': current_line.strip(),
-                                'description': rule.description
-                            })
-                
-                converted_lines.append(current_line)
+                    for match in rule.pattern.finditer(text, line_start, line_end):
+                        if self.is_safe_to_convert(text, rule, match, mask):
+                            edits.append((match.start(), match.end(), rule.expand(match), rule))
+            edits.sort(key=lambda edit: edit[0])
+            
+            # 按位置顺序一次性写入输出缓冲区，跳过与已应用修改重叠的修改
+            pieces = []
+            applied = []
+            position = 0
+            for start, end, new_text, rule in edits:
+                if start < position:
+                    continue
+                pieces.append(text[position:start])
+                pieces.append(new_text)
+                position = end
+                applied.append((mask.line_index(start), rule))
+            pieces.append(text[position:])
+            converted_text = ''.join(pieces)
+            
+            # 替换文本不含换行，转换前后行号一一对应
+            parts = converted_text.split('\n')
+            converted_lines = [part + '\n' for part in parts[:-1]]
+            if parts[-1]:
+                converted_lines.append(parts[-1])
+            file_changed = bool(applied)
             
-            # 如果有变更，写入文件
-            if file_changed:
+            rel_path = str(file_path.relative_to(self.root_path))
+            stripped_lines = {}
+            for line_index, rule in applied:
+                if line_index not in stripped_lines:
+                    stripped_lines[line_index] = (lines[line_index].strip(),
+                                                  converted_lines[line_index].strip())
+                original, converted = stripped_lines[line_index]
+                results.append({
+                    'file': rel_path,
+                    'line': line_index + 1,
+                    'rule': rule.name,
+                    'original': original,
+                    'converted': converted,
+                    'description': rule.description
+                })
+            
+            # 预览模式只写出diff；否则先备份原始内容再写入文件
+            if file_changed and diff_writer is not None:
+                diff_writer.write_file_diff(str(file_path.relative_to(self.root_path)),
+                                            lines, converted_lines)
+                print(f"📝 预览: {file_path.relative_to(self.root_path)} ({len(results)} 处修改)")
+            elif file_changed:
+                self.backup_store.backup(self.backup_batch, file_path)
                 with open(file_path, 'w', encoding='utf-8') as f:
-                    f.writelines(converted_lines)
+                    f.write(converted_text)
                 print(f"✅ 安全转换: {file_path.relative_to(self.root_path)} ({len(results)} 处修改)")
             
         except Exception as e:
@@ -191,13 +308,17 @@ class SafeTokenConverter:
         
         return results
     
-    def convert_batch_safely(self, target_dirs: List[str]) -> Dict:
-        """安全地转换指定目录"""
+    def convert_batch_safely(self, target_dirs: List[str],
+                             diff_writer: Optional[UnifiedDiffWriter] = None) -> Dict:
+        """安全地转换指定目录；给出 diff_writer 时为预览模式，逐个文件流式写出diff"""
         print("🛡️ 开始安全Token转换...")
         
         all_results = []
         processed_files = 0
         
+        # 所有安全规则都要求出现 token_ / Token_，符号索引中没有这类标识符的文件直接跳过
+        symbol_index = load_symbol_index(str(self.root_path))
+        
         for target_dir in target_dirs:
             dir_path = self.root_path / target_dir
             if not dir_path.exists():
@@ -210,9 +331,15 @@ class SafeTokenConverter:
                     if self._should_skip_file(file_path):
                         continue
                     
-                    results = self.convert_file_safely(file_path)
-                    all_results.extend(results)
                     processed_files += 1
+                    identifiers = symbol_index.file_identifiers(
+                        str(file_path.relative_to(self.root_path)))
+                    if identifiers is not None and not any(
+                            'token_' in identifier.lower() for identifier in identifiers):
+                        continue
+                    
+                    results = self.convert_file_safely(file_path, diff_writer)
+                    all_results.extend(results)
         
         # 生成摘要
         successful_conversions = len([r for r in all_results if 'error' not in r])
@@ -241,8 +368,13 @@ class SafeTokenConverter:
         ]
         return any(pattern in str(file_path) for pattern in skip_patterns)
     
-    def validate_conversion(self) -> bool:
-        """验证转换结果"""
+    def validate_conversion(self, full: bool = False) -> bool:
+        """验证转换结果；默认只构建包含本次转换修改文件的 dune 目标"""
+        changed_files = [] if full else list(self.backup_store.read_manifest(self.backup_batch))
+        if changed_files:
+            print(f"🔍 增量验证安全转换 ({len(changed_files)} 个修改文件)...")
+            return self.validator.validate(self.backup_batch, changed_files, mode='build', timeout=300)
+        
         print("🔍 验证安全转换结果...")
         
         try:
@@ -267,28 +399,19 @@ class SafeTokenConverter:
             return False
     
     def rollback_conversion(self) -> bool:
-        """回滚转换"""
+        """回滚最近一次安全转换：按其备份清单恢复实际修改过的文件"""
         print("🔄 回滚安全转换...")
         
-        rollback_success = True
-        backup_files = list(self.backup_dir.glob("*.backup"))
+        batches = self.backup_store.batches()
+        if not batches:
+            print("⚠️ 没有可回滚的转换")
+            return False
         
-        for backup_file in backup_files:
-            original_name = backup_file.name.replace('.backup', '')
-            
-            # 查找原始文件
-            for pattern in ['**/*.ml', '**/*.mli']:
-                for file_path in self.root_path.glob(pattern):
-                    if file_path.name == original_name:
-                        try:
-                            shutil.copy2(backup_file, file_path)
-                            print(f"✅ 回滚: {file_path.relative_to(self.root_path)}")
-                        except Exception as e:
-                            print(f"❌ 回滚失败: {file_path.relative_to(self.root_path)} - {e}")
-                            rollback_success = False
-                        break
+        restored, failed = self.backup_store.restore(batches[-1])
+        for rel_path in restored:
+            print(f"✅ 回滚: {rel_path}")
         
-        return rollback_success
+        return not failed
 
 def main():
     parser = argparse.ArgumentParser(description='安全Token转换工具')
@@ -297,9 +420,15 @@ def main():
                       default=['src/tokens', 'src/utils'],
                       help='要转换的目标目录')
     parser.add_argument('--validate', action='store_true', help='验证转换结果')
+    parser.add_argument('--full', action='store_true',
+                      help='验证时执行完整的 dune build（默认只验证本次转换影响的目标）')
     parser.add_argument('--rollback', action='store_true', help='回滚转换')
     parser.add_argument('--report', default='safe_conversion_report.json',
                       help='转换报告输出路径')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='预览模式：不改动文件，输出转换的统一diff')
+    parser.add_argument('--patch', default='-',
+                      help='预览模式的diff输出路径（默认 - 为标准输出），可用 git apply 应用')
     
     args = parser.parse_args()
     
@@ -309,6 +438,14 @@ def main():
         converter.rollback_conversion()
         return
     
+    if args.dry_run:
+        # 预览转换：diff 写到标准输出时，进度信息改写到标准错误
+        log = sys.stderr if args.patch == '-' else sys.stdout
+        with UnifiedDiffWriter(args.patch) as diff_writer, contextlib.redirect_stdout(log):
+            summary = converter.convert_batch_safely(args.targets, diff_writer)
+            print(f"📝 预览完成: {diff_writer.files_written} 个文件将被修改")
+        return
+    
     # 执行安全转换
     summary = converter.convert_batch_safely(args.targets)
     
@@ -319,7 +456,7 @@ def main():
     
     # 验证转换
     if args.validate:
-        converter.validate_conversion()
+        converter.validate_conversion(full=args.full)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
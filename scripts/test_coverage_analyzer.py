@@ -5,19 +5,24 @@
 """
 
 import os
+import sys
 import glob
 import json
+import argparse
 from collections import defaultdict, Counter
 from pathlib import Path
 
+sys.path.append(os.path.join(os.path.dirname(__file__), 'analysis'))
+from jsonl_report_writer import JsonlReportWriter, jsonl_path
+
 class TestCoverageAnalyzer:
     def __init__(self, project_root):
         self.project_root = Path(project_root)
         self.src_dir = self.project_root / "src"
         self.test_dir = self.project_root / "test"
         
-    def analyze_source_files(self):
-        """分析源文件结构"""
+    def analyze_source_files(self, writer=None):
+        """分析源文件结构（传入 writer 时每个文件即时写出一条 source_file 记录）"""
         source_files = {}
         
         for ml_file in self.src_dir.glob("**/*.ml"):
@@ -37,13 +42,15 @@ class TestCoverageAnalyzer:
                     'size': ml_file.stat().st_size,
                     'category': self.categorize_module(rel_path)
                 }
+                if writer is not None:
+                    writer.write('source_file', {'file': str(rel_path), **source_files[str(rel_path)]})
             except Exception as e:
                 print(f"读取文件失败 {ml_file}: {e}")
                 
         return source_files
     
-    def analyze_test_files(self):
-        """分析测试文件结构"""
+    def analyze_test_files(self, writer=None):
+        """分析测试文件结构（传入 writer 时每个文件即时写出一条 test_file 记录）"""
         test_files = {}
         
         for test_file in self.test_dir.glob("**/*.ml"):
@@ -59,9 +66,10 @@ class TestCoverageAnalyzer:
                     'name': test_name,
                     'path': str(test_file),
                     'lines': len(lines),
-                    'content': content,
                     'tested_modules': self.extract_tested_modules(content)
                 }
+                if writer is not None:
+                    writer.write('test_file', {'file': str(rel_path), **test_files[str(rel_path)]})
             except Exception as e:
                 print(f"读取测试文件失败 {test_file}: {e}")
                 
@@ -149,14 +157,17 @@ class TestCoverageAnalyzer:
                     
         return dict(category_stats)
     
-    def generate_coverage_report(self):
+    def generate_coverage_report(self, writer=None):
         """生成覆盖率报告"""
         print("🔍 骆言项目测试覆盖率分析报告 - Fix #732")
         print("=" * 60)
         
-        source_files = self.analyze_source_files()
-        test_files = self.analyze_test_files()
+        source_files = self.analyze_source_files(writer)
+        test_files = self.analyze_test_files(writer)
         coverage_stats = self.calculate_coverage_stats(source_files, test_files)
+        if writer is not None:
+            for category, stats in sorted(coverage_stats.items()):
+                writer.write('category', {'category': category, **stats})
         
         print(f"\n📊 基础统计:")
         print(f"  源文件总数: {len(source_files)}")
@@ -226,15 +237,31 @@ class TestCoverageAnalyzer:
         print(f"  4. 建立端到端集成测试套件")
 
 def main():
+    parser = argparse.ArgumentParser(description='骆言项目测试覆盖率分析工具')
+    parser.add_argument('--output', default="doc/analysis/测试覆盖率分析结果_Fix_732.json",
+                        help='结果输出路径')
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='json',
+                        help='结果格式：json 为整体报告；jsonl 每个文件/分类一行并以汇总记录结尾')
+    args = parser.parse_args()
+
     analyzer = TestCoverageAnalyzer(os.getcwd())
-    results = analyzer.generate_coverage_report()
-    
-    # 保存结果到文件
-    output_file = "doc/analysis/测试覆盖率分析结果_Fix_732.json"
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    output_file = args.output
+
+    if args.format == 'jsonl':
+        # 文件记录在扫描过程中即写出，汇总记录最后追加
+        output_file = jsonl_path(output_file)
+        with JsonlReportWriter(output_file) as writer:
+            results = analyzer.generate_coverage_report(writer)
+            writer.write_summary({key: value for key, value in results.items()
+                                  if key != 'coverage_stats'})
+    else:
+        results = analyzer.generate_coverage_report()
+
+        # 保存结果到文件
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
     
     print(f"\n📄 详细结果已保存至: {output_file}")
 
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+analyze_code_duplication 完全重复区域合并和并行相似度分析的测试
+
+运行: python -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'analysis'))
+import analyze_code_duplication
+from analyze_code_duplication import CodeDuplicationAnalyzer
+
+
+def distinct_line(count: int, operator: str) -> str:
+    """标准化后彼此不同的代码行：以操作数个数区分"""
+    return "let x = " + f" {operator} ".join(["y"] * count)
+
+
+def shared_block() -> list:
+    """30行重复代码；第12、22行为空行，使起始于第12、13行的两个窗口哈希相同"""
+    lines = [distinct_line(i + 1, '+') for i in range(30)]
+    lines[11] = ''
+    lines[21] = ''
+    return lines
+
+
+class ExactDuplicateMergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def write(self, name: str, lines: list) -> str:
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def find_exact(self, files: list) -> list:
+        analyzer = CodeDuplicationAnalyzer(self.temp_dir.name)
+        windows = analyzer.extract_all_windows(files)
+        duplicates = analyzer.find_exact_duplicates(analyzer.repeated_window_blocks(windows))
+        return [[(os.path.basename(block.file_path), block.start_line, block.end_line)
+                 for block in dup.blocks] for dup in duplicates]
+
+    def test_adjacent_windows_with_repeated_hash_merge_into_one_region(self):
+        """相邻窗口哈希相同导致部分窗口被重叠抑制丢弃时，仍合并为一个区域"""
+        file_a = self.write('a.ml', [distinct_line(i + 1, '*') for i in range(7)] + shared_block())
+        file_b = self.write('b.ml', [distinct_line(i + 1, '-') for i in range(3)] + shared_block())
+        self.assertEqual(self.find_exact([file_a, file_b]),
+                         [[('a.ml', 8, 37), ('b.ml', 4, 33)]])
+
+    def test_separate_copies_stay_separate(self):
+        """对齐方式不同的两处重复不会被合并"""
+        block = [distinct_line(i + 1, '+') for i in range(10)]
+        other = [distinct_line(i + 1, '/') for i in range(10)]
+        file_a = self.write('a.ml', block + [distinct_line(40, '*')] * 2 + other)
+        file_b = self.write('b.ml', other + [distinct_line(50, '-')] * 5 + block)
+        self.assertEqual(sorted(self.find_exact([file_a, file_b])),
+                         [[('a.ml', 1, 10), ('b.ml', 16, 25)],
+                          [('a.ml', 13, 22), ('b.ml', 1, 10)]])
+
+
+
+class SimilarWindowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def similar_groups(self, files: list, jobs: int) -> list:
+        analyzer = CodeDuplicationAnalyzer(self.temp_dir.name, jobs=jobs)
+        tables = analyzer.similarity_tables(analyzer.extract_all_windows(files))
+        return [[(os.path.basename(block.file_path), block.start_line) for block in group.blocks]
+                for group in analyzer.find_similar_windows(tables)]
+
+    def test_parallel_verification_matches_serial(self):
+        """进程池分段验证候选的结果与串行完全一致"""
+        files = []
+        for copy in range(4):
+            lines = [distinct_line(i % 7 + 2, '+-*/'[i % 4]) + f" :: {'[]' if i % 2 else 'z'}"
+                     for i in range(24)]
+            lines[copy * 5 + 2] = "let x = (y * z) / (y - z) :: []"
+            path = os.path.join(self.temp_dir.name, f"copy{copy}.ml")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            files.append(path)
+        serial = self.similar_groups(files, jobs=1)
+        self.assertTrue(serial)
+        # 分成多段，使工作进程的段内推测与父进程的实际归组出现差异
+        with mock.patch.object(analyze_code_duplication, 'SIMILARITY_CHUNK_SIZE', 5):
+            self.assertEqual(self.similar_groups(files, jobs=2), serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+dune_validation 的 dune 文件解析、受影响目标和验证缓存的测试
+
+运行: python -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from dune_validation import (
+    DuneProject, IncrementalValidator, build_targets, parse_sexps, parse_stanza, test_targets
+)
+
+REAL_RUN = subprocess.run
+
+
+class ParseStanzaTest(unittest.TestCase):
+
+    def stanza(self, text: str):
+        sexp = parse_sexps(text)[0]
+        return parse_stanza(sexp[0], sexp[1:], 'src')
+
+    def test_standard_modules_minus_excluded(self):
+        stanza = self.stanza('(library (name core) (public_name pkg.core)\n'
+                             ' (modules (:standard \\ old_lexer legacy)) (libraries str unix))')
+        self.assertEqual(stanza.names, ['core'])
+        self.assertEqual(stanza.public_names, ['pkg.core'])
+        self.assertEqual(stanza.libraries, ['str', 'unix'])
+        self.assertEqual(stanza.excluded_modules, {'Old_lexer', 'Legacy'})
+        self.assertIsNone(stanza.modules)
+        self.assertTrue(stanza.contains_module('lexer'))
+        self.assertFalse(stanza.contains_module('old_lexer'))
+
+    def test_explicit_modules_comments_and_strings(self):
+        stanza = self.stanza('; 注释\n(tests (names a_test b_test) #| 块注释 |#\n'
+                             ' (modules a_test b_test helper) (libraries "core" alcotest))')
+        self.assertTrue(stanza.is_test)
+        self.assertEqual(stanza.names, ['a_test', 'b_test'])
+        self.assertEqual(stanza.modules, {'A_test', 'B_test', 'Helper'})
+        self.assertEqual(stanza.libraries, ['core', 'alcotest'])
+        self.assertFalse(stanza.contains_module('other'))
+
+
+class AffectedTargetsTest(unittest.TestCase):
+    """core <- mid（按 public_name 依赖）<- top <- 测试；app 依赖 mid；other 与之无关"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.root = Path(self.temp_dir.name)
+        self.write('src/core/dune', '(library (name core) (public_name pkg.core))\n(include_subdirs unqualified)')
+        self.write('src/core/sub/lexer.ml', 'let x = 1')
+        self.write('src/mid/dune', '(library (name mid) (libraries pkg.core))')
+        self.write('src/top/dune', '(library (name top) (public_name pkg.top) (libraries mid str))')
+        self.write('src/app/dune', '(executable (name main) (libraries mid))')
+        self.write('src/other/dune', '(library (name other))\n(test (name other_test) (libraries other))')
+        self.write('test/dune', '(test (name top_test) (modules top_test) (libraries pkg.top alcotest))')
+        self.project = DuneProject(self.root)
+
+    def write(self, rel_path: str, text: str) -> None:
+        path = self.root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+
+    def labels(self, stanzas) -> list:
+        return sorted(stanza.label for stanza in stanzas)
+
+    def test_transitive_dependents_via_names_and_public_names(self):
+        owners, dependents, tests = self.project.affected(['src/core/sub/lexer.ml'])
+        self.assertEqual(self.labels(owners), ['library core (src/core)'])
+        self.assertEqual(self.labels(dependents), [
+            'executable main (src/app)', 'library mid (src/mid)',
+            'library top (src/top)', 'test top_test (test)'])
+        self.assertEqual(self.labels(tests), ['test top_test (test)'])
+        self.assertEqual(build_targets(owners + dependents), [
+            '@@src/app/check', '@@src/core/check', '@@src/mid/check',
+            '@@src/top/check', '@@test/check'])
+        self.assertEqual(test_targets(tests), ['@@test/runtest'])
+
+    def test_leaf_change_has_no_dependents(self):
+        self.write('src/app/main.ml', 'let () = ()')
+        owners, dependents, tests = self.project.affected(['src/app/main.ml'])
+        self.assertEqual(self.labels(owners), ['executable main (src/app)'])
+        self.assertEqual((dependents, tests), ([], []))
+
+    def test_unowned_file_falls_back_to_full_validation(self):
+        """修改了文件却找不到任何目标时执行完整验证，而不是直接判定通过"""
+        validator = IncrementalValidator(self.root, self.root / 'cache.json')
+        with mock.patch('dune_validation.subprocess.run') as run:
+            run.return_value = subprocess.CompletedProcess([], 1, '', 'error')
+            self.assertFalse(validator.validate('b1', ['scripts/tool.ml'], mode='test'))
+        self.assertEqual(run.call_args_list[-1][0][0][-1], '@runtest')
+
+
+class ValidationCacheTest(unittest.TestCase):
+    """dune 由桩函数代替（工作区中存在 BROKEN 时失败），git 调用照常执行"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.root = Path(self.temp_dir.name)
+        (self.root / 'src').mkdir()
+        (self.root / 'src/dune').write_text('(library (name a))')
+        (self.root / 'src/f.ml').write_text('let x = 1')
+        (self.root / 'src/other.ml').write_text('let y = 1')
+        git = ['git', '-c', 'user.email=t@example.com', '-c', 'user.name=t']
+        for args in (['init', '-q'], ['add', '.'], ['commit', '-qm', 'init']):
+            subprocess.run(git + args, cwd=self.root, check=True, capture_output=True)
+        self.dune_runs = 0
+        self.validator = IncrementalValidator(self.root, self.root / 'validation_cache.json')
+
+    def fake_run(self, command, **kwargs):
+        if command[0] != 'dune':
+            return REAL_RUN(command, **kwargs)
+        self.dune_runs += 1
+        broken = any('BROKEN' in path.read_text() for path in (self.root / 'src').glob('*.ml'))
+        return subprocess.CompletedProcess(command, 1 if broken else 0, '', 'broken' if broken else '')
+
+    def validate(self) -> bool:
+        with mock.patch('dune_validation.subprocess.run', side_effect=self.fake_run):
+            return self.validator.validate('b1', ['src/f.ml'])
+
+    def test_failures_are_not_cached(self):
+        (self.root / 'src/f.ml').write_text('let x = 2')
+        (self.root / 'src/other.ml').write_text('let y = BROKEN')
+        self.assertFalse(self.validate())
+        (self.root / 'src/other.ml').write_text('let y = 2')
+        self.assertTrue(self.validate())
+        self.assertEqual(self.dune_runs, 2)
+
+    def test_pass_is_reused_only_for_the_same_tree(self):
+        (self.root / 'src/f.ml').write_text('let x = 2')
+        self.assertTrue(self.validate())
+        self.assertTrue(self.validate())
+        self.assertEqual(self.dune_runs, 1)
+        # 批次以外的文件变化（包括新增的未跟踪源文件）后不能沿用缓存的通过结果
+        (self.root / 'src/new.ml').write_text('let z = BROKEN')
+        self.assertFalse(self.validate())
+        self.assertEqual(self.dune_runs, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
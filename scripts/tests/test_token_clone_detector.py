@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+token_clone_detector 后缀数组、LCP 和极大重复枚举的测试（与暴力算法对照）
+
+运行: python -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import random
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'analysis'))
+from token_clone_detector import (
+    TokenCloneDetector, TokenStream, build_lcp_array, build_suffix_array
+)
+
+
+def random_stream(rng: random.Random, file_count: int, alphabet: int) -> array:
+    """若干"文件"的随机记号，文件之间以互不相同的负数哨兵分隔（与 TokenStream 一致）"""
+    tokens = array('i')
+    for file_index in range(file_count):
+        # 嵌入重复片段，保证存在较长的重复
+        motif = [rng.randrange(alphabet) for _ in range(rng.randrange(4, 12))]
+        for _ in range(rng.randrange(10, 40)):
+            if rng.random() < 0.15:
+                tokens.extend(motif)
+            else:
+                tokens.append(rng.randrange(alphabet))
+        tokens.append(-(file_index + 1))
+    return tokens
+
+
+def brute_force_clones(tokens: array, min_tokens: int) -> set:
+    """枚举全部不跨哨兵、左右极大的重复序列，按检测器的规则去除同一序列的重叠出现"""
+    n = len(tokens)
+    occurrences = {}
+    for start in range(n):
+        for end in range(start + min_tokens, n + 1):
+            if tokens[end - 1] < 0:
+                break
+            occurrences.setdefault(tuple(tokens[start:end]), []).append(start)
+
+    clones = set()
+    for sequence, positions in occurrences.items():
+        if len(positions) < 2:
+            continue
+        length = len(sequence)
+        # 右极大：出现之后的记号不全相同（哨兵互不相同）
+        following = {tokens[p + length] if tokens[p + length] >= 0 else ('end', p) for p in positions}
+        if len(following) == 1:
+            continue
+        # 左极大：出现之前的记号不全相同（文件开头视为互不相同）
+        preceding = {tokens[p - 1] if p > 0 else ('start', p) for p in positions}
+        if len(preceding) == 1:
+            continue
+        kept = []
+        last_end = -1
+        for position in sorted(positions):
+            if position >= last_end:
+                kept.append(position)
+                last_end = position + length
+        if len(kept) >= 2:
+            clones.add((length, tuple(kept)))
+    return clones
+
+
+class SuffixArrayTest(unittest.TestCase):
+
+    def test_suffix_and_lcp_arrays_match_brute_force(self):
+        rng = random.Random(1375)
+        for _ in range(30):
+            tokens = random_stream(rng, rng.randrange(1, 4), rng.randrange(2, 5))
+            suffix_array = build_suffix_array(tokens)
+            self.assertEqual(suffix_array, sorted(range(len(tokens)), key=lambda p: tokens[p:]))
+
+            lcp = build_lcp_array(tokens, suffix_array)
+            for index in range(1, len(tokens)):
+                a, b = tokens[suffix_array[index - 1]:], tokens[suffix_array[index]:]
+                common = 0
+                while common < min(len(a), len(b)) and a[common] == b[common]:
+                    common += 1
+                self.assertEqual(lcp[index], common)
+
+
+class CloneSearchTest(unittest.TestCase):
+
+    def detector_for(self, tokens: array, min_tokens: int) -> TokenCloneDetector:
+        """直接构造记号流；行号取记号位置，便于与暴力结果按位置比较"""
+        detector = TokenCloneDetector('.', min_tokens=min_tokens)
+        stream = TokenStream()
+        stream.normalized = tokens
+        stream.exact = array('i', tokens)
+        stream.lines = array('I', range(len(tokens)))
+        stream.file_starts = [0] + [p + 1 for p, token in enumerate(tokens) if token < 0][:-1]
+        stream.file_paths = [f"file{i}.ml" for i in range(len(stream.file_starts))]
+        detector.stream = stream
+        return detector
+
+    def test_maximal_repeats_match_brute_force(self):
+        rng = random.Random(2024)
+        for _ in range(30):
+            tokens = random_stream(rng, rng.randrange(1, 4), rng.randrange(2, 4))
+            min_tokens = rng.randrange(3, 7)
+            clones = self.detector_for(tokens, min_tokens).find_clones()
+            found = {(clone.token_count, tuple(occ.start_line for occ in clone.occurrences))
+                     for clone in clones}
+            self.assertEqual(len(found), len(clones))
+            self.assertEqual(found, brute_force_clones(tokens, min_tokens))
+
+    def test_type1_and_type2_classification(self):
+        """规范化记号相同时，原始词素也相同的为 Type-1，否则为 Type-2"""
+        tokens = array('i', [5, 6, 7, 8, 9, -1, 5, 6, 7, 8, 9, -2])
+        detector = self.detector_for(tokens, 5)
+        self.assertEqual([clone.clone_type for clone in detector.find_clones()], ["Type-1"])
+        detector.stream.exact[8] = 42
+        self.assertEqual([clone.clone_type for clone in detector.find_clones()], ["Type-2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+token_reference_table 列式存储的保存/加载往返测试
+
+运行: python -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from token_reference_table import ConversionComplexity, TokenReferenceTable
+
+
+def sample_table() -> TokenReferenceTable:
+    """含中文行文本、共用行文本、全部复杂度和多个信心度的表"""
+    table = TokenReferenceTable()
+    rows = [
+        ('src/lexer.ml', 10, 4, '  | 如果 -> IfKeyword', 'keyword', 'IfKeyword',
+         ConversionComplexity.SIMPLE, 0.9),
+        ('src/lexer.ml', 10, 14, '  | 如果 -> IfKeyword', 'constructor', 'IfKeyword',
+         ConversionComplexity.MEDIUM, 0.7),
+        ('src/parser.ml', 200, 0, 'match tok with | 「标识符」 s -> s', 'pattern', '「标识符」',
+         ConversionComplexity.COMPLEX, 0.3),
+        ('src/parser.ml', 4000000, 65535, '', 'keyword', 'ElseKeyword',
+         ConversionComplexity.SIMPLE, 1.0),
+        ('src/空 格/模块.ml', 1, 1, 'let 值 = "含\\"引号\\"与\\n换行"', 'keyword', 'LetKeyword',
+         ConversionComplexity.MEDIUM, 0.0),
+    ]
+    for row in rows:
+        table.append(*row)
+    return table
+
+
+class SaveLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = Path(self.temp_dir.name) / 'refs.tokrefs'
+
+    def round_trip(self, table: TokenReferenceTable) -> TokenReferenceTable:
+        table.save(self.path)
+        return TokenReferenceTable.load(self.path)
+
+    def test_round_trip_is_identical(self):
+        table = sample_table()
+        loaded = self.round_trip(table)
+
+        self.assertEqual(len(loaded), len(table))
+        for name in TokenReferenceTable.POOLS:
+            self.assertEqual(getattr(loaded, name).values, getattr(table, name).values)
+            self.assertEqual(getattr(loaded, name).ids, getattr(table, name).ids)
+        for name in TokenReferenceTable.COLUMNS:
+            self.assertEqual(getattr(loaded, name), getattr(table, name), name)
+        self.assertEqual(list(loaded.records()), list(table.records()))
+        self.assertEqual(list(loaded), list(table))
+
+    def test_aggregates_survive_round_trip(self):
+        table = sample_table()
+        loaded = self.round_trip(table)
+
+        self.assertEqual(loaded.count_by_complexity(), table.count_by_complexity())
+        self.assertEqual(loaded.count_by_complexity(), {'simple': 2, 'medium': 2, 'complex': 1})
+        self.assertEqual(loaded.count_by_type(), table.count_by_type())
+        self.assertEqual(loaded.count_by_confidence_range(), table.count_by_confidence_range())
+        self.assertEqual(loaded.file_counts_by_complexity(), table.file_counts_by_complexity())
+        self.assertEqual([loaded.confidence(i) for i in range(len(loaded))], [0.9, 0.7, 0.3, 1.0, 0.0])
+        self.assertEqual(loaded.select(file_path='src/parser.ml', min_confidence=0.5), [3])
+
+    def test_loaded_table_accepts_appends(self):
+        """加载后的字符串池仍能驻留：已有字符串复用下标，新字符串追加"""
+        loaded = self.round_trip(sample_table())
+        loaded.append('src/lexer.ml', 11, 0, '新行', 'keyword', 'ThenKeyword',
+                      ConversionComplexity.SIMPLE, 0.8)
+        self.assertEqual(loaded.file_ids[-1], loaded.file_ids[0])
+        self.assertEqual(loaded.row(len(loaded) - 1).context, '新行')
+        self.assertEqual(list(self.round_trip(loaded).records()), list(loaded.records()))
+
+    def test_empty_table_and_bad_magic(self):
+        self.assertEqual(len(self.round_trip(TokenReferenceTable())), 0)
+        self.path.write_bytes(b'{"not": "a table"}\n')
+        with self.assertRaises(ValueError):
+            TokenReferenceTable.load(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+token_symbol_index 扫描规则和增量刷新（编辑、删除、新增文件）的测试
+
+运行: python -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from token_symbol_index import SymbolOccurrence, TokenSymbolIndex, scan_token_symbols
+
+LEXER_SOURCE = """open Token_types
+(* 旧接口 token_of_string 已废弃 *)
+let make t = Token_types.make_token t.token_type
+let s = "token_name"
+"""
+
+PARSER_SOURCE = """let parse () = Lexer.next_token ()
+let show = Token_types.make_token
+"""
+
+
+class ScanTest(unittest.TestCase):
+
+    def test_identifier_kinds(self):
+        self.assertEqual(scan_token_symbols(LEXER_SOURCE), [
+            ('Token_types', 1, 5, 'open'),
+            ('token_of_string', 2, 7, 'comment'),
+            ('Token_types.make_token', 3, 13, 'code'),
+            ('token_type', 3, 38, 'code'),
+            ('token_name', 4, 9, 'string'),
+        ])
+
+
+class RefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.root = Path(self.temp_dir.name) / 'project'
+        self.cache_dir = Path(self.temp_dir.name) / 'cache'
+        self.write('src/lexer.ml', LEXER_SOURCE)
+        self.write('src/parser/parser.ml', PARSER_SOURCE)
+        self.write('src/_build/default/lexer.ml', 'let stale_token = 1')
+        self.write('src/notes.txt', 'token')
+
+    def write(self, rel_path: str, text: str) -> None:
+        path = self.root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+
+    def index(self) -> TokenSymbolIndex:
+        return TokenSymbolIndex(str(self.root), cache_dir=str(self.cache_dir)).refresh()
+
+    def snapshot(self, index: TokenSymbolIndex) -> list:
+        return [(occ.identifier, occ.file_path, occ.line, occ.column, occ.kind)
+                for occ in index.lookup('', prefix=True)]
+
+    def test_initial_scan(self):
+        index = self.index()
+        self.assertEqual((index.rescanned, index.removed), (2, 0))
+        self.assertEqual(sorted(index.files), ['src/lexer.ml', 'src/parser/parser.ml'])
+        self.assertEqual(index.lookup('make_token'), [
+            SymbolOccurrence('Token_types.make_token', 'src/lexer.ml', 3, 13, 'code'),
+            SymbolOccurrence('Token_types.make_token', 'src/parser/parser.ml', 2, 11, 'code'),
+        ])
+        self.assertEqual(index.files_using_module('Token_types'),
+                         ['src/lexer.ml', 'src/parser/parser.ml'])
+        self.assertEqual(index.files_referencing('token_of_string', kinds=('code',)), [])
+        self.assertTrue((self.cache_dir / 'token_symbol_index.pickle').exists())
+
+    def test_unchanged_tree_is_not_rescanned(self):
+        first = self.snapshot(self.index())
+        index = self.index()
+        self.assertEqual((index.rescanned, index.removed), (0, 0))
+        self.assertEqual(self.snapshot(index), first)
+
+    def test_edit_replaces_old_postings(self):
+        self.index()
+        self.write('src/lexer.ml', 'let next = Token_stream.peek_token\n')
+        index = self.index()
+        self.assertEqual((index.rescanned, index.removed), (1, 0))
+        self.assertEqual(index.file_identifiers('src/lexer.ml'), ['Token_stream.peek_token'])
+        self.assertEqual(index.files_referencing('make_token'), ['src/parser/parser.ml'])
+        self.assertEqual(index.lookup('token_of_string'), [])
+        self.assertNotIn('Token_types', index.postings)
+        self.assertEqual([occ.file_path for occ in index.lookup('peek_token')], ['src/lexer.ml'])
+
+    def test_same_size_edit_detected_by_mtime(self):
+        self.index()
+        path = self.root / 'src/parser/parser.ml'
+        stat = path.stat()
+        path.write_text(PARSER_SOURCE.replace('next_token', 'last_token'), encoding='utf-8')
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        index = self.index()
+        self.assertEqual(index.rescanned, 1)
+        self.assertEqual(index.lookup('next_token'), [])
+        self.assertEqual(len(index.lookup('last_token')), 1)
+
+    def test_delete_and_add(self):
+        self.index()
+        (self.root / 'src/lexer.ml').unlink()
+        self.write('src/new_module.ml', 'let x = Token_types.make_token\n')
+        index = self.index()
+        self.assertEqual((index.rescanned, index.removed), (1, 1))
+        self.assertIsNone(index.file_identifiers('src/lexer.ml'))
+        self.assertEqual(index.lookup('token_type'), [])
+        self.assertEqual(index.files_referencing('make_token'),
+                         ['src/new_module.ml', 'src/parser/parser.ml'])
+
+    def test_reloaded_index_matches_fresh_scan(self):
+        """增量更新后写回磁盘的索引，与删除缓存后全量扫描的结果一致"""
+        self.index()
+        self.write('src/lexer.ml', LEXER_SOURCE + 'let extra = token_count\n')
+        (self.root / 'src/parser/parser.ml').unlink()
+        updated = self.snapshot(self.index())
+
+        reloaded = TokenSymbolIndex(str(self.root), cache_dir=str(self.cache_dir))
+        reloaded.load()
+        self.assertEqual(self.snapshot(reloaded), updated)
+
+        (self.cache_dir / 'token_symbol_index.pickle').unlink()
+        fresh = self.index()
+        self.assertEqual(fresh.rescanned, 1)
+        self.assertEqual(self.snapshot(fresh), updated)
+
+
+if __name__ == '__main__':
+    unittest.main()
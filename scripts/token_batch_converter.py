@@ -16,12 +16,61 @@ import re
 import json
 import shutil
 import argparse
+import multiprocessing
 from pathlib import Path
 from typing import Dict, List, Tuple, Set, Optional
 from dataclasses import dataclass, asdict
 from collections import defaultdict, Counter
+import io
+import sys
 import subprocess
 import tempfile
+import contextlib
+
+from conversion_backup_store import ConversionBackupStore
+from conversion_diff import UnifiedDiffWriter
+from dune_validation import IncrementalValidator
+from batch_bisector import BatchBisector, BisectResult
+
+TYPE_DEFINITION_PATTERN = re.compile(r'type\s+.*=')
+
+# 规则条件 -> 判定某行是否满足该条件
+CONDITION_CHECKS = {
+    'not_in_type_definition': lambda line: not TYPE_DEFINITION_PATTERN.search(line.strip()),
+}
+
+# 替换模板中的分组引用：\1 或 \g<1>
+GROUP_REFERENCE_PATTERN = re.compile(r'\\(?:g<(\d+)>|(\d+))')
+
+def atomic_write(file_path: Path, content: str) -> None:
+    """先写入同目录下的临时文件再原子替换，中断时不会留下写了一半的文件"""
+    fd, temp_path = tempfile.mkstemp(dir=str(file_path.parent), prefix=f".{file_path.name}.",
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+# 工作进程内的转换器（由进程池初始化函数设置）
+_worker_converter: Optional['TokenBatchConverter'] = None
+
+def _init_conversion_worker(converter: 'TokenBatchConverter') -> None:
+    global _worker_converter
+    _worker_converter = converter
+
+def convert_file_task(task: Tuple[str, int, bool]) -> Tuple[str, List['ConversionResult'], str]:
+    """进程池任务：转换单个文件，返回其转换结果和（预览模式下的）diff文本"""
+    file_path_str, batch_id, dry_run = task
+    buffer = io.StringIO() if dry_run else None
+    diff_writer = UnifiedDiffWriter(buffer) if dry_run else None
+    results = _worker_converter.convert_file(_worker_converter.root_path / file_path_str,
+                                             batch_id, diff_writer)
+    return file_path_str, results, buffer.getvalue() if dry_run else ""
 
 @dataclass
 class ConversionRule:
@@ -64,14 +113,18 @@ class TokenBatchConverter:
         self.conversion_results: List[ConversionResult] = []
         self.backup_dir = self.root_path / "_conversion_backups"
         
-        # 确保备份目录存在
-        self.backup_dir.mkdir(exist_ok=True)
+        # 内容寻址备份仓库：只备份实际改写的文件，按批次清单回滚
+        self.backup_store = ConversionBackupStore(self.backup_dir, self.root_path)
+        
+        # 增量验证：只构建/测试包含本批次修改文件的 dune 目标，结果按批次缓存
+        self.validator = IncrementalValidator(self.root_path, self.backup_dir / "validation_cache.json")
         
         # 加载分析结果
         self.load_analysis_data()
         
         # 定义转换规则
         self.setup_conversion_rules()
+        self.compile_conversion_rules()
     
     def load_analysis_data(self) -> None:
         """加载分析数据"""
@@ -137,56 +190,79 @@ class TokenBatchConverter:
             )
         ]
     
-    def create_backup(self, file_path: Path) -> Path:
-        """创建文件备份"""
-        backup_path = self.backup_dir / f"{file_path.name}.backup"
-        shutil.copy2(file_path, backup_path)
-        return backup_path
+    def batch_backup_name(self, batch_id: int) -> str:
+        """批次在备份仓库中的清单名"""
+        return f"batch_{batch_id}"
     
-    def restore_from_backup(self, file_path: Path) -> bool:
-        """从备份恢复文件"""
-        backup_path = self.backup_dir / f"{file_path.name}.backup"
-        if backup_path.exists():
-            shutil.copy2(backup_path, file_path)
-            return True
-        return False
+    def create_backup(self, file_path: Path, batch_id: int = 0) -> str:
+        """在改写前把文件原始内容登记到批次清单，返回内容哈希"""
+        return self.backup_store.backup(self.batch_backup_name(batch_id), file_path)
     
-    def apply_conversion_rule(self, line: str, rule: ConversionRule) -> Tuple[str, bool]:
-        """应用转换规则"""
-        try:
+    def compile_conversion_rules(self) -> None:
+        """预处理转换规则：收集规则条件，合并后的正则按条件组合缓存"""
+        self.rule_conditions = sorted({rule.condition for rule in self.conversion_rules
+                                       if rule.condition})
+        self.rule_automata: Dict[Tuple[bool, ...], Tuple[Optional[re.Pattern], Dict]] = {}
+    
+    def build_rule_automaton(self, satisfied: Tuple[bool, ...]) -> Tuple[Optional[re.Pattern], Dict]:
+        """把条件满足的规则合并为一个带命名组的正则，并建立 组名 -> (规则, 替换模板) 的分派表
+        
+        各规则按定义顺序排列在交替分支中：同一位置多条规则都能匹配时取靠前的规则，
+        整行从左到右只扫描一次，所有互不重叠的替换一并完成。
+        """
+        met = {condition for condition, ok in zip(self.rule_conditions, satisfied) if ok}
+        parts = []
+        dispatch = {}
+        group_count = 0
+        for index, rule in enumerate(self.conversion_rules):
+            if rule.condition and rule.condition not in met:
+                continue
             if rule.rule_type == 'regex':
-                # 检查条件
-                if rule.condition == 'not_in_type_definition':
-                    if re.search(r'type\s+.*=', line.strip()):
-                        return line, False
-                
-                # 应用正则替换
-                new_line = re.sub(rule.pattern, rule.replacement, line)
-                return new_line, new_line != line
-            
+                pattern = rule.pattern
+                # 分组编号整体偏移到该规则命名组之后
+                base = group_count + 1
+                template = GROUP_REFERENCE_PATTERN.sub(
+                    lambda m: f'\\g<{base + int(m.group(1) or m.group(2))}>', rule.replacement)
             elif rule.rule_type == 'simple':
-                # 简单字符串替换
-                new_line = line.replace(rule.pattern, rule.replacement)
-                return new_line, new_line != line
-            
-            elif rule.rule_type == 'function':
-                # 函数式转换（暂未实现）
-                return line, False
-            
-        except Exception as e:
-            print(f"⚠️ 转换规则应用失败: {rule.description} - {e}")
-            return line, False
-        
-        return line, False
+                pattern = re.escape(rule.pattern)
+                template = rule.replacement.replace('\\', '\\\\')
+            else:
+                continue  # 函数式转换（暂未实现）
+            name = f'rule{index}'
+            parts.append(f'(?P<{name}>{pattern})')
+            dispatch[name] = (rule, template)
+            group_count += 1 + re.compile(pattern).groups
+        
+        combined = re.compile('|'.join(parts)) if parts else None
+        return combined, dispatch
+    
+    def apply_conversion_rules(self, line: str) -> Tuple[str, List[ConversionRule]]:
+        """单遍应用全部转换规则，返回转换后的行和实际生效的规则（按首次生效顺序）"""
+        satisfied = tuple(CONDITION_CHECKS[condition](line) for condition in self.rule_conditions)
+        automaton = self.rule_automata.get(satisfied)
+        if automaton is None:
+            automaton = self.rule_automata[satisfied] = self.build_rule_automaton(satisfied)
+        combined, dispatch = automaton
+        if combined is None:
+            return line, []
+        
+        rules_applied: List[ConversionRule] = []
+        
+        def replace(match: re.Match) -> str:
+            rule, template = dispatch[match.lastgroup]
+            replacement = match.expand(template)
+            if replacement != match.group(0) and rule not in rules_applied:
+                rules_applied.append(rule)
+            return replacement
+        
+        return combined.sub(replace, line), rules_applied
     
-    def convert_file(self, file_path: Path, batch_id: int = 0) -> List[ConversionResult]:
-        """转换单个文件"""
+    def convert_file(self, file_path: Path, batch_id: int = 0,
+                     diff_writer: Optional[UnifiedDiffWriter] = None) -> List[ConversionResult]:
+        """转换单个文件；给出 diff_writer 时只写出统一diff，不改动文件"""
         results = []
         
         try:
-            # 创建备份
-            backup_path = self.create_backup(file_path)
-            
             # 读取文件内容
             with open(file_path, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
@@ -196,35 +272,34 @@ class TokenBatchConverter:
             file_changed = False
             
             for line_num, line in enumerate(lines, 1):
-                original_line = line
-                current_line = line
-                rules_applied = []
+                # 合并规则单遍扫描整行
+                current_line, rules_applied = self.apply_conversion_rules(line)
+                if rules_applied:
+                    file_changed = True
                 
-                # 应用每个转换规则
-                for rule in self.conversion_rules:
-                    new_line, changed = self.apply_conversion_rule(current_line, rule)
-                    if changed:
-                        rules_applied.append(rule.description)
-                        current_line = new_line
-                        file_changed = True
-                        
-                        # 记录转换结果
-                        result = ConversionResult(
-                            file_path=str(file_path.relative_to(self.root_path)),
-                            line_number=line_num,
-                            original_line=original_line.strip(),
-                            converted_line=current_line.strip(),
-                            rule_applied=rule.description,
-                            success=True
-                        )
-                        results.append(result)
+                # 每条生效的规则记录一条转换结果
+                for rule in rules_applied:
+                    result = ConversionResult(
+                        file_path=str(file_path.relative_to(self.root_path)),
+                        line_number=line_num,
+                        original_line=line.strip(),
+                        converted_line=current_line.strip(),
+                        rule_applied=rule.description,
+                        success=True
+                    )
+                    results.append(result)
                 
                 converted_lines.append(current_line)
             
-            # 如果有变更，写入文件
-            if file_changed:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.writelines(converted_lines)
+            # 预览模式只写出diff；否则先备份原始内容再原子写入文件
+            if file_changed and diff_writer is not None:
+                diff_writer.write_file_diff(str(file_path.relative_to(self.root_path)),
+                                            lines, converted_lines)
+                print(f"📝 预览: {file_path.relative_to(self.root_path)} "
+                      f"({len([r for r in results if r.success])} 处修改)")
+            elif file_changed:
+                self.create_backup(file_path, batch_id)
+                atomic_write(file_path, ''.join(converted_lines))
                 
                 print(f"✅ 已转换: {file_path.relative_to(self.root_path)} "
                       f"({len([r for r in results if r.success])} 处修改)")
@@ -244,8 +319,12 @@ class TokenBatchConverter:
         
         return results
     
-    def convert_batch(self, batch_id: int) -> BatchConversionSummary:
-        """转换指定批次"""
+    def convert_batch(self, batch_id: int, jobs: int = 1,
+                      diff_writer: Optional[UnifiedDiffWriter] = None) -> BatchConversionSummary:
+        """转换指定批次；jobs > 1 时在进程池中并行转换文件
+
+        给出 diff_writer 时为预览模式：按批次文件顺序流式写出统一diff，不改动源码树。
+        """
         if not self.analysis_data:
             print("❌ 无分析数据，无法执行批次转换")
             return None
@@ -271,22 +350,47 @@ class TokenBatchConverter:
         successful_files = 0
         failed_files = 0
         
+        existing_files = []
         for file_path_str in batch_info['files']:
-            file_path = self.root_path / file_path_str
-            
-            if not file_path.exists():
+            if not (self.root_path / file_path_str).exists():
                 print(f"⚠️ 文件不存在: {file_path_str}")
                 continue
-            
-            # 转换文件
-            file_results = self.convert_file(file_path, batch_id)
-            batch_results.extend(file_results)
-            
-            # 统计结果
-            if any(r.success for r in file_results):
-                successful_files += 1
-            elif any(not r.success for r in file_results):
-                failed_files += 1
+            existing_files.append(file_path_str)
+        
+        dry_run = diff_writer is not None
+        tasks = [(file_path_str, batch_id, dry_run) for file_path_str in existing_files]
+        if jobs > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(jobs, initializer=_init_conversion_worker,
+                                        initargs=(self,))
+            # imap 按批次文件顺序返回，汇总结果与串行转换一致
+            file_outcomes = pool.imap(convert_file_task, tasks)
+        else:
+            pool = None
+            file_outcomes = ((file_path_str,
+                              self.convert_file(self.root_path / file_path_str, batch_id, diff_writer),
+                              "")
+                             for file_path_str, batch_id, _ in tasks)
+        
+        try:
+            for _, file_results, diff_text in file_outcomes:
+                if diff_writer is not None:
+                    diff_writer.write_diff(diff_text)
+                batch_results.extend(file_results)
+                
+                # 统计结果
+                if any(r.success for r in file_results):
+                    successful_files += 1
+                elif any(not r.success for r in file_results):
+                    failed_files += 1
+        except BaseException:
+            # 中断时立即结束工作进程；已提交的文件都是完整写入的
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
         
         execution_time = time.time() - start_time
         
@@ -316,8 +420,20 @@ class TokenBatchConverter:
         
         return summary
     
+    def batch_changed_files(self, batch_id: Optional[int]) -> List[str]:
+        """批次实际修改过的文件（相对路径），来自备份清单"""
+        if batch_id is None:
+            return []
+        return list(self.backup_store.read_manifest(self.batch_backup_name(batch_id)))
+    
     def validate_conversion(self, batch_id: Optional[int] = None) -> bool:
-        """验证转换结果"""
+        """验证转换结果；给出批次时只构建包含该批次修改文件的 dune 目标"""
+        changed_files = self.batch_changed_files(batch_id)
+        if changed_files:
+            print(f"🔍 增量验证批次 {batch_id} ({len(changed_files)} 个修改文件)...")
+            return self.validator.validate(self.batch_backup_name(batch_id), changed_files,
+                                           mode='build', timeout=300)
+        
         print("🔍 开始验证转换结果...")
         
         # 运行基本编译检查
@@ -345,8 +461,14 @@ class TokenBatchConverter:
             print(f"❌ 编译检查异常: {e}")
             return False
     
-    def run_tests(self) -> bool:
-        """运行测试验证"""
+    def run_tests(self, batch_id: Optional[int] = None) -> bool:
+        """运行测试验证；给出批次时只运行依赖受影响库的测试"""
+        changed_files = self.batch_changed_files(batch_id)
+        if changed_files:
+            print(f"🧪 增量测试批次 {batch_id} ({len(changed_files)} 个修改文件)...")
+            return self.validator.validate(self.batch_backup_name(batch_id), changed_files,
+                                           mode='test', timeout=600)
+        
         print("🧪 开始运行测试...")
         
         try:
@@ -415,39 +537,31 @@ class TokenBatchConverter:
         return recommendations
     
     def rollback_batch(self, batch_id: int) -> bool:
-        """回滚批次转换"""
+        """回滚批次转换：按备份清单恢复该批次实际修改过的文件"""
         print(f"🔄 开始回滚批次 {batch_id}...")
         
-        if not self.analysis_data:
-            print("❌ 无分析数据，无法执行回滚")
+        batch = self.batch_backup_name(batch_id)
+        if not self.backup_store.manifest_path(batch).exists():
+            print(f"❌ 未找到批次 {batch_id} 的备份清单")
             return False
         
-        # 找到批次文件
-        batch_info = None
-        for batch in self.analysis_data['conversion_batches']:
-            if batch['batch_id'] == batch_id:
-                batch_info = batch
-                break
-        
-        if not batch_info:
-            print(f"❌ 未找到批次 {batch_id}")
-            return False
-        
-        rollback_success = True
-        
-        for file_path_str in batch_info['files']:
-            file_path = self.root_path / file_path_str
-            
-            if not self.restore_from_backup(file_path):
-                print(f"⚠️ 无法回滚文件: {file_path_str}")
-                rollback_success = False
+        restored, failed = self.backup_store.restore(batch)
+        rollback_success = not failed
         
         if rollback_success:
-            print(f"✅ 批次 {batch_id} 回滚成功")
+            print(f"✅ 批次 {batch_id} 回滚成功（恢复 {len(restored)} 个文件）")
         else:
             print(f"⚠️ 批次 {batch_id} 回滚部分失败")
         
         return rollback_success
+    
+    def bisect_batch(self, batch_id: int, jobs: int = 1, mode: str = 'build',
+                     full: bool = False) -> BisectResult:
+        """验证失败时二分批次：保留能通过验证的文件转换，只回退最小失败文件"""
+        bisector = BatchBisector(self.root_path, self.backup_store,
+                                 self.backup_dir / "validation_cache.json", jobs=jobs, mode=mode,
+                                 timeout=300 if mode == 'build' else 600, full=full)
+        return bisector.bisect(self.batch_backup_name(batch_id))
 
 def main():
     parser = argparse.ArgumentParser(description='Token系统批量转换工具')
@@ -460,20 +574,44 @@ def main():
     parser.add_argument('--report', default='conversion_report.json', 
                       help='转换报告输出路径')
     parser.add_argument('--rollback', type=int, help='回滚指定批次')
+    parser.add_argument('--full', action='store_true',
+                      help='验证和测试时执行完整的 dune build/test（默认只验证批次影响的目标）')
+    parser.add_argument('--jobs', type=int, default=1,
+                      help='并行转换文件的进程数（默认1，即串行）')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='预览模式：不改动文件，输出批次转换的统一diff')
+    parser.add_argument('--patch', default='-',
+                      help='预览模式的diff输出路径（默认 - 为标准输出），可用 git apply 应用')
+    parser.add_argument('--bisect', action='store_true',
+                      help='批次验证失败时二分定位失败文件，保留其余文件的转换（--jobs 个工作树并行验证）')
     
     args = parser.parse_args()
     
+    # diff 写到标准输出时，进度信息改写到标准错误
+    log = sys.stderr if args.dry_run and args.patch == '-' else sys.stdout
+    
     # 创建转换器
-    converter = TokenBatchConverter(args.root, args.analysis_file)
+    with contextlib.redirect_stdout(log):
+        converter = TokenBatchConverter(args.root, args.analysis_file)
     
     if args.rollback:
         # 回滚指定批次
         converter.rollback_batch(args.rollback)
         return
     
+    if args.batch and args.dry_run:
+        # 预览指定批次
+        with UnifiedDiffWriter(args.patch) as diff_writer, contextlib.redirect_stdout(log):
+            summary = converter.convert_batch(args.batch, jobs=args.jobs,
+                                              diff_writer=diff_writer)
+            if summary:
+                print(f"📝 预览完成: {diff_writer.files_written} 个文件将被修改，"
+                      f"共 {summary.successful_conversions} 处转换")
+        return
+    
     if args.batch:
         # 转换指定批次
-        summary = converter.convert_batch(args.batch)
+        summary = converter.convert_batch(args.batch, jobs=args.jobs)
         if summary:
             print(f"\n📊 批次转换摘要:")
             print(f"   批次: {summary.batch_name}")
@@ -483,14 +621,18 @@ def main():
     
     if args.validate:
         # 验证转换结果
-        validation_success = converter.validate_conversion()
-        if not validation_success:
+        validation_success = converter.validate_conversion(None if args.full else args.batch)
+        if not validation_success and args.bisect and args.batch:
+            converter.bisect_batch(args.batch, jobs=args.jobs, mode='build', full=args.full)
+        elif not validation_success:
             print("⚠️ 验证失败，建议检查转换结果")
     
     if args.test:
         # 运行测试
-        test_success = converter.run_tests()
-        if not test_success:
+        test_success = converter.run_tests(None if args.full else args.batch)
+        if not test_success and args.bisect and args.batch:
+            converter.bisect_batch(args.batch, jobs=args.jobs, mode='test', full=args.full)
+        elif not test_success:
             print("⚠️ 测试失败，建议检查转换结果")
     
     # 生成转换报告
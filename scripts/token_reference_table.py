@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Token引用的列式存储
+
+审计结果原先是每条引用一个 TokenReference 数据类实例（各自持有整行文本），
+输出JSON时再用 asdict 生成一份字典列表。本模块改为按列存放在 array 中:
+
+    文件路径、行文本、引用类型、匹配文本   驻留为字符串池中的下标
+    行号、列号                              array('I')
+    复杂度                                  array('B')（枚举编码）
+    信心度                                  array('f')（float32）
+
+同一行上的多条引用共用一份行文本。分组统计直接在编码列上计数，
+不需要为每条引用构造对象；需要逐条访问时按行号临时生成 TokenReference。
+
+磁盘格式（.tokrefs）：一行魔数，一行JSON头（字符串池和行数），随后依次为各列的原始字节。
+
+Author: Alpha, 主要工作专员
+"""
+
+import sys
+import json
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+TABLE_MAGIC = b"TOKREFS1\n"
+
+
+class ConversionComplexity(Enum):
+    """转换复杂度级别"""
+    SIMPLE = "simple"      # 直接映射
+    MEDIUM = "medium"      # 需要逻辑调整
+    COMPLEX = "complex"    # 需要架构重构
+
+
+COMPLEXITY_LEVELS = list(ConversionComplexity)
+COMPLEXITY_CODES = {level: code for code, level in enumerate(COMPLEXITY_LEVELS)}
+
+
+@dataclass
+class TokenReference:
+    """Token引用信息（列式表中一行的视图）"""
+    file_path: str
+    line_number: int
+    column: int
+    context: str
+    token_type: str
+    reference_pattern: str
+    complexity: ConversionComplexity
+    conversion_confidence: float
+
+    def to_record(self) -> Dict[str, Any]:
+        """转换为JSON记录"""
+        return {
+            'file_path': self.file_path,
+            'line_number': self.line_number,
+            'column': self.column,
+            'context': self.context,
+            'token_type': self.token_type,
+            'reference_pattern': self.reference_pattern,
+            'complexity': self.complexity.value,
+            'conversion_confidence': self.conversion_confidence
+        }
+
+
+class StringPool:
+    """字符串驻留池：相同字符串只存一份，按下标引用"""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value: str) -> int:
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class TokenReferenceTable:
+    """列式、基于 array 的Token引用表"""
+
+    COLUMNS = ('file_ids', 'line_numbers', 'columns', 'context_ids', 'type_ids',
+               'pattern_ids', 'complexities', 'confidences')
+    TYPECODES = ('I', 'I', 'I', 'I', 'B', 'I', 'B', 'f')
+    POOLS = ('files', 'contexts', 'types', 'patterns')
+
+    def __init__(self):
+        self.files = StringPool()
+        self.contexts = StringPool()
+        self.types = StringPool()
+        self.patterns = StringPool()
+        for name, typecode in zip(self.COLUMNS, self.TYPECODES):
+            setattr(self, name, array(typecode))
+
+    def __len__(self) -> int:
+        return len(self.line_numbers)
+
+    def append(self, file_path: str, line_number: int, column: int, context: str,
+               token_type: str, reference_pattern: str, complexity: ConversionComplexity,
+               conversion_confidence: float) -> None:
+        self.file_ids.append(self.files.intern(file_path))
+        self.line_numbers.append(line_number)
+        self.columns.append(column)
+        self.context_ids.append(self.contexts.intern(context))
+        self.type_ids.append(self.types.intern(token_type))
+        self.pattern_ids.append(self.patterns.intern(reference_pattern))
+        self.complexities.append(COMPLEXITY_CODES[complexity])
+        self.confidences.append(conversion_confidence)
+
+    def confidence(self, index: int) -> float:
+        """float32 存储的信心度还原为两位小数（信心度按 0.1 步进计算）"""
+        return round(self.confidences[index], 2)
+
+    def row(self, index: int) -> TokenReference:
+        return TokenReference(
+            file_path=self.files.values[self.file_ids[index]],
+            line_number=self.line_numbers[index],
+            column=self.columns[index],
+            context=self.contexts.values[self.context_ids[index]],
+            token_type=self.types.values[self.type_ids[index]],
+            reference_pattern=self.patterns.values[self.pattern_ids[index]],
+            complexity=COMPLEXITY_LEVELS[self.complexities[index]],
+            conversion_confidence=self.confidence(index)
+        )
+
+    def __iter__(self) -> Iterator[TokenReference]:
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """按顺序生成 [start, stop) 范围内各行的JSON记录"""
+        for index in range(start, len(self) if stop is None else stop):
+            yield self.row(index).to_record()
+
+    def select(self, complexity: Optional[ConversionComplexity] = None,
+               file_path: Optional[str] = None, token_type: Optional[str] = None,
+               min_confidence: Optional[float] = None) -> List[int]:
+        """按条件筛选，返回满足所有条件的行号"""
+        indices: Iterable[int] = range(len(self))
+        if complexity is not None:
+            code = COMPLEXITY_CODES[complexity]
+            indices = [i for i, value in enumerate(self.complexities) if value == code]
+        if file_path is not None:
+            file_id = self.files.ids.get(file_path)
+            indices = [i for i in indices if self.file_ids[i] == file_id]
+        if token_type is not None:
+            type_id = self.types.ids.get(token_type)
+            indices = [i for i in indices if self.type_ids[i] == type_id]
+        if min_confidence is not None:
+            indices = [i for i in indices if self.confidence(i) >= min_confidence]
+        return list(indices)
+
+    def count_by_complexity(self) -> Dict[str, int]:
+        counts = Counter(self.complexities)
+        return {level.value: counts[code] for code, level in enumerate(COMPLEXITY_LEVELS)
+                if counts[code]}
+
+    def count_by_type(self) -> Dict[str, int]:
+        counts = Counter(self.type_ids)
+        return {self.types.values[type_id]: count for type_id, count in counts.items()}
+
+    def count_by_confidence_range(self) -> Dict[str, int]:
+        """按信心度所在的10%区间计数"""
+        counts = Counter(int(round(value, 2) * 10) for value in self.confidences)
+        return {f"{bucket * 10}%": count for bucket, count in counts.items()}
+
+    def file_counts_by_complexity(self) -> Dict[ConversionComplexity, Dict[str, int]]:
+        """按 (复杂度, 文件) 分组计数，文件按首次出现顺序排列"""
+        grouped: Dict[ConversionComplexity, Dict[str, int]] = {level: {} for level in COMPLEXITY_LEVELS}
+        for (code, file_id), count in Counter(zip(self.complexities, self.file_ids)).items():
+            grouped[COMPLEXITY_LEVELS[code]][self.files.values[file_id]] = count
+        return grouped
+
+    def save(self, path: Union[str, Path]) -> None:
+        header = {name: getattr(self, name).values for name in self.POOLS}
+        header['rows'] = len(self)
+        with open(path, 'wb') as f:
+            f.write(TABLE_MAGIC)
+            f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+            for name in self.COLUMNS:
+                column = getattr(self, name)
+                if sys.byteorder == 'big':
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                f.write(column.tobytes())
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'TokenReferenceTable':
+        table = cls()
+        with open(path, 'rb') as f:
+            if f.readline() != TABLE_MAGIC:
+                raise ValueError(f"不是Token引用表文件: {path}")
+            header = json.loads(f.readline())
+            for name in cls.POOLS:
+                setattr(table, name, StringPool(header[name]))
+            for name, typecode in zip(cls.COLUMNS, cls.TYPECODES):
+                column = array(typecode)
+                column.fromfile(f, header['rows'])
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                setattr(table, name, column)
+        return table
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Token标识符的持久化交叉引用索引
+
+扫描 src/ 下的 .ml/.mli 文件，记录每个包含 token（不区分大小写）的标识符出现的
+文件、行、列和上下文类型（代码 / open 语句 / 注释 / 字符串），保存为倒排索引:
+
+    标识符 -> {文件: [(行, 列, 上下文), ...]}
+
+标识符为模块路径加最多一个值名，如 Token_mapping.Token_definitions_unified.IntToken、
+Token_types.make_token、token_to_string；记录字段访问 t.token_type 只记 token_type。
+
+索引以 mtime+size 判断文件是否变化，再次运行时只重新扫描变化的文件并更新其倒排项。
+转换工具用它回答"Token_X.y / token_foo 在哪里被使用"，不再每次遍历整个源码树:
+
+    python scripts/token_symbol_index.py Token_types.make_token
+    python scripts/token_symbol_index.py --prefix Token_mapping. --files
+    python scripts/token_symbol_index.py --stats
+
+Author: Alpha, 主要工作专员
+"""
+
+import os
+import re
+import sys
+import bisect
+import pickle
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'analysis'))
+from ocaml_source_index import DEFAULT_CACHE_DIR, scan_comments_and_strings
+
+# 索引格式版本，扫描规则变化时递增以使旧索引失效
+SYMBOL_INDEX_VERSION = 1
+SYMBOL_INDEX_FILE_NAME = "token_symbol_index.pickle"
+
+SKIP_DIRS = {'_build', '.git'}
+SOURCE_SUFFIXES = ('.ml', '.mli')
+
+TOKEN_HIT_PATTERN = re.compile(r'token', re.IGNORECASE)
+IDENT_PATH_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_']*(?:\.[A-Za-z_][A-Za-z0-9_']*)*")
+# 标识符紧跟在 open / let open 之后
+OPEN_PREFIX_PATTERN = re.compile(r'\bopen!?[ \t]+$')
+IDENT_PATH_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_'.")
+
+CONTEXT_KINDS = ('code', 'open', 'comment', 'string')
+
+
+@dataclass
+class SymbolOccurrence:
+    """标识符的一次出现（行号从1开始，列为行内字符偏移）"""
+    identifier: str
+    file_path: str
+    line: int
+    column: int
+    kind: str
+
+
+def split_identifier_path(path: str, start: int) -> Iterator[Tuple[str, int]]:
+    """把点分路径拆为 (标识符, 起始偏移)：模块路径连同其后第一个值名为一个标识符，
+    值名之后的部分是记录字段访问，各字段单独成为标识符"""
+    group: List[str] = []
+    group_start = start
+    offset = start
+    for component in path.split('.'):
+        if not group:
+            group_start = offset
+        group.append(component)
+        offset += len(component) + 1
+        if not component[0].isupper():
+            yield '.'.join(group), group_start
+            group = []
+    if group:
+        yield '.'.join(group), group_start
+
+
+def scan_token_symbols(text: str) -> List[Tuple[str, int, int, str]]:
+    """扫描源码中包含 token 的标识符，返回 (标识符, 行, 列, 上下文) 列表"""
+    comments, strings = scan_comments_and_strings(text)
+    comment_starts = [start for start, _ in comments]
+    string_starts = [start for start, _ in strings]
+    line_offsets = [0]
+    line_offsets.extend(match.end() for match in re.finditer('\n', text))
+
+    def in_spans(spans: List[Tuple[int, int]], starts: List[int], offset: int) -> bool:
+        index = bisect.bisect_right(starts, offset) - 1
+        return index >= 0 and offset < spans[index][1]
+
+    occurrences = []
+    consumed = 0
+    for hit in TOKEN_HIT_PATTERN.finditer(text):
+        if hit.start() < consumed:
+            continue
+        # 从命中位置向左找到所在点分路径的起点
+        start = hit.start()
+        while start > 0 and text[start - 1] in IDENT_PATH_CHARS:
+            start -= 1
+        path = IDENT_PATH_PATTERN.search(text, start, hit.end())
+        match = IDENT_PATH_PATTERN.match(text, path.start()) if path else None
+        if match is None or match.end() < hit.end():
+            consumed = hit.end()
+            continue
+        consumed = match.end()
+
+        for identifier, offset in split_identifier_path(match.group(0), match.start()):
+            if 'token' not in identifier.lower():
+                continue
+            line_index = bisect.bisect_right(line_offsets, offset) - 1
+            line_start = line_offsets[line_index]
+            if in_spans(comments, comment_starts, offset):
+                kind = 'comment'
+            elif in_spans(strings, string_starts, offset):
+                kind = 'string'
+            elif OPEN_PREFIX_PATTERN.search(text, line_start, offset):
+                kind = 'open'
+            else:
+                kind = 'code'
+            occurrences.append((identifier, line_index + 1, offset - line_start, kind))
+    return occurrences
+
+
+class TokenSymbolIndex:
+    """持久化的Token标识符倒排索引"""
+
+    def __init__(self, root_path: str, src_dirs: Tuple[str, ...] = ('src',),
+                 cache_dir: Optional[str] = None):
+        self.root_path = Path(root_path).resolve()
+        self.src_dirs = src_dirs
+        self.cache_dir = Path(cache_dir) if cache_dir else self.root_path / DEFAULT_CACHE_DIR
+        self.cache_file = self.cache_dir / SYMBOL_INDEX_FILE_NAME
+        # 相对路径 -> (mtime_ns, size, 文件中出现的标识符)；更新文件时据此删除旧倒排项
+        self.files: Dict[str, Tuple[int, int, List[str]]] = {}
+        self.postings: Dict[str, Dict[str, List[Tuple[int, int, str]]]] = {}
+        self.rescanned = 0
+        self.removed = 0
+        self._sorted_identifiers: Optional[List[str]] = None
+
+    def load(self) -> None:
+        """读取磁盘上的索引，格式版本或根目录不匹配时丢弃"""
+        try:
+            with open(self.cache_file, 'rb') as f:
+                stored = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return
+        if (stored.get('version') == SYMBOL_INDEX_VERSION
+                and stored.get('root') == str(self.root_path)
+                and stored.get('src_dirs') == self.src_dirs):
+            self.files = stored['files']
+            self.postings = stored['postings']
+
+    def save(self) -> None:
+        """原子地写回索引"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({
+                'version': SYMBOL_INDEX_VERSION,
+                'root': str(self.root_path),
+                'src_dirs': self.src_dirs,
+                'files': self.files,
+                'postings': self.postings
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.cache_file)
+
+    def refresh(self) -> 'TokenSymbolIndex':
+        """遍历源码目录，只重新扫描 mtime 或 size 变化的文件并更新其倒排项"""
+        self.load()
+        self.rescanned = 0
+        seen: Set[str] = set()
+
+        for rel_path, stat in self._walk():
+            seen.add(rel_path)
+            indexed = self.files.get(rel_path)
+            if indexed and indexed[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                data = (self.root_path / rel_path).read_bytes()
+            except OSError as e:
+                print(f"无法读取文件 {rel_path}: {e}")
+                continue
+            try:
+                text = data.decode('utf-8')
+            except UnicodeDecodeError:
+                text = data.decode('latin-1')
+            self._remove_file(rel_path)
+            self._add_file(rel_path, stat, scan_token_symbols(text))
+            self.rescanned += 1
+
+        removed = [rel_path for rel_path in self.files if rel_path not in seen]
+        for rel_path in removed:
+            self._remove_file(rel_path)
+        self.removed = len(removed)
+
+        if self.rescanned or self.removed:
+            self._sorted_identifiers = None
+            try:
+                self.save()
+            except OSError as e:
+                print(f"无法写入符号索引 {self.cache_file}: {e}")
+        return self
+
+    def _walk(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """按稳定顺序遍历源码文件，返回相对项目根目录的路径"""
+        for src_dir in self.src_dirs:
+            for root, dirs, files in os.walk(self.root_path / src_dir):
+                dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+                for name in sorted(files):
+                    if name.endswith(SOURCE_SUFFIXES):
+                        path = os.path.join(root, name)
+                        try:
+                            yield Path(os.path.relpath(path, self.root_path)).as_posix(), os.stat(path)
+                        except OSError:
+                            continue
+
+    def _remove_file(self, rel_path: str) -> None:
+        indexed = self.files.pop(rel_path, None)
+        if indexed is None:
+            return
+        for identifier in indexed[2]:
+            files = self.postings.get(identifier)
+            if files is not None:
+                files.pop(rel_path, None)
+                if not files:
+                    del self.postings[identifier]
+
+    def _add_file(self, rel_path: str, stat: os.stat_result,
+                  occurrences: List[Tuple[str, int, int, str]]) -> None:
+        identifiers: Dict[str, None] = {}
+        for identifier, line, column, kind in occurrences:
+            self.postings.setdefault(identifier, {}).setdefault(rel_path, []).append((line, column, kind))
+            identifiers[identifier] = None
+        self.files[rel_path] = (stat.st_mtime_ns, stat.st_size, list(identifiers))
+
+    @property
+    def identifiers(self) -> List[str]:
+        """按字典序排列的全部标识符"""
+        if self._sorted_identifiers is None:
+            self._sorted_identifiers = sorted(self.postings)
+        return self._sorted_identifiers
+
+    def _occurrences(self, identifiers: List[str],
+                     kinds: Optional[Tuple[str, ...]] = None) -> List[SymbolOccurrence]:
+        occurrences = []
+        for identifier in identifiers:
+            for rel_path, positions in self.postings[identifier].items():
+                for line, column, kind in positions:
+                    if kinds is None or kind in kinds:
+                        occurrences.append(SymbolOccurrence(identifier, rel_path, line, column, kind))
+        occurrences.sort(key=lambda occurrence: (occurrence.file_path, occurrence.line, occurrence.column))
+        return occurrences
+
+    def matching_identifiers(self, name: str, prefix: bool = False) -> List[str]:
+        """查找标识符：prefix 为 True 时按前缀匹配；否则匹配完整标识符，
+        或以 .name 结尾的限定标识符（查 make_token 也能找到 Token_types.make_token）"""
+        if prefix:
+            identifiers = self.identifiers
+            start = bisect.bisect_left(identifiers, name)
+            end = start
+            while end < len(identifiers) and identifiers[end].startswith(name):
+                end += 1
+            return identifiers[start:end]
+        suffix = '.' + name
+        return [identifier for identifier in self.identifiers
+                if identifier == name or identifier.endswith(suffix)]
+
+    def lookup(self, name: str, prefix: bool = False,
+               kinds: Optional[Tuple[str, ...]] = None) -> List[SymbolOccurrence]:
+        """标识符的全部出现位置，按文件、行、列排序；kinds 限定上下文类型"""
+        return self._occurrences(self.matching_identifiers(name, prefix), kinds)
+
+    def files_referencing(self, name: str, prefix: bool = False,
+                          kinds: Optional[Tuple[str, ...]] = None) -> List[str]:
+        """引用给定标识符的文件（相对项目根目录），按路径排序"""
+        files: Set[str] = set()
+        for identifier in self.matching_identifiers(name, prefix):
+            for rel_path, positions in self.postings[identifier].items():
+                if kinds is None or any(kind in kinds for _, _, kind in positions):
+                    files.add(rel_path)
+        return sorted(files)
+
+    def files_using_module(self, module_name: str) -> List[str]:
+        """引用模块的文件：open/include 该模块或通过 Module.xxx 访问其成员"""
+        files = set(self.files_referencing(module_name))
+        files.update(self.files_referencing(module_name + '.', prefix=True))
+        return sorted(files)
+
+    def file_identifiers(self, rel_path: str) -> Optional[List[str]]:
+        """文件中出现的 token 标识符；文件不在索引范围内时返回 None"""
+        indexed = self.files.get(Path(rel_path).as_posix())
+        return None if indexed is None else indexed[2]
+
+
+_loaded_indexes: Dict[Tuple[str, Tuple[str, ...]], TokenSymbolIndex] = {}
+
+
+def load_symbol_index(root_path: str, src_dirs: Tuple[str, ...] = ('src',)) -> TokenSymbolIndex:
+    """获取（并在本进程内复用）项目的符号索引，加载时增量更新"""
+    key = (str(Path(root_path).resolve()), src_dirs)
+    index = _loaded_indexes.get(key)
+    if index is None:
+        index = TokenSymbolIndex(root_path, src_dirs).refresh()
+        _loaded_indexes[key] = index
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查询Token标识符的交叉引用索引')
+    parser.add_argument('names', nargs='*', help='要查询的标识符（如 Token_types.make_token、token_to_string）')
+    parser.add_argument('--root', default='.', help='项目根目录路径')
+    parser.add_argument('--prefix', action='store_true', help='按前缀匹配标识符（如 Token_mapping.）')
+    parser.add_argument('--kind', action='append', choices=CONTEXT_KINDS,
+                        help='只显示指定上下文中的出现（可重复）')
+    parser.add_argument('--files', action='store_true', help='只列出引用这些标识符的文件')
+    parser.add_argument('--stats', action='store_true', help='显示索引统计信息')
+    args = parser.parse_args()
+
+    index = TokenSymbolIndex(args.root).refresh()
+    kinds = tuple(args.kind) if args.kind else None
+
+    if args.stats or not args.names:
+        occurrences = sum(len(positions) for files in index.postings.values()
+                          for positions in files.values())
+        print(f"索引文件: {index.cache_file}")
+        print(f"源文件数: {len(index.files)}，重新扫描: {index.rescanned}，移除: {index.removed}")
+        print(f"标识符: {len(index.postings)}，出现次数: {occurrences}")
+
+    for name in args.names:
+        if args.files:
+            for rel_path in index.files_referencing(name, args.prefix, kinds):
+                print(rel_path)
+            continue
+        for occurrence in index.lookup(name, args.prefix, kinds):
+            print(f"{occurrence.file_path}:{occurrence.line}:{occurrence.column}: "
+                  f"{occurrence.identifier} [{occurrence.kind}]")
+
+
+if __name__ == '__main__':
+    main()